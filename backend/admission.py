@@ -0,0 +1,299 @@
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Sequence, Tuple
+import asyncio
+import logging
+import os
+import threading
+import time
+
+import instrumentation
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """The request cannot be queued, or waited in the queue for too long."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass(eq=False)
+class Ticket:
+    session_id: str
+    user_id: Optional[str]
+    enqueued: float = field(default_factory=time.monotonic)
+    admitted: bool = False
+    released: bool = False
+    loop: Optional[asyncio.AbstractEventLoop] = None
+    wakeup: Optional[asyncio.Event] = None
+
+
+class AdmissionController:
+    """Caps the chat requests running at once, globally and per session and user.
+
+    Requests over a cap wait in a bounded queue and are admitted in arrival order,
+    skipping past waiters whose own session or user is still at its limit so one busy
+    client does not hold up everyone behind it. A full queue rejects new requests.
+    State is guarded by a thread lock and waiters are woken on their own event loop,
+    so one controller can serve several loops (e.g. test clients).
+    """
+
+    def __init__(self, max_active: int = 32, max_per_session: int = 1, max_per_user: int = 4,
+                 max_queue: int = 128, queue_timeout: float = 120.0):
+        self.max_active = max_active
+        self.max_per_session = max_per_session
+        self.max_per_user = max_per_user
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._queue: Deque[Ticket] = deque()
+        self._active = 0
+        self._per_session: Dict[str, int] = {}
+        self._per_user: Dict[str, int] = {}
+        self.metrics = {"admitted": 0, "queued": 0, "rejected": 0, "timed_out": 0}
+
+    def _eligible(self, ticket: Ticket) -> bool:
+        if self.max_active and self._active >= self.max_active:
+            return False
+        if self.max_per_session and self._per_session.get(ticket.session_id, 0) >= self.max_per_session:
+            return False
+        if ticket.user_id and self.max_per_user and self._per_user.get(ticket.user_id, 0) >= self.max_per_user:
+            return False
+        return True
+
+    def _admit(self, ticket: Ticket) -> None:
+        ticket.admitted = True
+        self._active += 1
+        self._per_session[ticket.session_id] = self._per_session.get(ticket.session_id, 0) + 1
+        if ticket.user_id:
+            self._per_user[ticket.user_id] = self._per_user.get(ticket.user_id, 0) + 1
+        self.metrics["admitted"] += 1
+        instrumentation.METRICS.observe("admission_wait_seconds", time.monotonic() - ticket.enqueued)
+
+    def _drain(self) -> None:
+        # Caller holds the lock. Admits waiters in order and wakes every waiter, since positions shift.
+        waiters = list(self._queue)
+        for ticket in waiters:
+            if self.max_active and self._active >= self.max_active:
+                break
+            if self._eligible(ticket):
+                self._queue.remove(ticket)
+                self._admit(ticket)
+        for ticket in waiters:
+            self._wake(ticket)
+
+    @staticmethod
+    def _wake(ticket: Ticket) -> None:
+        if ticket.loop is not None and ticket.wakeup is not None and not ticket.loop.is_closed():
+            ticket.loop.call_soon_threadsafe(ticket.wakeup.set)
+
+    def enqueue(self, session_id: str, user_id: Optional[str] = None) -> Ticket:
+        """Admit right away if there is capacity, else queue; raises AdmissionRejected if the queue is full."""
+        ticket = Ticket(session_id=session_id, user_id=user_id)
+        with self._lock:
+            if not self._queue and self._eligible(ticket):
+                self._admit(ticket)
+                return ticket
+            if self.max_queue and len(self._queue) >= self.max_queue:
+                self.metrics["rejected"] += 1
+                instrumentation.METRICS.inc("admission_rejected_total", reason="queue_full")
+                raise AdmissionRejected("queue_full", retry_after=self._retry_after())
+            self._queue.append(ticket)
+            self.metrics["queued"] += 1
+            # Someone ahead may only be waiting on their own session or user limit.
+            self._drain()
+        return ticket
+
+    def ensure_room(self) -> None:
+        """Raise AdmissionRejected as ``enqueue`` would for a request arriving now, without queueing one."""
+        with self._lock:
+            busy = self._queue or (self.max_active and self._active >= self.max_active)
+            if busy and self.max_queue and len(self._queue) >= self.max_queue:
+                self.metrics["rejected"] += 1
+                instrumentation.METRICS.inc("admission_rejected_total", reason="queue_full")
+                raise AdmissionRejected("queue_full", retry_after=self._retry_after())
+
+    def _retry_after(self) -> float:
+        return max(1.0, min(self.queue_timeout, 5.0 * (len(self._queue) / max(1, self.max_active) + 1)))
+
+    def position(self, ticket: Ticket) -> int:
+        """1-based place in the queue; 0 once admitted."""
+        with self._lock:
+            if ticket.admitted:
+                return 0
+            try:
+                return self._queue.index(ticket) + 1
+            except ValueError:
+                return 0
+
+    async def wait(self, ticket: Ticket) -> AsyncIterator[int]:
+        """Yield the ticket's queue position whenever it changes, until it is admitted."""
+        ticket.loop = asyncio.get_running_loop()
+        ticket.wakeup = asyncio.Event()
+        deadline = time.monotonic() + self.queue_timeout
+        last = None
+        while True:
+            ticket.wakeup.clear()
+            position = self.position(ticket)
+            if ticket.admitted:
+                return
+            if position != last:
+                last = position
+                yield position
+            remaining = deadline - time.monotonic()
+            if self.queue_timeout and remaining <= 0:
+                with self._lock:
+                    if ticket.admitted:
+                        return
+                    self._leave(ticket)
+                    self.metrics["timed_out"] += 1
+                instrumentation.METRICS.inc("admission_rejected_total", reason="queue_timeout")
+                raise AdmissionRejected("queue_timeout", retry_after=self._retry_after())
+            try:
+                await asyncio.wait_for(ticket.wakeup.wait(), remaining if self.queue_timeout else None)
+            except asyncio.TimeoutError:
+                pass
+
+    def _leave(self, ticket: Ticket) -> None:
+        # Caller holds the lock.
+        if ticket in self._queue:
+            self._queue.remove(ticket)
+            self._drain()
+
+    def release(self, ticket: Ticket) -> None:
+        """Give back the ticket's slot, or its queue place; safe to call more than once."""
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            if not ticket.admitted:
+                self._leave(ticket)
+                return
+            self._active -= 1
+            for counts, key in ((self._per_session, ticket.session_id), (self._per_user, ticket.user_id)):
+                if key:
+                    counts[key] -= 1
+                    if not counts[key]:
+                        del counts[key]
+            self._drain()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.metrics, "active": self._active, "queue_length": len(self._queue)}
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at ``per_minute``, holding at most ``burst``.
+
+    Callers reserve their cost up front and then wait out any deficit, so concurrent
+    callers are served in order without polling and large costs are never starved.
+    """
+
+    def __init__(self, per_minute: float, burst: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = burst if burst else per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        # Caller holds the lock.
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, cost: float = 1.0) -> float:
+        """Take ``cost`` tokens and return the seconds to wait before using them."""
+        with self._lock:
+            self._refill()
+            self._tokens -= cost
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def take(self, cost: float = 1.0) -> bool:
+        """Take ``cost`` tokens only if they are there now."""
+        with self._lock:
+            self._refill()
+            if self._tokens < cost:
+                return False
+            self._tokens -= cost
+            return True
+
+    def refund(self, cost: float = 1.0) -> None:
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + cost)
+
+
+class RateLimiters:
+    """Token buckets per upstream limit, shared by every node call in the process."""
+
+    def __init__(self, buckets: Dict[str, TokenBucket]):
+        self.buckets = buckets
+
+    def _reserve(self, name: str, cost: float) -> float:
+        bucket = self.buckets.get(name)
+        if bucket is None or cost <= 0:
+            return 0.0
+        delay = bucket.reserve(cost)
+        instrumentation.METRICS.observe("rate_limit_wait_seconds", delay, limit=name)
+        if delay > 1.0:
+            logger.info("🚦 Waiting %.1fs for the %s rate limit", delay, name)
+        return delay
+
+    def acquire(self, name: str, cost: float = 1.0) -> None:
+        delay = self._reserve(name, cost)
+        if delay:
+            time.sleep(delay)
+
+    async def aacquire(self, name: str, cost: float = 1.0) -> None:
+        delay = self._reserve(name, cost)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def try_acquire(self, costs: Sequence[Tuple[str, float]]) -> bool:
+        """Take every (limit, cost) at once, or none of them if any limit would make the caller wait."""
+        taken = []
+        for name, cost in costs:
+            bucket = self.buckets.get(name)
+            if bucket is None or cost <= 0:
+                continue
+            if not bucket.take(cost):
+                for bucket, cost in taken:
+                    bucket.refund(cost)
+                return False
+            taken.append((bucket, cost))
+        return True
+
+
+def build_admission() -> AdmissionController:
+    """CHAT_MAX_ACTIVE, CHAT_MAX_PER_SESSION, CHAT_MAX_PER_USER, CHAT_MAX_QUEUE and CHAT_QUEUE_TIMEOUT; 0 disables a cap."""
+    return AdmissionController(
+        max_active=int(os.getenv("CHAT_MAX_ACTIVE", "32")),
+        max_per_session=int(os.getenv("CHAT_MAX_PER_SESSION", "1")),
+        max_per_user=int(os.getenv("CHAT_MAX_PER_USER", "4")),
+        max_queue=int(os.getenv("CHAT_MAX_QUEUE", "128")),
+        queue_timeout=float(os.getenv("CHAT_QUEUE_TIMEOUT", "120")),
+    )
+
+
+def build_rate_limiters() -> RateLimiters:
+    """<LIMIT>_PER_MINUTE and optional <LIMIT>_BURST for <provider>_requests and <provider>_tokens.
+
+    Every limit is off (0) unless configured, e.g. OPENAI_REQUESTS_PER_MINUTE=500 or
+    SERPAPI_REQUESTS_PER_MINUTE=100 to match an account's quota.
+    """
+    names = (
+        "openai_requests", "openai_tokens",
+        "groq_requests", "groq_tokens",
+        "google_requests", "google_tokens",
+        "serpapi_requests",
+    )
+    buckets = {}
+    for name in names:
+        per_minute = float(os.getenv(f"{name.upper()}_PER_MINUTE", "0"))
+        if per_minute > 0:
+            buckets[name] = TokenBucket(per_minute, float(os.getenv(f"{name.upper()}_BURST", "0")) or None)
+    return RateLimiters(buckets)
@@ -2,34 +2,96 @@ from typing import Annotated, Sequence, TypedDict, Dict, Any, Iterable
 from dotenv import load_dotenv
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, ToolMessage, SystemMessage
 from langchain_core.tools import tool
+from langchain_core.runnables import RunnableLambda
 from langchain_core.messages import messages_from_dict, messages_to_dict
-from langgraph.graph.message import add_messages
 from langgraph.graph import StateGraph, END
+from langgraph.types import Send
+from langgraph.config import get_config
 # from langgraph.prebuilt import ToolNode
-from langchain_groq import ChatGroq
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_openai import ChatOpenAI
 from serpapi import GoogleSearch, GoogleScholarSearch
+from model_pool import ModelPool
+from tool_cache import build_tool_cache, normalize_query
+from llm_cache import build_llm_cache
+from context_window import build_context_window, count_tokens
+from prompts import PATCH_ALLOWED, PATCH_DOCUMENT, PATCH_REJECTED, PROMPTS, PROVISIONAL_RESEARCH, PromptCacheStats
+from message_log import MessageLog, append_messages, message_ids
+from patching import PATCH_EDITS, PatchError, apply_patch, is_patch, looks_like_patch, parse_patch
+from routing import DRAFT, EDIT, REPLY, json_object, parse_decision
+from admission import build_rate_limiters
+from resilience import build_model_invoker
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+import budget
+import instrumentation
+import asyncio
+import contextvars
+import logging
+import operator
 import os
 import json
+import threading
+import time
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 class AgentState(TypedDict):
-    messages: Annotated[Sequence[BaseMessage], add_messages]
+    # Append-only; nodes return only the messages they add (see message_log).
+    messages: Annotated[MessageLog, append_messages]
     router: str
     coordinator_instructions: str
     research_summary: str
     draft_text: str
     final_response: str
+    # Running summary of the turns before messages[summarized_count:], see context_window.
+    history_summary: str
+    summarized_count: int
+    # Work done by the current request against its limits, see budget.RunBudget.
+    budget: Dict[str, Any]
+    # Draft written while research ran (SPECULATIVE_DRAFTING); merged into draft_text by the Draft node.
+    provisional_draft: str
+
+
+# SerpAPI results are memoized across iterations and users (TOOL_CACHE_BYPASS=1 disables it).
+TOOL_CACHE = build_tool_cache()
+
+# Upstream rate limits shared by every request (OPENAI_REQUESTS_PER_MINUTE, SERPAPI_REQUESTS_PER_MINUTE, ...).
+RATE_LIMITS = build_rate_limiters()
+
+# Model calls get per-role timeouts, retries, optional hedging and provider fallback (see model_pool.RoleConfig).
+MODEL_INVOKER = build_model_invoker(RATE_LIMITS)
+
+
+def _configurable(key: str) -> Any:
+    # Per-graph overrides passed to build_app(); None outside a graph run.
+    try:
+        return get_config().get("configurable", {}).get(key)
+    except RuntimeError:
+        return None
+
+
+def _organic_results(search_cls, engine: str, params: Dict[str, Any]) -> list:
+    search_cls = (_configurable("search_clients") or {}).get(engine, search_cls)
+    fetched = []
+
+    def fetch() -> Dict[str, Any]:
+        fetched.append(engine)
+        RATE_LIMITS.acquire("serpapi_requests")
+        response = search_cls({**params, "api_key": os.getenv("SERP_API_KEY")}).get_dict()
+        if response.get("error"):
+            return {"error": response["error"]}
+        return {"organic_results": response.get("organic_results", [])}
+
+    results = TOOL_CACHE.get_or_fetch(engine, params, fetch).get("organic_results", [])
+    if not fetched:
+        instrumentation.record_tool_cache_hit(engine)
+    return results
 
 
 @tool
 def web_search(query: str) -> str:
     """Find general knowledge information using Google search."""
-    serpapi_params = {"engine": "google", "api_key": os.getenv("SERP_API_KEY")}
-    search = GoogleSearch({**serpapi_params, "q": query, "num": 1})
-    results = search.get_dict().get("organic_results", [])
+    results = _organic_results(GoogleSearch, "google", {"engine": "google", "q": query, "num": 1})
     contexts = "\n---\n".join(["\n".join([x.get("title", ""), x.get("snippet", ""), x.get("link", "")]) for x in results])
     return contexts
 
@@ -45,9 +107,7 @@ def google_scholar(query: str) -> str:
     Returns:
         List[Dict]: A list of academic papers with title, authors, abstract, and link.
     """
-    serpapi_params = {"api_key": os.getenv("SERP_API_KEY")}
-    search = GoogleScholarSearch({**serpapi_params, "q": query, "num": 1})
-    results = search.get_dict().get("organic_results", [])
+    results = _organic_results(GoogleScholarSearch, "google_scholar", {"q": query, "num": 1})
     formatted_results = []
     for result in results:
         article_info = {
@@ -65,157 +125,276 @@ def save(filename: str) -> str:
     """Save the final response to a text file."""
     if not filename.endswith('.txt'):
         filename = f"{filename}.txt"
-    print("Actual writing will be decided by the coordinator; this tool simply acknowledges.")
+    logger.debug("Actual writing will be decided by the coordinator; this tool simply acknowledges.")
     # Actual writing will be decided by the coordinator; this tool simply acknowledges.
     return f"Ready to save as '{filename}'. Send final content to client to persist."
 
 
 TOOLS = [web_search, google_scholar]
 COORDINATION_TOOLS = [save]
+TOOLS_BY_NAME = {t.name: t for t in (TOOLS + COORDINATION_TOOLS)}
+
+# Tool calls from one AIMessage run concurrently on a bounded pool shared by all requests.
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "30"))
+TOOL_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv("TOOL_MAX_WORKERS", "8")), thread_name_prefix="tool")
+
+
+# Bound clients are built once per role and shared across node calls and requests.
+MODEL_POOL = ModelPool()
+
+
+def _model_pool() -> ModelPool:
+    return _configurable("model_pool") or MODEL_POOL
+
+# Opt-in per role via LLM_CACHE_ROLES; replays earlier responses to identical (or, for
+# LLM_CACHE_SEMANTIC_ROLES, near-identical) prompts instead of calling the provider.
+LLM_CACHE = build_llm_cache()
+
+# Provider-side prompt caching: cached vs. uncached input tokens per role.
+PROMPT_CACHE = PromptCacheStats()
+
+
+def _record_model_call(role: str, provider: str, started: float, messages: list[BaseMessage], response: AIMessage) -> None:
+    usage = response.usage_metadata
+    model = _model_pool().config(role, provider).model
+    instrumentation.record_model_call(role, model, time.perf_counter() - started, usage)
+    PROMPT_CACHE.record(role, usage)
+    # Providers that do not report usage are charged an estimate.
+    budget.record_llm_call(usage["total_tokens"] if usage else count_tokens(messages) + count_tokens([response]))
+
+
+def _invoke_model(role: str, messages: list[BaseMessage], tools: Sequence[Any] = (), tool_choice: str | None = None) -> AIMessage:
+    cached = LLM_CACHE.lookup(role, messages)
+    if cached is not None:
+        instrumentation.record_llm_cache_hit(role, cached.response_metadata.get("llm_cache", "exact_hits"))
+        return cached
+    started = time.perf_counter()
+    provider, response = MODEL_INVOKER.invoke(_model_pool(), role, messages, tools, tool_choice)
+    _record_model_call(role, provider, started, messages, response)
+    # Tagged with its author so the context window can tell drafts from other replies.
+    response.name = role
+    LLM_CACHE.store(role, messages, response)
+    return response
+
+
+async def _ainvoke_model(role: str, messages: list[BaseMessage], tools: Sequence[Any] = (), tool_choice: str | None = None) -> AIMessage:
+    cached = LLM_CACHE.lookup(role, messages)
+    if cached is not None:
+        instrumentation.record_llm_cache_hit(role, cached.response_metadata.get("llm_cache", "exact_hits"))
+        return cached
+    started = time.perf_counter()
+    provider, response = await MODEL_INVOKER.ainvoke(_model_pool(), role, messages, tools, tool_choice)
+    _record_model_call(role, provider, started, messages, response)
+    response.name = role
+    LLM_CACHE.store(role, messages, response)
+    return response
+
+
+# Trims each prompt to its role's token budget (<ROLE>_CONTEXT_TOKENS) and keeps a running
+# summary of older turns in the state.
+CONTEXT_WINDOW = build_context_window()
+
+
+def _prompt_messages(state: AgentState, role: str, **fields: Any) -> list[BaseMessage]:
+    # Static prefix, history, then the state-dependent suffix (see prompts.py).
+    template = PROMPTS[role]
+    return CONTEXT_WINDOW.build(
+        [template.prefix_message()],
+        list(state["messages"]),
+        summary=state.get("history_summary", ""),
+        summarized_count=state.get("summarized_count", 0),
+        budget=_model_pool().config(role).context_tokens,
+        suffix=[template.suffix_message(state, **fields)],
+    )
 
 
-def _get_models():
-    model = ChatOpenAI(
-        openai_api_key=os.getenv("OPENAI_API_KEY"),
-        model="gpt-4o-mini",  # Specify the OpenAI model (e.g., gpt-4o-mini, gpt-4o, etc.)
-        temperature=0.2
-        ).bind_tools(TOOLS, tool_choice="any")
-
-    coordinator_model = ChatOpenAI(
-        openai_api_key=os.getenv("OPENAI_API_KEY"),
-        model="gpt-4o-mini",  # Specify the OpenAI model (e.g., gpt-4o-mini, gpt-4o, etc.)
-        temperature=0.2
-        ).bind_tools(COORDINATION_TOOLS)
-
-    model_no_tools = ChatOpenAI(
-        openai_api_key=os.getenv("OPENAI_API_KEY"),
-        model="gpt-4o-mini",  # Specify the OpenAI model (e.g., gpt-4o-mini, gpt-4o, etc.)
-        temperature=0.2
-        )
-
-# # Model for all Nodes except Coordinate node
-#     model = ChatGoogleGenerativeAI(
-#         # groq_api_key = os.getenv("GROQ_API_KEY"),
-#         # model_name = "llama-3.1-8b-instant",
-#         google_api_key = os.getenv("GOOGLE_API_KEY"),
-#         model = "gemini-1.5-flash-latest",
-#         api_version="v1",
-#         temperature = 0.2 
-#         ).bind_tools(TOOLS, tool_choice="any")
-
-# # Model for Coordinate node
-#     coordinator_model = ChatGoogleGenerativeAI(
-#        google_api_key = os.getenv("GOOGLE_API_KEY"),
-#         model = "gemini-1.5-flash-latest", 
-#         api_version="v1",
-#         temperature = 0.2 
-#         ).bind_tools(COORDINATION_TOOLS)
-
-# # Model without Tools
-#     model_no_tools = ChatGoogleGenerativeAI(
-#         google_api_key = os.getenv("GOOGLE_API_KEY"),
-#         model = "gemini-1.5-flash-latest",  
-#         api_version="v1",
-#         temperature = 0.2
-#         )
-
-    return model, coordinator_model, model_no_tools
-
-
-def coordination(state: AgentState) -> AgentState:
-    _, coordinator_model, _ = _get_models()
-    current_document = state.get("final_response") or state.get("draft_text") or ""
-    system_prompt = SystemMessage(content=f"""
-    You are the Coordinator Agent in a multi-agent drafting system. Your role is to act as the central orchestrator for user requests 
-    to draft or refine text, such as emails, essays, or other written content. Analyze the user's input to determine the task type, 
-    required steps, and which agents to involve. Maintain conversation flow, incorporate user feedback, and route tasks accordingly.
-
-    Key responsibilities:
-
-    Parse user request: Identify if research is needed (e.g., factual topics), or finalizing.
-    Route workflow: Decide sequence or parallelism (e.g., research first if facts are required).
-    Handle iterations: If user provides feedback, decide if it requires re-research.
-    User interaction: Respond conversationally, present drafts for approval, and ask clarifying questions if needed.
-    End task: When user wants to save and finish the draft, invoke the 'save' tool to store the final content.
-
-    Always be helpful, concise, and focused on progressing the draft. Do not perform research, drafting, or editing yourself, delegate 
-    to specialized agents.   
+def _summary_request(state: AgentState):
+    start = state.get("summarized_count", 0)
+    messages = list(state["messages"])
+    end = CONTEXT_WINDOW.summary_span(messages, start)
+    if end is None:
+        return None, None
+    return end, CONTEXT_WINDOW.summary_request(state.get("history_summary", ""), messages, start, end)
 
-    You are an agent with access to only this tool: save. Do not invent or call any other tools, including parse_task, brave_search or 
-    similar. If a task requires decomposition, reason step-by-step in your response instead of using a tool.
 
-    The current document content is:{current_document}
-    
-    Output Format:
-    Always respond in JSON with the following format:
+def _summarized(state: AgentState) -> AgentState:
+    # Runs at most once per turn, from the coordinator, and only when older turns overflow.
+    end, request = _summary_request(state)
+    if end is None:
+        return state
+    response = _invoke_model("summarizer", request)
+    return {**state, "history_summary": response.content, "summarized_count": end}
 
-    "description":  "Provide whatever instructions/details you have to pass on to the next agent or if you have to provide an answer 
-                    to the User.",
-    "notes": "Provide notes if required as this is optional."
 
-    """)
-    if (state["messages"][-1]) and isinstance(state["messages"][-1], ToolMessage):
+async def _asummarized(state: AgentState) -> AgentState:
+    end, request = _summary_request(state)
+    if end is None:
         return state
+    response = await _ainvoke_model("summarizer", request)
+    return {**state, "history_summary": response.content, "summarized_count": end}
 
-    # Expect that the latest user message is already in state["messages"].
-    all_messages = [system_prompt] + list(state["messages"])  # no input() calls
-    response = coordinator_model.invoke(all_messages)
 
-    print(f"\n🤖 Coordinator: {response.content}")
-    print()
+
+def _coordination_state(state: AgentState, response: AIMessage) -> AgentState:
+    logger.debug("🤖 Coordinator: %s", response.content)
 
     if hasattr(response, "tool_calls") and response.tool_calls:
-        print(f"🔧 USING TOOLS: {[tc['name'] for tc in response.tool_calls]}")
+        logger.info("🔧 USING TOOLS: %s", [tc["name"] for tc in response.tool_calls])
+
+    draft_text = state.get("draft_text", "")
+    if FAST_PATHS and not response.tool_calls and parse_decision(response.content).route == EDIT:
+        # The Editor works on draft_text; an edit-only turn revises the document as last edited.
+        draft_text = state.get("final_response") or draft_text
 
     new_state: AgentState = {
-        "messages": list(state["messages"]) + [response],
+        "messages": [response],
         "router": "coordinate",
         "coordinator_instructions": response.content,
         "research_summary": state.get("research_summary", ""),
-        "draft_text": state.get("draft_text", ""),
-        "final_response": state.get("final_response", "")
+        "draft_text": draft_text,
+        "final_response": state.get("final_response", ""),
+        "history_summary": state.get("history_summary", ""),
+        "summarized_count": state.get("summarized_count", 0),
+        # Left over only if an earlier request stopped between Research and Draft.
+        "provisional_draft": "",
     }
     return new_state
 
 
-def tools_node(state: AgentState) -> AgentState:
-    tools = {t.name: t for t in (TOOLS + COORDINATION_TOOLS)}
+def coordination(state: AgentState) -> AgentState:
+    if (state["messages"][-1]) and isinstance(state["messages"][-1], ToolMessage):
+        return {}
+    state = _summarized(state)
+    # Expect that the latest user message is already in state["messages"].
+    all_messages = _prompt_messages(state, "coordinator")  # no input() calls
+    response = _invoke_model("coordinator", all_messages, COORDINATION_TOOLS)
+    return _coordination_state(state, response)
+
+
+async def acoordination(state: AgentState) -> AgentState:
+    if (state["messages"][-1]) and isinstance(state["messages"][-1], ToolMessage):
+        return {}
+    state = await _asummarized(state)
+    all_messages = _prompt_messages(state, "coordinator")
+    response = await _ainvoke_model("coordinator", all_messages, COORDINATION_TOOLS)
+    return _coordination_state(state, response)
+
+
+def _pending_tool_calls(state: AgentState) -> list[Dict[str, Any]]:
     last_msg = state["messages"][-1] if state.get("messages") else None
-    tool_messages: list[ToolMessage] = []
     if isinstance(last_msg, AIMessage) and getattr(last_msg, "tool_calls", None):
-        for call in last_msg.tool_calls:
-            name = call.get("name")
-            args = call.get("args", {}) or {}
-            tool = tools.get(name)
-            if tool is None:
-                output = f"Tool '{name}' not found."
-                print("Tool Message:", output)
-            else:
-                try:
-                    output = tool.invoke(args)
-                    print("Tool Message:", output)
-                except Exception as exc:
-                    output = f"Tool '{name}' failed: {exc}"
-                    print("Tool Message:", output)
-            tool_messages.append(ToolMessage(content=str(output), tool_call_id=call.get("id", name or "tool")))
-
-    new_messages = list(state.get("messages", [])) + tool_messages
+        return list(last_msg.tool_calls)
+    return []
+
+
+def _tool_message(call: Dict[str, Any], output: Any) -> ToolMessage:
+    logger.debug("Tool Message: %s", output)
+    name = call.get("name")
+    return ToolMessage(content=str(output), tool_call_id=call.get("id", name or "tool"))
+
+
+def _tool_output(call: Dict[str, Any]) -> Any:
+    name = call.get("name")
+    tool = TOOLS_BY_NAME.get(name)
+    if tool is None:
+        instrumentation.record_tool_call(str(name), 0.0, "not_found")
+        return f"Tool '{name}' not found."
+    started = time.perf_counter()
+    try:
+        output = tool.invoke(call.get("args", {}) or {})
+    except Exception as exc:
+        instrumentation.record_tool_call(name, time.perf_counter() - started, "error")
+        return f"Tool '{name}' failed: {exc}"
+    instrumentation.record_tool_call(name, time.perf_counter() - started, "ok")
+    return output
+
+
+async def _atool_output(call: Dict[str, Any]) -> Any:
+    name = call.get("name")
+    tool = TOOLS_BY_NAME.get(name)
+    if tool is None:
+        instrumentation.record_tool_call(str(name), 0.0, "not_found")
+        return f"Tool '{name}' not found."
+    started = time.perf_counter()
+    timeout = budget.time_left(TOOL_TIMEOUT_SECONDS)
+    try:
+        output = await asyncio.wait_for(tool.ainvoke(call.get("args", {}) or {}), timeout)
+    except asyncio.TimeoutError:
+        instrumentation.record_tool_call(name, time.perf_counter() - started, "cancelled")
+        instrumentation.record_tool_timeout(name)
+        return _timeout_output(call, timeout)
+    except Exception as exc:
+        instrumentation.record_tool_call(name, time.perf_counter() - started, "error")
+        return f"Tool '{name}' failed: {exc}"
+    instrumentation.record_tool_call(name, time.perf_counter() - started, "ok")
+    return output
+
+
+def _timeout_output(call: Dict[str, Any], timeout: float) -> str:
+    return f"Tool '{call.get('name')}' timed out after {timeout:g}s."
+
+
+def _tools_state(state: AgentState, tool_messages: list[ToolMessage]) -> AgentState:
     return {
-        "messages": new_messages,
+        "messages": tool_messages,
         "router": state.get("router", "coordinate"),
         "coordinator_instructions": state.get("coordinator_instructions", ""),
         "research_summary": state.get("research_summary", ""),
         "draft_text": state.get("draft_text", ""),
         "final_response": state.get("final_response", ""),
+        "history_summary": state.get("history_summary", ""),
+        "summarized_count": state.get("summarized_count", 0),
     }
 
 
+def tools_node(state: AgentState) -> AgentState:
+    # Calls run concurrently; results keep the order of the AIMessage's tool_calls and a
+    # failing or slow call only affects its own ToolMessage.
+    calls = _pending_tool_calls(state)
+    # Never past the request's time limit, which is otherwise only checked between nodes.
+    timeout = budget.time_left(TOOL_TIMEOUT_SECONDS)
+    deadline = time.monotonic() + timeout
+    # Each call gets a copy of the request context so its timings land on the right request.
+    futures = [TOOL_EXECUTOR.submit(contextvars.copy_context().run, _tool_output, call) for call in calls]
+    tool_messages = []
+    for call, future in zip(calls, futures):
+        try:
+            output = future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FuturesTimeoutError:
+            # The call keeps its worker until it returns and then records its own outcome.
+            future.cancel()
+            instrumentation.record_tool_timeout(str(call.get("name")))
+            output = _timeout_output(call, timeout)
+        tool_messages.append(_tool_message(call, output))
+    return _tools_state(state, tool_messages)
+
+
+async def atools_node(state: AgentState) -> AgentState:
+    calls = _pending_tool_calls(state)
+    outputs = await asyncio.gather(*(_atool_output(call) for call in calls))
+    tool_messages = [_tool_message(call, output) for call, output in zip(calls, outputs)]
+    return _tools_state(state, tool_messages)
+
+
+# The coordinator's JSON "route" picks the first node to run (see routing.py);
+# COORDINATOR_FAST_PATHS=off always takes the full Research -> Draft -> Edit pipeline.
+FAST_PATHS = os.getenv("COORDINATOR_FAST_PATHS", "on").lower() not in ("0", "off", "false", "no")
+
+FAST_PATH_EDGES = {REPLY: "Reply", EDIT: "Edit", DRAFT: "Draft"}
+
+
 def should_continue(state: AgentState) -> str:
     last_msg = state["messages"][-1]
     if isinstance(last_msg, AIMessage):
         if hasattr(last_msg, "tool_calls") and last_msg.tool_calls:
             return "Save"
-        return "Continue"
+        if not FAST_PATHS:
+            return "Continue"
+        route = parse_decision(last_msg.content).route
+        if route == EDIT and not (state.get("final_response") or state.get("draft_text")):
+            # Nothing to edit yet.
+            route = DRAFT
+        return FAST_PATH_EDGES.get(route, "Continue")
     if isinstance(last_msg, ToolMessage):
         return "End"
     return "Continue"
@@ -235,196 +414,658 @@ def router_func(state: AgentState) -> str:
     return "coordinate"
 
 
-def research(state: AgentState) -> AgentState:
-    model, _, model_no_tools = _get_models()
-    system_prompt = SystemMessage(content=f"""
-    You are the Researcher Agent in a multi-agent drafting system. Your role is to gather relevant information, facts, data, 
-    or references needed for the draft based on the user's request and shared state. Use relevant tools to collect 
-    accurate, summarized information. Output only the research summary in a structured format (e.g., bullet points with sources) to 
-    be used by the Drafter.
-
-    Key responsibilities:
-    - Analyze the task: Focus on key topics, questions, or gaps in knowledge from the user request.
-    - Conduct research: Query reliable sources, summarize findings without bias, and cite origins.
-    - Relevance: Only include info directly applicable to the draft; keep it concise (aim for 200-500 words).
-
-    Coordinator instructions: {state.get('coordinator_instructions', '')}
-
-    You are an agent with access to only this tool: web_search, google_scholar. Do not invent or call any other tools, including parse_task, brave_search or 
-    similar. If a task requires decomposition, reason step-by-step in your response instead of using a tool.
+def _worker_tools(state: AgentState) -> tuple:
+    # Once tool results are back, answer without forcing another tool call.
+    if isinstance(state["messages"][-1], ToolMessage):
+        return (), None
+    # Searching is the research subgraph's job; drafting and editing may search if they find a gap.
+    if FAST_PATHS:
+        return TOOLS, None
+    return TOOLS, "any"
 
-    Do not draft or edit text, your output is purely informational support. 
-        """)
 
-    last_msg = state["messages"][-1]
-    all_messages = [system_prompt] + list(state["messages"])
-    response = model_no_tools.invoke(all_messages) if isinstance(last_msg, ToolMessage) else model.invoke(all_messages)
 
-    print(f"\n🧪 Researcher: {response.content}")
-    print()
+def _research_state(state: AgentState, response: AIMessage) -> AgentState:
+    logger.debug("🧪 Researcher: %s", response.content)
 
     if hasattr(response, "tool_calls") and response.tool_calls:
-        print(f"🔧 USING TOOLS: {[tc['name'] for tc in response.tool_calls]}")
+        logger.info("🔧 USING TOOLS: %s", [tc["name"] for tc in response.tool_calls])
     else:
-        print()
-        print("No Tool call made")
-        print()
+        logger.debug("No Tool call made")
 
     new_state: AgentState = {
-        "messages": list(state["messages"]) + [response],
+        "messages": [response],
         "router": "research",
         "coordinator_instructions": state.get("coordinator_instructions", ""),
         "research_summary": response.content,
         "draft_text": state.get("draft_text", ""),
         "final_response": state.get("final_response", ""),
+        "history_summary": state.get("history_summary", ""),
+        "summarized_count": state.get("summarized_count", 0),
     }
     return new_state
 
 
-def drafting(state: AgentState) -> AgentState:
-    model, _, model_no_tools = _get_models()
-    system_prompt = SystemMessage(content = f"""
-    You are the Drafter Agent in a multi-agent drafting system. Your role is to generate the initial or revised draft of the 
-    requested text (e.g., email, essay etc.) using the user's request, research notes from the Researcher, and any prior feedback. 
-    Produce creative, coherent, and tailored content. Support iterative refinements based on user or Editor input.
+# Research is a map-reduce subgraph: the planner splits the coordinator's instructions into
+# at most RESEARCH_MAX_QUERIES sub-queries, each searched on its own branch (at most
+# RESEARCH_CONCURRENCY at a time, RESEARCH_RESULTS_PER_QUERY results each), and the
+# researcher reduces the deduplicated results into one summary citing its sources.
+RESEARCH_MAX_QUERIES = int(os.getenv("RESEARCH_MAX_QUERIES", "4"))
+RESEARCH_CONCURRENCY = int(os.getenv("RESEARCH_CONCURRENCY", "4"))
+RESEARCH_RESULTS_PER_QUERY = int(os.getenv("RESEARCH_RESULTS_PER_QUERY", "3"))
+
+# source -> (tool name in metrics, SerpAPI engine, extra query parameters)
+RESEARCH_SOURCES = {
+    "web": ("web_search", "google", {"engine": "google"}),
+    "scholar": ("google_scholar", "google_scholar", {}),
+}
+
+
+class ResearchState(AgentState):
+    queries: list[Dict[str, Any]]
+    # Appended to concurrently by the search branches.
+    results: Annotated[list[Dict[str, Any]], operator.add]
+
+
+def _fallback_query(state: AgentState) -> str:
+    description = parse_decision(state.get("coordinator_instructions", "")).description
+    if not description:
+        description = next((str(m.content) for m in reversed(state["messages"]) if isinstance(m, HumanMessage)), "")
+    return description[:200]
+
+
+def _planned_queries(state: AgentState, response: AIMessage) -> list[Dict[str, Any]]:
+    data = json_object(response.content) if isinstance(response.content, str) else {}
+    queries, seen = [], set()
+    for item in data.get("queries") or []:
+        if isinstance(item, str):
+            item = {"query": item}
+        if not isinstance(item, dict):
+            continue
+        query = str(item.get("query", "")).strip()
+        source = item.get("source") if item.get("source") in RESEARCH_SOURCES else "web"
+        if query and (query.lower(), source) not in seen:
+            seen.add((query.lower(), source))
+            queries.append({"query": query, "source": source})
+    if "queries" not in data and _fallback_query(state):
+        # An unreadable plan still researches the request itself; an empty one searches nothing.
+        queries = [{"query": _fallback_query(state), "source": "web"}]
+    queries = queries[:RESEARCH_MAX_QUERIES]
+    logger.info("🔍 Research plan: %s", [f"{q['source']}: {q['query']}" for q in queries])
+    return queries
+
+
+def plan_research(state: ResearchState) -> Dict[str, Any]:
+    all_messages = _prompt_messages(state, "planner", max_queries=RESEARCH_MAX_QUERIES)
+    response = _invoke_model("planner", all_messages)
+    return {"queries": _planned_queries(state, response)}
+
+
+async def aplan_research(state: ResearchState) -> Dict[str, Any]:
+    all_messages = _prompt_messages(state, "planner", max_queries=RESEARCH_MAX_QUERIES)
+    response = await _ainvoke_model("planner", all_messages)
+    return {"queries": _planned_queries(state, response)}
+
+
+def fan_out_research(state: ResearchState) -> list[Send] | str:
+    if not state["queries"]:
+        return "summarize"
+    return [Send("search", {"index": i, **query}) for i, query in enumerate(state["queries"])]
+
+
+def _search(task: Dict[str, Any]) -> Dict[str, Any]:
+    tool_name, engine, params = RESEARCH_SOURCES[task["source"]]
+    search_cls = GoogleScholarSearch if task["source"] == "scholar" else GoogleSearch
+    started = time.perf_counter()
+    try:
+        results = _organic_results(search_cls, engine, {**params, "q": task["query"], "num": RESEARCH_RESULTS_PER_QUERY})
+    except Exception as exc:
+        logger.warning("🔍 %s failed for %r: %s", tool_name, task["query"], exc)
+        instrumentation.record_tool_call(tool_name, time.perf_counter() - started, "error")
+        return {"results": []}
+    instrumentation.record_tool_call(tool_name, time.perf_counter() - started, "ok")
+    return {
+        "results": [
+            {
+                "index": task["index"],
+                "rank": rank,
+                "source": task["source"],
+                "title": result.get("title", ""),
+                "snippet": result.get("snippet", ""),
+                "link": result.get("link", ""),
+            }
+            for rank, result in enumerate(results)
+        ]
+    }
 
-    Key responsibilities:
-    - Incorporate inputs: Blend user details, research notes, and style preferences (e.g., formal, concise).
-    - Generate draft: Write complete, well-structured text; for essays, include intro/body/conclusion.
-    - Iterations: If feedback is provided, revise accordingly (e.g., "make it shorter" or "add examples").
 
-    Research summary: {state.get('research_summary', '')}
+def _search_timed_out(task: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+    tool_name = RESEARCH_SOURCES[task["source"]][0]
+    logger.warning("🔍 %s timed out after %.3gs for %r", tool_name, timeout, task["query"])
+    instrumentation.record_tool_timeout(tool_name)
+    return {"results": []}
 
-    You are an agent with access to only this tool: web_search, google_scholar. Do not invent or call any other tools, including parse_task, brave_search or 
-    similar. If a task requires decomposition, reason step-by-step in your response instead of using a tool.
 
-    Be versatile across writing types. Do not research or edit for grammar—focus on content creation. If the draft is initial, keep 
-    it as a solid starting point.
-    """)
+def search_source(task: Dict[str, Any]) -> Dict[str, Any]:
+    timeout = budget.time_left(TOOL_TIMEOUT_SECONDS)
+    future = TOOL_EXECUTOR.submit(contextvars.copy_context().run, _search, task)
+    try:
+        return future.result(timeout=timeout)
+    except FuturesTimeoutError:
+        return _search_timed_out(task, timeout)
+
+
+async def asearch_source(task: Dict[str, Any]) -> Dict[str, Any]:
+    timeout = budget.time_left(TOOL_TIMEOUT_SECONDS)
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(TOOL_EXECUTOR, contextvars.copy_context().run, _search, task)
+    try:
+        return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        return _search_timed_out(task, timeout)
 
-    last_msg = state["messages"][-1]
-    all_messages = [system_prompt] + list(state["messages"])
-    response = model_no_tools.invoke(all_messages) if isinstance(last_msg, ToolMessage) else model.invoke(all_messages)
 
-    print(f"\n📝 Drafter: {response.content}")
-    print()
+def _sources(results: Iterable[Dict[str, Any]]) -> list[Dict[str, Any]]:
+    # In plan order, so numbering does not depend on which search finished first.
+    sources, seen = [], set()
+    for result in sorted(results, key=lambda r: (r["index"], r["rank"])):
+        key = (result["link"] or result["title"]).strip().rstrip("/").lower()
+        if key and key not in seen:
+            seen.add(key)
+            sources.append(result)
+    return sources
+
+
+def _sources_message(sources: list[Dict[str, Any]]) -> SystemMessage:
+    if not sources:
+        return SystemMessage(content="Search results: none of the planned searches returned results.")
+    entries = [f"[{n}] {s['title']} ({s['source']}) {s['link']}\n{s['snippet']}" for n, s in enumerate(sources, 1)]
+    return SystemMessage(content="Search results:\n\n" + "\n\n".join(entries))
+
+
+def _cited(response: AIMessage, sources: list[Dict[str, Any]]) -> AIMessage:
+    if not sources:
+        return response
+    listing = "\n".join(f"[{n}] {s['title']} - {s['link']}" for n, s in enumerate(sources, 1))
+    return response.model_copy(update={"content": f"{response.content}\n\nSources:\n{listing}"})
+
+
+class ResearchMemo:
+    """Research summaries shared by the runs of one batch, keyed by their research plan.
+
+    Pass one as ``configurable["research_memo"]``: a run whose planner asks for the same
+    searches as an earlier one reuses that run's cited summary instead of summarizing
+    again, and concurrent runs wait for the summary in progress. A summary that fails
+    is not shared; the runs waiting on it summarize on their own.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._summaries: Dict[str, Future] = {}
+        self.metrics = {"summarized": 0, "shared": 0}
+
+    @staticmethod
+    def key(queries: Iterable[Dict[str, Any]]) -> str:
+        return json.dumps(sorted((q["source"], normalize_query(q["query"])) for q in queries))
+
+    def _claim(self, key: str) -> tuple:
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                summary = self._summaries[key] = Future()
+                self.metrics["summarized"] += 1
+                return summary, True
+            self.metrics["shared"] += 1
+            return summary, False
+
+    def _failed(self, key: str, summary: Future, exc: BaseException) -> None:
+        with self._lock:
+            self._summaries.pop(key, None)
+        summary.set_exception(exc)
+
+    def shared(self, key: str, summarize) -> AIMessage:
+        summary, leader = self._claim(key)
+        if not leader:
+            try:
+                return summary.result().model_copy()
+            except Exception:
+                return summarize()
+        try:
+            response = summarize()
+        except BaseException as exc:
+            self._failed(key, summary, exc)
+            raise
+        summary.set_result(response)
+        return response
+
+    async def ashared(self, key: str, summarize) -> AIMessage:
+        summary, leader = self._claim(key)
+        if not leader:
+            try:
+                return (await asyncio.wrap_future(summary)).model_copy()
+            except Exception:
+                return await summarize()
+        try:
+            response = await summarize()
+        except BaseException as exc:
+            self._failed(key, summary, exc)
+            raise
+        summary.set_result(response)
+        return response
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.metrics)
+
+
+def _research_memo(state: ResearchState) -> "ResearchMemo | None":
+    # Only a plan that searched something names a topic worth sharing.
+    return _configurable("research_memo") if state.get("queries") else None
+
+
+def summarize_research(state: ResearchState) -> Dict[str, Any]:
+    sources = _sources(state.get("results", []))
+
+    def summarize() -> AIMessage:
+        all_messages = _prompt_messages(state, "researcher") + [_sources_message(sources)]
+        return _cited(_invoke_model("researcher", all_messages), sources)
+
+    memo = _research_memo(state)
+    response = memo.shared(memo.key(state["queries"]), summarize) if memo else summarize()
+    return {"messages": [response]}
+
+
+async def asummarize_research(state: ResearchState) -> Dict[str, Any]:
+    sources = _sources(state.get("results", []))
+
+    async def summarize() -> AIMessage:
+        all_messages = _prompt_messages(state, "researcher") + [_sources_message(sources)]
+        return _cited(await _ainvoke_model("researcher", all_messages), sources)
+
+    memo = _research_memo(state)
+    response = await memo.ashared(memo.key(state["queries"]), summarize) if memo else await summarize()
+    return {"messages": [response]}
+
+
+def build_research_graph():
+    graph = StateGraph(ResearchState)
+    graph.add_node("plan", RunnableLambda(plan_research, afunc=aplan_research))
+    graph.add_node("search", RunnableLambda(search_source, afunc=asearch_source))
+    graph.add_node("summarize", RunnableLambda(summarize_research, afunc=asummarize_research))
+    graph.set_entry_point("plan")
+    graph.add_conditional_edges("plan", fan_out_research, ["search", "summarize"])
+    graph.add_edge("search", "summarize")
+    graph.add_edge("summarize", END)
+    # Runs inside Research_node, whose result the parent graph checkpoints.
+    return graph.compile(checkpointer=False)
+
+
+RESEARCH_GRAPH = build_research_graph()
+
+
+# SPECULATIVE_DRAFTING=on writes a provisional draft from the coordinator instructions while
+# research runs; the Draft node then merges the research into it with one cheap "merger" call,
+# or throws it away and drafts as usual if the research changed the direction.
+SPECULATIVE_DRAFTING = os.getenv("SPECULATIVE_DRAFTING", "off").lower() in ("1", "on", "true", "yes")
+
+# Sync provisional drafts run on their own pool: a model call with its retries and hedges
+# would otherwise hold a TOOL_EXECUTOR worker, and the searches queued behind it time out.
+SPECULATION_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv("SPECULATION_MAX_WORKERS", "4")), thread_name_prefix="speculate")
+
+
+def _provisional_messages(state: AgentState) -> list[BaseMessage]:
+    return _prompt_messages(state, "drafter", research_summary=PROVISIONAL_RESEARCH)
+
+
+def _provisional_text(response: AIMessage) -> str:
+    # Speculation never searches; a reply that tries to is no draft.
+    return "" if response.tool_calls else response.content
+
+
+def _provisional_draft(state: AgentState) -> str:
+    try:
+        return _provisional_text(_invoke_model("drafter", _provisional_messages(state)))
+    except Exception:
+        logger.exception("💥 Provisional draft failed; drafting after research instead")
+        return ""
+
+
+async def _aprovisional_draft(state: AgentState) -> str:
+    try:
+        return _provisional_text(await _ainvoke_model("drafter", _provisional_messages(state)))
+    except Exception:
+        logger.exception("💥 Provisional draft failed; drafting after research instead")
+        return ""
+
+
+def research(state: AgentState) -> AgentState:
+    if not SPECULATIVE_DRAFTING:
+        result = RESEARCH_GRAPH.invoke(state, {"max_concurrency": RESEARCH_CONCURRENCY})
+        return _research_state(state, result["messages"][-1])
+    provisional = SPECULATION_EXECUTOR.submit(contextvars.copy_context().run, _provisional_draft, state)
+    try:
+        result = RESEARCH_GRAPH.invoke(state, {"max_concurrency": RESEARCH_CONCURRENCY})
+    finally:
+        # A draft still queued behind other requests' speculation is no head start any more.
+        draft = "" if provisional.cancel() else provisional.result()
+    return {**_research_state(state, result["messages"][-1]), "provisional_draft": draft}
+
+
+async def aresearch(state: AgentState) -> AgentState:
+    if not SPECULATIVE_DRAFTING:
+        result = await RESEARCH_GRAPH.ainvoke(state, {"max_concurrency": RESEARCH_CONCURRENCY})
+        return _research_state(state, result["messages"][-1])
+    provisional = asyncio.create_task(_aprovisional_draft(state))
+    try:
+        result = await RESEARCH_GRAPH.ainvoke(state, {"max_concurrency": RESEARCH_CONCURRENCY})
+    except BaseException:
+        provisional.cancel()
+        raise
+    return {**_research_state(state, result["messages"][-1]), "provisional_draft": await provisional}
+
+
+
+def _revision_base(state: AgentState, role: str) -> str:
+    # The Editor polishes draft_text; the Drafter revises the document as it stands.
+    if role == "editor":
+        return state.get("draft_text", "")
+    return state.get("final_response") or state.get("draft_text") or ""
+
+
+def _edit_format(role: str, base: str, error: str = "") -> str:
+    if not PATCH_EDITS or not base:
+        return ""
+    text = PATCH_REJECTED.format(error=error) if error else PATCH_ALLOWED
+    return text + PATCH_DOCUMENT.format(document=base) if role == "drafter" else text
+
+
+def _revised_text(role: str, base: str, response: AIMessage) -> tuple:
+    """The document after ``response`` and, if it was a patch that cannot be applied, why not."""
+    if response.tool_calls or not PATCH_EDITS or not base:
+        return response.content, ""
+    try:
+        edits = parse_patch(response.content)
+        if edits is None:
+            instrumentation.record_revision(role, "rewritten")
+            return response.content, ""
+        text = apply_patch(base, edits)
+    except PatchError as exc:
+        logger.warning("🩹 %s patch rejected, asking for a full rewrite: %s", role, exc)
+        instrumentation.record_revision(role, "rejected")
+        return base, str(exc)
+    logger.debug("🩹 %s patched the document with %d edits", role, len(edits))
+    instrumentation.record_revision(role, "patched")
+    return text, ""
+
+
+def _revise(state: AgentState, role: str) -> tuple:
+    base = _revision_base(state, role)
+    response = _invoke_model(role, _prompt_messages(state, role, edit_format=_edit_format(role, base)), *_worker_tools(state))
+    text, error = _revised_text(role, base, response)
+    if error:
+        # A patch that does not apply falls back to a full rewrite; should that still be an
+        # unusable patch, the document is left as it was.
+        response = _invoke_model(role, _prompt_messages(state, role, edit_format=_edit_format(role, base, error)), *_worker_tools(state))
+        text, error = _revised_text(role, base, response)
+    return response, text
+
+
+async def _arevise(state: AgentState, role: str) -> tuple:
+    base = _revision_base(state, role)
+    response = await _ainvoke_model(role, _prompt_messages(state, role, edit_format=_edit_format(role, base)), *_worker_tools(state))
+    text, error = _revised_text(role, base, response)
+    if error:
+        response = await _ainvoke_model(role, _prompt_messages(state, role, edit_format=_edit_format(role, base, error)), *_worker_tools(state))
+        text, error = _revised_text(role, base, response)
+    return response, text
+
+
+def _merged(state: AgentState, response: AIMessage) -> AIMessage | None:
+    """The merger's reply as the Drafter's draft, or None if the provisional draft is to be discarded."""
+    provisional = state["provisional_draft"]
+    if response.tool_calls or (looks_like_patch(response.content) and json_object(response.content).get("discard")):
+        instrumentation.record_speculation("discarded")
+        return None
+    try:
+        edits = parse_patch(response.content)
+        text = apply_patch(provisional, edits) if edits is not None else response.content
+    except PatchError as exc:
+        logger.warning("🩹 Merge of the provisional draft failed, drafting from scratch: %s", exc)
+        instrumentation.record_speculation("failed")
+        return None
+    instrumentation.record_speculation("merged")
+    # The merged text stands in for the Drafter's reply in the history.
+    return response.model_copy(update={"content": text, "name": "drafter"})
+
+
+def _drafting_state(state: AgentState, response: AIMessage, text: str) -> AgentState:
+    logger.debug("📝 Drafter: %s", response.content)
 
     if hasattr(response, "tool_calls") and response.tool_calls:
-        print(f"🔧 USING TOOLS: {[tc['name'] for tc in response.tool_calls]}")
+        logger.info("🔧 USING TOOLS: %s", [tc["name"] for tc in response.tool_calls])
     else:
-        print()
-        print("No Tool call made")
-        print()
+        logger.debug("No Tool call made")
 
     new_state: AgentState = {
-        "messages": list(state["messages"]) + [response],
+        "messages": [response],
         "router": "draft",
         "coordinator_instructions": state.get("coordinator_instructions", ""),
         "research_summary": state.get("research_summary", ""),
-        "draft_text": response.content,
+        "draft_text": text,
         "final_response": state.get("final_response", ""),
+        "history_summary": state.get("history_summary", ""),
+        "summarized_count": state.get("summarized_count", 0),
+        "provisional_draft": "",
     }
     return new_state
 
 
-def editing(state: AgentState) -> AgentState:
-    model, _, model_no_tools = _get_models()
-    system_prompt = SystemMessage(content = f"""
-    You are the Editor Agent in a multi-agent drafting system. Your role is to review and refine the current draft for quality, 
-    focusing on grammar, style, coherence, clarity, and improvements. Provide suggestions and a revised version if needed. Act 
-    as a critical eye to enhance the draft without changing core meaning unless specified.
-
-    Current draft: {state.get('draft_text', '')}
-
-    Key responsibilities:
-    - Review draft: Check for errors (spelling, grammar), flow, consistency, and engagement.
-    - Suggest changes: Output a list of improvements (e.g., "Rephrase sentence X for clarity") followed by the edited draft.
-    - Incorporate feedback: Apply user or Coordinator notes (e.g., "make it more persuasive").
+def drafting(state: AgentState) -> AgentState:
+    if state.get("provisional_draft") and not isinstance(state["messages"][-1], ToolMessage):
+        merged = _merged(state, _invoke_model("merger", _prompt_messages(state, "merger")))
+        if merged is not None:
+            return _drafting_state(state, merged, merged.content)
+    return _drafting_state(state, *_revise(state, "drafter"))
 
-    You are an agent with access to only this tool: web_search, google_scholar. Do not invent or call any other tools, including parse_task, brave_search or 
-    similar. If a task requires decomposition, reason step-by-step in your response instead of using a tool.
 
-    Maintain the original intent and length unless instructed. Do not add new content or research—focus on polishing. If the draft 
-    is already strong, suggest minimal changes.
+async def adrafting(state: AgentState) -> AgentState:
+    if state.get("provisional_draft") and not isinstance(state["messages"][-1], ToolMessage):
+        merged = _merged(state, await _ainvoke_model("merger", _prompt_messages(state, "merger")))
+        if merged is not None:
+            return _drafting_state(state, merged, merged.content)
+    return _drafting_state(state, *await _arevise(state, "drafter"))
 
-    """)
 
-    last_msg = state["messages"][-1]
-    all_messages = [system_prompt] + list(state["messages"])
-    response = model_no_tools.invoke(all_messages) if isinstance(last_msg, ToolMessage) else model.invoke(all_messages)
 
-    print(f"\n📝 Editor: {response.content}")
-    print()
+def _editing_state(state: AgentState, response: AIMessage, text: str) -> AgentState:
+    logger.debug("📝 Editor: %s", response.content)
 
     if hasattr(response, "tool_calls") and response.tool_calls:
-        print(f"🔧 USING TOOLS: {[tc['name'] for tc in response.tool_calls]}")
+        logger.info("🔧 USING TOOLS: %s", [tc["name"] for tc in response.tool_calls])
     else:
-        print()
-        print("No Tool call made")
-        print()
+        logger.debug("No Tool call made")
 
     new_state: AgentState = {
-        "messages": list(state["messages"]) + [response],
+        "messages": [response],
         "router": "edit",
         "coordinator_instructions": state.get("coordinator_instructions", ""),
         "research_summary": state.get("research_summary", ""),
         "draft_text": state.get("draft_text", ""),
-        "final_response": response.content,
+        "final_response": text,
+        "history_summary": state.get("history_summary", ""),
+        "summarized_count": state.get("summarized_count", 0),
     }
     return new_state
 
 
-def build_app():
+def editing(state: AgentState) -> AgentState:
+    return _editing_state(state, *_revise(state, "editor"))
+
+
+async def aediting(state: AgentState) -> AgentState:
+    return _editing_state(state, *await _arevise(state, "editor"))
+
+
+# Per-request limits on node visits, model calls, tokens and wall time (BUDGET_MAX_*).
+RUN_BUDGET = budget.build_run_budget()
+
+BUDGET_LABELS = {
+    "node_visits": "step",
+    "llm_calls": "model call",
+    "tokens": "token",
+    "seconds": "time",
+}
+
+
+def _request_id(state: AgentState) -> str:
+    for i in range(len(state["messages"]) - 1, -1, -1):
+        msg = state["messages"][i]
+        if isinstance(msg, HumanMessage):
+            return msg.id or str(i)
+    return ""
+
+
+def _best_draft(state: AgentState) -> str:
+    # The newest draft or edit of this request, else the document as it stood before it.
+    for msg in reversed(state["messages"]):
+        if isinstance(msg, HumanMessage):
+            break
+        if isinstance(msg, AIMessage) and msg.name in ("drafter", "editor") and not msg.tool_calls and msg.content:
+            if is_patch(msg):
+                # The document it produced is already in the state.
+                return state.get("draft_text" if msg.name == "drafter" else "final_response") or ""
+            return msg.content
+    return state.get("final_response") or state.get("draft_text") or ""
+
+
+def _budget_stop(state: AgentState, update: AgentState, usage: Dict[str, Any]) -> AgentState:
+    reason = usage["exhausted"]
+    state = {**state, **update, "messages": append_messages(state["messages"], update.get("messages", []))}
+    logger.warning("⛔ Request budget exhausted (%s): %s", reason, json.dumps({k: v for k, v in usage.items() if k != "limits"}))
+    instrumentation.record_budget_exhausted(reason)
+    # Unanswered tool calls would make the history invalid for the next request.
+    skipped = [
+        ToolMessage(content="Skipped: the request ran out of budget.", tool_call_id=call.get("id", call.get("name", "tool")))
+        for call in _pending_tool_calls(state)
+    ]
+    draft = _best_draft(state)
+    content = f"I stopped working on this request because it reached its {BUDGET_LABELS.get(reason, reason)} limit."
+    if draft:
+        content += f" Here is the best draft so far:\n\n{draft}"
+    return {
+        **update,
+        "messages": state["messages"] + skipped + [AIMessage(content=content, name="coordinator")],
+        "router": "coordinate",
+        "final_response": draft,
+        "budget": usage,
+    }
+
+
+def _charged(state: AgentState, update: AgentState, meter: budget.Meter, usage: Dict[str, Any]) -> AgentState:
+    usage = budget.charge(usage, meter)
+    if usage["exhausted"]:
+        return _budget_stop(state, update, usage)
+    return {**update, "budget": usage}
+
+
+def _budgeted(func, afunc):
+    # The clock starts before the node runs, so a request's first node counts towards its time.
+    # Tools and searches inside the node are cut off at the request's deadline.
+    def guarded(state: AgentState) -> AgentState:
+        usage = RUN_BUDGET.for_request(state.get("budget"), _request_id(state), time.time())
+        with budget.metering(budget.deadline(usage)) as meter:
+            update = func(state)
+        return _charged(state, update, meter, usage)
+
+    async def aguarded(state: AgentState) -> AgentState:
+        usage = RUN_BUDGET.for_request(state.get("budget"), _request_id(state), time.time())
+        with budget.metering(budget.deadline(usage)) as meter:
+            update = await afunc(state)
+        return _charged(state, update, meter, usage)
+
+    return guarded, aguarded
+
+
+def _within_budget(router):
+    # Once a node has spent the budget the run ends, whatever the router would pick next.
+    def route(state: AgentState) -> str:
+        if state.get("budget", {}).get("exhausted"):
+            return "Budget"
+        return router(state)
+    route.__name__ = router.__name__
+    return route
+
+
+def _node(name: str, func, afunc) -> RunnableLambda:
+    func, afunc = _budgeted(func, afunc)
+    return RunnableLambda(instrumentation.instrument_node(name, func), afunc=instrumentation.instrument_node(name, afunc))
+
+
+def build_app(checkpointer=None, model_pool: ModelPool | None = None, search_clients: Dict[str, Any] | None = None):
+    """Compile the drafting graph.
+
+    ``model_pool`` and ``search_clients`` (engine name -> SerpAPI-style client class)
+    replace MODEL_POOL and the SerpAPI clients for this graph only, e.g. with fakes.
+    """
     graph = StateGraph(AgentState)
-    graph.add_node("Coordinate_node", coordination)
-    graph.add_node("Research_node", research)
-    graph.add_node("Draft_node", drafting)
-    graph.add_node("Edit_node", editing)
+    # Each node carries a sync and an async implementation: graph.stream()/invoke() run the
+    # former, graph.astream()/ainvoke() the latter without blocking the event loop.
+    graph.add_node("Coordinate_node", _node("Coordinate_node", coordination, acoordination))
+    graph.add_node("Research_node", _node("Research_node", research, aresearch))
+    graph.add_node("Draft_node", _node("Draft_node", drafting, adrafting))
+    graph.add_node("Edit_node", _node("Edit_node", editing, aediting))
     # graph.add_node("Tools_node", ToolNode([web_search, google_scholar, save]))
-    graph.add_node("Tools_node", tools_node)
+    graph.add_node("Tools_node", _node("Tools_node", tools_node, atools_node))
 
     graph.set_entry_point("Coordinate_node")
 
     graph.add_conditional_edges(
         "Coordinate_node",
-        should_continue,
+        _within_budget(should_continue),
         {
             "Continue": "Research_node",
+            "Draft": "Draft_node",
+            "Edit": "Edit_node",
             "Save": "Tools_node",
+            "Reply": END,
             "End": END,
+            "Budget": END,
         },
     )
 
     graph.add_conditional_edges(
         "Research_node",
-        should_progress,
-        {"Tool": "Tools_node", "No Tool": "Draft_node"},
+        _within_budget(should_progress),
+        {"Tool": "Tools_node", "No Tool": "Draft_node", "Budget": END},
     )
 
     graph.add_conditional_edges(
         "Draft_node",
-        should_progress,
-        {"Tool": "Tools_node", "No Tool": "Edit_node"},
+        _within_budget(should_progress),
+        {"Tool": "Tools_node", "No Tool": "Edit_node", "Budget": END},
     )
 
     graph.add_conditional_edges(
         "Edit_node",
-        should_progress,
-        {"Tool": "Tools_node", "No Tool": "Coordinate_node"},
+        _within_budget(should_progress),
+        {"Tool": "Tools_node", "No Tool": "Coordinate_node", "Budget": END},
     )
 
     graph.add_conditional_edges(
         "Tools_node",
-        router_func,
+        _within_budget(router_func),
         {
             "coordinate": "Coordinate_node",
             "research": "Research_node",
             "draft": "Draft_node",
             "edit": "Edit_node",
+            "Budget": END,
         },
     )
 
-    return graph.compile()
+    app = graph.compile(checkpointer=checkpointer)
+    overrides = {k: v for k, v in (("model_pool", model_pool), ("search_clients", search_clients)) if v is not None}
+    return app.with_config(configurable=overrides) if overrides else app
 
 
 def serialize_state(state: AgentState) -> Dict[str, Any]:
@@ -435,9 +1076,26 @@ def serialize_state(state: AgentState) -> Dict[str, Any]:
         "research_summary": state.get("research_summary", ""),
         "draft_text": state.get("draft_text", ""),
         "final_response": state.get("final_response", ""),
+        "history_summary": state.get("history_summary", ""),
+        "summarized_count": state.get("summarized_count", 0),
+        "budget": state.get("budget", {}),
+        "provisional_draft": state.get("provisional_draft", ""),
     }
 
 
+def serialize_final(state: AgentState) -> Dict[str, Any]:
+    """The closing event of a delta stream: the state without its history, bar the last message."""
+    return {**serialize_state({**state, "messages": []}), "messages": messages_to_dict(list(state.get("messages", []))[-1:])}
+
+
+def serialize_update(known: AgentState, update: Dict[str, Any]) -> Dict[str, Any]:
+    """Only what a node changed relative to ``known``: differing fields plus appended messages."""
+    known_ids = message_ids(known.get("messages", []))
+    new_messages = [m for m in update.get("messages", []) if not m.id or not known_ids(m.id)]
+    changes = {k: v for k, v in update.items() if k != "messages" and known.get(k) != v}
+    return {"changes": changes, "messages": messages_to_dict(new_messages)}
+
+
 def deserialize_state(payload: Dict[str, Any]) -> AgentState:
     messages_dicts = payload.get("messages", [])
     return {
@@ -447,6 +1105,10 @@ def deserialize_state(payload: Dict[str, Any]) -> AgentState:
         "research_summary": payload.get("research_summary", ""),
         "draft_text": payload.get("draft_text", ""),
         "final_response": payload.get("final_response", ""),
+        "history_summary": payload.get("history_summary", ""),
+        "summarized_count": payload.get("summarized_count", 0),
+        "budget": payload.get("budget", {}),
+        "provisional_draft": payload.get("provisional_draft", ""),
     }
 
 
@@ -458,6 +1120,10 @@ def empty_state() -> AgentState:
         "research_summary": "",
         "draft_text": "",
         "final_response": "",
+        "history_summary": "",
+        "summarized_count": 0,
+        "budget": {},
+        "provisional_draft": "",
     }
 
 
@@ -0,0 +1,236 @@
+"""Bulk drafting: run a JSONL file of requests through the drafting graph.
+
+Each input line is an object with ``user_input`` (or ``request``) and an optional
+``id``; every item runs as a fresh single-turn session. Results are written as JSONL
+in completion order, and each finished item is checkpointed so a rerun of the same
+batch skips it.
+
+Run from ``backend/``::
+
+    python -m batch requests.jsonl --output results.jsonl --concurrency 8
+"""
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from langchain_core.messages import HumanMessage
+
+from admission import AdmissionController, AdmissionRejected
+from agent_logic import ResearchMemo, build_app
+from instrumentation import configure_logging, track_request
+from session_store import build_checkpointer
+from wire import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class BatchItem:
+    item_id: str
+    user_input: str
+
+
+def parse_items(lines: Iterable[str]) -> List[BatchItem]:
+    """Items from JSONL lines; blank lines are skipped, ids default to the line number."""
+    items, seen = [], set()
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            data = loads(line)
+            text = data.get("user_input") or data.get("request")
+        except (ValueError, AttributeError):
+            raise ValueError(f"line {number}: not a JSON object")
+        if not isinstance(text, str) or not text.strip():
+            raise ValueError(f"line {number}: missing user_input")
+        item_id = str(data.get("id", number))
+        if item_id in seen:
+            raise ValueError(f"line {number}: duplicate id {item_id!r}")
+        seen.add(item_id)
+        items.append(BatchItem(item_id, text))
+    return items
+
+
+def batch_key(items: Iterable[BatchItem]) -> str:
+    """Stable id for a batch's contents, so rerunning the same file resumes it."""
+    digest = hashlib.sha256()
+    for item in items:
+        digest.update(dumps([item.item_id, item.user_input]))
+    return digest.hexdigest()[:16]
+
+
+class BatchCheckpoint:
+    """Finished items per batch in SQLite; only successful results are kept, so failures are retried."""
+
+    def __init__(self, path: str = ":memory:"):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS batch_results (batch_id TEXT NOT NULL, item_id TEXT NOT NULL,"
+                " result BLOB NOT NULL, finished REAL NOT NULL, PRIMARY KEY (batch_id, item_id))"
+            )
+            self._db.commit()
+
+    def done(self, batch: str) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute("SELECT item_id, result FROM batch_results WHERE batch_id = ? ORDER BY finished",
+                                    (batch,)).fetchall()
+        return {item_id: loads(result) for item_id, result in rows}
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def record(self, batch: str, result: Dict[str, Any]) -> None:
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO batch_results (batch_id, item_id, result, finished) VALUES (?, ?, ?, ?)",
+                             (batch, result["id"], dumps(result), time.time()))
+            self._db.commit()
+
+
+def checkpoint_path(default: str = ":memory:") -> str:
+    """BATCH_CHECKPOINT_PATH, else batch.sqlite in DATA_DIR, else ``default``."""
+    data_dir = os.getenv("DATA_DIR")
+    return os.getenv("BATCH_CHECKPOINT_PATH") or (os.path.join(data_dir, "batch.sqlite") if data_dir else default)
+
+
+def build_batch_checkpoint() -> BatchCheckpoint:
+    """Checkpoint at ``checkpoint_path()``; without a configured path /batch resumes only within this process."""
+    return BatchCheckpoint(checkpoint_path())
+
+
+def _session_id(batch: str, item: BatchItem) -> str:
+    return f"batch:{batch}:{item.item_id}"
+
+
+@asynccontextmanager
+async def _admitted(admission: Optional[AdmissionController], session_id: str) -> AsyncIterator[None]:
+    # Holds one of the chat slots while an item runs; a full queue or a queue timeout is waited out.
+    if admission is None:
+        yield
+        return
+    while True:
+        try:
+            ticket = admission.enqueue(session_id)
+        except AdmissionRejected as exc:
+            await asyncio.sleep(exc.retry_after)
+            continue
+        try:
+            async for _ in admission.wait(ticket):
+                pass
+        except AdmissionRejected as exc:
+            await asyncio.sleep(exc.retry_after)
+            continue
+        except BaseException:
+            admission.release(ticket)
+            raise
+        break
+    try:
+        yield
+    finally:
+        admission.release(ticket)
+
+
+async def _run_item(graph, batch: str, item: BatchItem, memo: ResearchMemo) -> Dict[str, Any]:
+    session_id = _session_id(batch, item)
+    started = time.perf_counter()
+    with track_request(session_id, mode="batch") as record:
+        try:
+            state = await graph.ainvoke({"messages": [HumanMessage(content=item.user_input)]},
+                                        {"configurable": {"thread_id": session_id, "research_memo": memo}})
+        except Exception as exc:
+            logger.exception("💥 Batch item %s failed", item.item_id)
+            return {"id": item.item_id, "status": "error", "error": str(exc) or type(exc).__name__,
+                    "seconds": round(time.perf_counter() - started, 3)}
+    return {
+        "id": item.item_id,
+        "status": "ok",
+        "draft": state.get("final_response") or state.get("draft_text") or "",
+        "budget_exhausted": state.get("budget", {}).get("exhausted", ""),
+        "model_calls": record.model_calls,
+        "cost_usd": round(record.cost_usd, 6),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+async def run_batch(graph, items: List[BatchItem], concurrency: int = 8, checkpoint: Optional[BatchCheckpoint] = None,
+                    batch: Optional[str] = None, admission: Optional[AdmissionController] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Yield one result per item in completion order; checkpointed items come first, marked ``resumed``.
+
+    At most ``concurrency`` items run at once, and with ``admission`` each of them also
+    holds one of its slots, so batch items and chat turns share the same caps. Items whose research plans ask for the
+    same searches share one research summary (see ``agent_logic.ResearchMemo``); their
+    searches come from the process-wide tool cache, and concurrent identical ones are
+    fetched once.
+    """
+    batch = batch or batch_key(items)
+    finished = checkpoint.done(batch) if checkpoint is not None else {}
+    remaining = [item for item in items if item.item_id not in finished]
+    logger.info("📦 Batch %s: %d items, %d already done", batch, len(items), len(items) - len(remaining))
+    for item in items:
+        if item.item_id in finished:
+            yield {**finished[item.item_id], "resumed": True}
+
+    gate = asyncio.Semaphore(max(1, concurrency))
+    memo = ResearchMemo()
+
+    async def bounded(item: BatchItem) -> Dict[str, Any]:
+        async with gate, _admitted(admission, _session_id(batch, item)):
+            return await _run_item(graph, batch, item, memo)
+
+    tasks: Set[asyncio.Task] = {asyncio.create_task(bounded(item)) for item in remaining}
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            if checkpoint is not None and result["status"] == "ok":
+                checkpoint.record(batch, result)
+            yield result
+        if remaining:
+            logger.info("📦 Batch %s research summaries: %s", batch, memo.stats())
+    finally:
+        # A consumer that stops early (e.g. a dropped /batch client) cancels what is left.
+        for task in tasks:
+            task.cancel()
+
+
+async def _main(args: argparse.Namespace) -> int:
+    with open(args.input) as f:
+        items = parse_items(f)
+    graph = build_app(checkpointer=build_checkpointer("memory"))
+    checkpoint = BatchCheckpoint(args.checkpoint)
+    failed = 0
+    out = open(args.output, "ab") if args.output else sys.stdout.buffer
+    try:
+        async for result in run_batch(graph, items, args.concurrency, checkpoint, args.batch_id):
+            if result.get("resumed") and args.output:
+                continue  # already in the output file from the interrupted run
+            failed += result["status"] != "ok"
+            out.write(dumps(result) + b"\n")
+            out.flush()
+    finally:
+        checkpoint.close()
+        if args.output:
+            out.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    configure_logging()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="JSONL file, one request per line")
+    parser.add_argument("--output", help="append results here (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("BATCH_CONCURRENCY", "8")))
+    # Unlike the API, the CLI checkpoints to the working directory by default so a rerun resumes.
+    parser.add_argument("--checkpoint", default=checkpoint_path("batch.sqlite"))
+    parser.add_argument("--batch-id", help="resume key (default: a hash of the input)")
+    sys.exit(asyncio.run(_main(parser.parse_args())))
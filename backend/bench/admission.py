@@ -0,0 +1,166 @@
+"""Admission control under a burst of /chat requests, plus the shared upstream rate limiters.
+
+A burst of ``--requests`` turns (a few of them on the same session) is sent at once
+against ``--max-active`` slots. Every request must finish, no more than the cap may run
+at once, turns on one session must not overlap, and queued requests must see their
+position on the stream. The model rate limit is then checked against its budget.
+
+Run from ``backend/``::
+
+    python -m bench.admission --requests 40 --max-active 8
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+import httpx
+
+import agent_logic
+import main
+from admission import AdmissionController, AdmissionRejected, RateLimiters, TokenBucket
+from session_store import build_checkpointer
+from wire import decode_lines
+from bench.fakes import ScriptedChatModel, install_fake_models, single_turn_script
+
+
+def _check(label: str, ok: bool, failures: list) -> None:
+    print(f"{'✅' if ok else '❌'} {label}")
+    if not ok:
+        failures.append(label)
+
+
+class TrackedModel(ScriptedChatModel):
+    """Records when each session's model calls run, to detect overlapping turns."""
+
+    spans: dict = {}
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        started = time.perf_counter()
+        result = await super()._agenerate(messages, stop, run_manager, **kwargs)
+        self.spans.setdefault(_session_of(messages), []).append((started, time.perf_counter()))
+        return result
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        started = time.perf_counter()
+        async for chunk in super()._astream(messages, stop, run_manager, **kwargs):
+            yield chunk
+        self.spans.setdefault(_session_of(messages), []).append((started, time.perf_counter()))
+
+
+def _session_of(messages) -> str:
+    for msg in reversed(messages):
+        if msg.type == "human":
+            return str(msg.content).split("|")[0]
+    return ""
+
+
+async def _one(client: httpx.AsyncClient, session_id: str, turn: int) -> dict:
+    resp = await client.post("/chat", json={"session_id": session_id, "user_input": f"{session_id}|turn {turn}"})
+    events = list(decode_lines(resp.content.splitlines())) if resp.status_code == 200 else []
+    return {
+        "status": resp.status_code,
+        "final": bool(events) and events[-1]["event"] == "final",
+        "positions": [e["position"] for e in events if e["event"] == "queued"],
+    }
+
+
+async def burst(requests: int, max_active: int, latency: float, failures: list) -> None:
+    fake = TrackedModel(single_turn_script(), latency=latency)
+    install_fake_models(agent_logic, fake)
+    main.app_graph = agent_logic.build_app(checkpointer=build_checkpointer("memory"))
+    main.ADMISSION = admission = AdmissionController(max_active=max_active, max_per_session=1, max_queue=requests)
+    peak = 0
+
+    async def sample():
+        nonlocal peak
+        while True:
+            peak = max(peak, admission.stats()["active"])
+            await asyncio.sleep(0.005)
+
+    sampler = asyncio.create_task(sample())
+    # The first four requests share a session; the rest each have their own.
+    sessions = ["shared"] * 4 + [f"burst-{i}" for i in range(requests - 4)]
+    transport = httpx.ASGITransport(app=main.api)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        started = time.perf_counter()
+        results = await asyncio.gather(*(_one(client, s, i) for i, s in enumerate(sessions)))
+        wall = time.perf_counter() - started
+    sampler.cancel()
+
+    queued = [r for r in results if r["positions"]]
+    print(f"{requests} requests, {max_active} slots: {wall:.2f}s wall, peak active {peak}, "
+          f"{len(queued)} queued, longest wait started at position {max((r['positions'][0] for r in queued), default=0)}")
+    _check("every request finishes", all(r["status"] == 200 and r["final"] for r in results), failures)
+    _check("never more than the global cap running", peak <= max_active, failures)
+    _check("queued requests see their position count down",
+           bool(queued) and all(r["positions"] == sorted(r["positions"], reverse=True) for r in queued), failures)
+    shared = sorted(fake.spans.get("shared", []))
+    overlaps = sum(1 for (_, end), (start, _) in zip(shared, shared[1:]) if start < end)
+    # Calls within one turn are sequential too, so any overlap means two turns ran at once.
+    _check("turns on one session do not overlap", len(shared) == 4 * 6 and overlaps == 0, failures)
+    _check("slots are all released", admission.stats()["active"] == 0 and admission.stats()["queue_length"] == 0, failures)
+
+
+async def queue_limits(failures: list) -> None:
+    admission = AdmissionController(max_active=1, max_queue=1, queue_timeout=0.2)
+    first = admission.enqueue("a")
+    second = admission.enqueue("b")
+    try:
+        admission.enqueue("c")
+        _check("a full queue rejects", False, failures)
+    except AdmissionRejected as exc:
+        _check("a full queue rejects", exc.reason == "queue_full", failures)
+    try:
+        async for _ in admission.wait(second):
+            pass
+        _check("a queued request times out", False, failures)
+    except AdmissionRejected as exc:
+        _check("a queued request times out", exc.reason == "queue_timeout" and admission.stats()["queue_length"] == 0, failures)
+    admission.release(first)
+    admission.release(first)
+    _check("release is idempotent", admission.stats()["active"] == 0, failures)
+
+    # A session at its limit does not hold up other sessions queued behind it.
+    admission = AdmissionController(max_active=2, max_per_session=1)
+    running = admission.enqueue("busy")
+    blocked = admission.enqueue("busy")
+    other = admission.enqueue("other")
+    _check("waiters skip a session at its limit", other.admitted and not blocked.admitted, failures)
+    admission.release(running)
+    _check("the session's next turn starts when its previous one ends", blocked.admitted, failures)
+    admission.release(other)
+    admission.release(blocked)
+
+
+async def rate_limit(per_minute: float, burst_size: int, calls: int, failures: list) -> None:
+    limiters = RateLimiters({"openai_requests": TokenBucket(per_minute, burst_size)})
+    stamps = []
+
+    async def call():
+        await limiters.aacquire("openai_requests")
+        stamps.append(time.perf_counter())
+
+    started = time.perf_counter()
+    await asyncio.gather(*(call() for _ in range(calls)))
+    elapsed = max(stamps) - started
+    expected = (calls - burst_size) / (per_minute / 60.0)
+    print(f"{calls} calls at {per_minute:.0f}/min with a burst of {burst_size}: {elapsed:.2f}s (expected {expected:.2f}s)")
+    _check("rate limit holds across concurrent callers", expected * 0.9 <= elapsed <= expected + 0.2, failures)
+
+
+def run(requests: int, max_active: int, latency: float) -> int:
+    failures: list = []
+    asyncio.run(queue_limits(failures))
+    asyncio.run(burst(requests, max_active, latency, failures))
+    asyncio.run(rate_limit(1200, 5, 25, failures))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--max-active", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+    sys.exit(run(args.requests, args.max_active, args.latency))
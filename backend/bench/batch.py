@@ -0,0 +1,216 @@
+"""Bulk drafting: bounded concurrency, completion-order results, shared research and resume.
+
+``--items`` requests that all research the same two topics are run through
+``run_batch`` with fake models and a stubbed search taking ``--search-latency``
+seconds. Results must stream back as items finish, never more than
+``--concurrency`` at once; the shared tool cache must fetch each topic once and
+the batch must summarize that research once.
+The batch is then cut off halfway and rerun against the same checkpoint, and the
+``/batch`` endpoint and the CLI are run twice over the same input. Finally ``/batch``
+must share the chat admission slots, and turn batches away with 429 while
+``BATCH_MAX_ACTIVE`` batches run or the admission queue is full.
+
+Run from ``backend/``::
+
+    python -m bench.batch --items 24 --concurrency 6
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+import agent_logic
+import batch
+import main
+from admission import AdmissionController
+from batch import BatchCheckpoint, BatchItem, run_batch
+from session_store import build_checkpointer
+from tool_cache import ToolCache
+from wire import dumps, loads
+from bench.fakes import ScriptedChatModel, _turn_key, install_fake_models, research_turn_script, stub_search
+
+
+def _check(label: str, ok: bool, failures: list) -> None:
+    print(f"{'✅' if ok else '❌'} {label}")
+    if not ok:
+        failures.append(label)
+
+
+def _items(count: int) -> list:
+    # Every third item is slower, so completion order differs from input order.
+    return [BatchItem(f"doc-{i}", f"{'slow ' if i % 3 == 0 else ''}item {i}|Write a thank-you note.") for i in range(count)]
+
+
+class ActiveGauge:
+    """Counts graph runs in flight through a wrapped ``ainvoke``."""
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.active = self.peak = 0
+
+    async def ainvoke(self, *args, **kwargs):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            return await self.graph.ainvoke(*args, **kwargs)
+        finally:
+            self.active -= 1
+
+
+async def scenario(tmp: str, count: int, concurrency: int, search, fake: ScriptedChatModel, failures: list) -> None:
+    graph = agent_logic.build_app(checkpointer=build_checkpointer("memory"),
+                                  search_clients={"google": search, "google_scholar": search})
+    items = _items(count)
+
+    gauge = ActiveGauge(graph)
+    started = time.perf_counter()
+    results = [r async for r in run_batch(gauge, items, concurrency)]
+    wall = time.perf_counter() - started
+    order = [r["id"] for r in results]
+    summaries = fake.calls.get("researcher", 0)
+    print(f"{count} items at concurrency {concurrency}: {wall:.2f}s, peak in flight {gauge.peak}, "
+          f"{search.calls} searches, {summaries} research summaries")
+    _check("every item is drafted", sorted(order) == sorted(i.item_id for i in items)
+           and all(r["status"] == "ok" and r["draft"] for r in results), failures)
+    _check("results stream in completion order, not input order", order != [i.item_id for i in items], failures)
+    _check("no more items run at once than the concurrency limit", gauge.peak <= concurrency, failures)
+    _check("items researching the same topics share searches", search.calls <= 2, failures)
+    _check("items researching the same topics share one research summary",
+           summaries == 1 and all("Sources:" in m.content for m in _research(graph, items)), failures)
+
+    # Cut a checkpointed batch off partway through, then resume it.
+    checkpoint = BatchCheckpoint(os.path.join(tmp, "batch.sqlite"))
+    items = [BatchItem(f"resume-{i}", f"resume {i}|Write a thank-you note.") for i in range(count)]
+    first = []
+    async for result in run_batch(graph, items, concurrency, checkpoint, "resume"):
+        first.append(result["id"])
+        if len(first) == count // 2:
+            break
+    counter = ActiveGauge(graph)
+    calls = 0
+
+    async def counting(*args, **kwargs):
+        nonlocal calls
+        calls += 1
+        return await ActiveGauge.ainvoke(counter, *args, **kwargs)
+
+    counter.ainvoke = counting
+    rest = [r async for r in run_batch(counter, items, concurrency, checkpoint, "resume")]
+    resumed = [r["id"] for r in rest if r.get("resumed")]
+    _check("a resumed batch only runs the items left over",
+           sorted(resumed) == sorted(first) and calls == count - len(first) and len(rest) == count, failures)
+
+    # The same over HTTP: the second request reuses the first one's checkpoint.
+    main.batch_graph = graph
+    main.BATCH_CHECKPOINT = BatchCheckpoint(os.path.join(tmp, "api.sqlite"))
+    body = b"".join(dumps({"id": i.item_id, "user_input": i.user_input}) + b"\n" for i in items)
+    transport = httpx.ASGITransport(app=main.api)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        resp = await client.post("/batch", content=body, params={"concurrency": concurrency})
+        streamed = [loads(line) for line in resp.content.splitlines()]
+        again = await client.post("/batch", content=body)
+        replayed = [loads(line) for line in again.content.splitlines()]
+        bad = await client.post("/batch", content=b'{"id": 1}\n')
+    _check("POST /batch streams one JSON line per item",
+           resp.status_code == 200 and len(streamed) == count and resp.headers["x-batch-id"] == again.headers["x-batch-id"], failures)
+    _check("resending the same batch is served from the checkpoint",
+           all(r.get("resumed") for r in replayed) and len(replayed) == count, failures)
+    _check("a malformed batch is rejected", bad.status_code == 400, failures)
+
+
+async def admission_limits(count: int, concurrency: int, failures: list) -> None:
+    def body(prefix: str) -> bytes:
+        return b"".join(dumps({"id": f"{prefix}-{i}", "user_input": f"{prefix} {i}|Write a thank-you note."}) + b"\n"
+                        for i in range(count))
+
+    main.ADMISSION = admission = AdmissionController(max_active=2, max_queue=count)
+    main.BATCH_MAX_ACTIVE = 1
+    peak = 0
+
+    async def sample():
+        nonlocal peak
+        while True:
+            peak = max(peak, admission.stats()["active"])
+            await asyncio.sleep(0.005)
+
+    sampler = asyncio.create_task(sample())
+    transport = httpx.ASGITransport(app=main.api)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        first = asyncio.create_task(client.post("/batch", content=body("slots"), params={"concurrency": concurrency}))
+        while not main.ACTIVE_BATCHES:
+            await asyncio.sleep(0.005)
+        second = await client.post("/batch", content=body("second"))
+        resp = await first
+        after = await client.post("/batch", content=body("after"))
+        # A full admission queue: one request running and one waiting.
+        main.ADMISSION = AdmissionController(max_active=1, max_queue=1)
+        held = [main.ADMISSION.enqueue("chat-a"), main.ADMISSION.enqueue("chat-b")]
+        saturated = await client.post("/batch", content=body("saturated"))
+        for ticket in held:
+            main.ADMISSION.release(ticket)
+    sampler.cancel()
+    print(f"/batch at concurrency {concurrency} against 2 chat slots: peak {peak} active")
+    _check("batch items hold chat admission slots",
+           resp.status_code == 200 and len(resp.content.splitlines()) == count and 0 < peak <= 2
+           and admission.stats()["active"] == 0, failures)
+    _check("a batch over BATCH_MAX_ACTIVE gets 429 with Retry-After",
+           second.status_code == 429 and "retry-after" in second.headers and after.status_code == 200, failures)
+    _check("a batch is turned away with 429 while the admission queue is full",
+           saturated.status_code == 429 and "retry-after" in saturated.headers, failures)
+
+
+def cli(tmp: str, failures: list) -> None:
+    path, output = os.path.join(tmp, "input.jsonl"), os.path.join(tmp, "output.jsonl")
+    with open(path, "wb") as f:
+        f.write(b"".join(dumps({"user_input": f"cli {i}|Write a thank-you note."}) + b"\n" for i in range(4)))
+    args = argparse.Namespace(input=path, output=output, concurrency=2, checkpoint=os.path.join(tmp, "cli.sqlite"), batch_id=None)
+    first = asyncio.run(batch._main(args))
+    second = asyncio.run(batch._main(args))
+    with open(output, "rb") as f:
+        lines = [loads(line) for line in f.read().splitlines()]
+    _check("the CLI writes every result once, and a rerun adds nothing",
+           first == second == 0 and sorted(r["id"] for r in lines) == ["1", "2", "3", "4"], failures)
+
+
+class SlowItems(ScriptedChatModel):
+    """Takes four times as long for requests marked ``slow``."""
+
+    def _delays(self, messages, reply):
+        first, per_token = super()._delays(messages, reply)
+        return (first * 4 if "slow " in _turn_key(messages) else first), per_token
+
+
+def _research(graph, items: list) -> list:
+    # Each item's cited research summary, from its session's history.
+    messages = []
+    for item in items:
+        history = graph.get_state({"configurable": {"thread_id": f"batch:{batch.batch_key(items)}:{item.item_id}"}}).values["messages"]
+        messages += [m for m in history if m.name == "researcher"]
+    return messages
+
+
+def run(count: int, concurrency: int, latency: float, search_latency: float) -> int:
+    fake = SlowItems(research_turn_script(), latency=latency)
+    install_fake_models(agent_logic, fake)
+    agent_logic.TOOL_CACHE = ToolCache()
+    search = agent_logic.GoogleSearch = agent_logic.GoogleScholarSearch = stub_search(latency=search_latency)
+    failures: list = []
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(scenario(tmp, count, concurrency, search, fake, failures))
+        asyncio.run(admission_limits(count // 2, concurrency, failures))
+        cli(tmp, failures)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=24)
+    parser.add_argument("--concurrency", type=int, default=6)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--search-latency", type=float, default=0.2)
+    args = parser.parse_args()
+    sys.exit(run(args.items, args.concurrency, args.latency, args.search_latency))
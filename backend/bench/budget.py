@@ -0,0 +1,148 @@
+"""Request budgets: a turn that never finishes is stopped at each cap with its best draft.
+
+The scripted coordinator never saves, so every turn loops Coordinate -> Research ->
+Draft -> Edit -> Coordinate until a limit of ``agent_logic.RUN_BUDGET`` trips. Each cap
+is run on the sync and async graphs: the turn must stop at the cap, its final event
+must carry the newest draft, and the next request on the session must start with a
+fresh budget. For the time limit, searches after the first pass take longer than the
+whole budget and must be cut off inside the research node. A slow tool in tools_node
+is checked against the same in-node deadline.
+
+Run from ``backend/``::
+
+    python -m bench.budget --max-seconds 1.0 --search-latency 5
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.tools import tool
+
+import agent_logic
+import budget
+import main
+from budget import RunBudget
+from session_store import build_checkpointer
+from tool_cache import ToolCache
+from bench.fakes import ScriptedChatModel, install_fake_models, research_plan, single_turn_script, stub_search
+
+EDITED = "Dear team,\n\nThank you for all your help this week.\n\nBest regards,\nSam"
+
+
+def _check(label: str, ok: bool, failures: list) -> None:
+    print(f"{'✅' if ok else '❌'} {label}")
+    if not ok:
+        failures.append(label)
+
+
+def looping_script():
+    script = single_turn_script()
+    # No save call: without a budget the turn would go round forever.
+    script["coordinator"] = [AIMessage(content='{"description": "Draft a short thank-you email.", "notes": ""}')]
+    # The first pass drafts without searching, so there is a draft to fall back on; later passes search.
+    script["planner"] = [research_plan(), research_plan(("web", "thank-you email etiquette"), ("scholar", "gratitude at work"))]
+    script["editor"] = [AIMessage(content=EDITED)]
+    return script
+
+
+async def _turn(session_id: str, user_input: str) -> dict:
+    started = time.perf_counter()
+    events = [event async for event in main.turn_events(session_id, user_input)]
+    usages = [payload for event, payload in events if event == "budget"]
+    final = events[-1][1] if events and events[-1][0] == "final" else {}
+    return {"wall": time.perf_counter() - started, "first": usages[0] if usages else {}, "final": final, "usage": final.get("budget", {})}
+
+
+def _stopped_with_draft(turn: dict) -> bool:
+    last = turn["final"].get("messages", [{}])[-1].get("data", {}).get("content", "")
+    return turn["final"].get("final_response") == EDITED and last.endswith(EDITED) and "limit" in last
+
+
+async def capped(mode: str, name: str, limits: RunBudget, counter: str, slack: float, search_latency: float, failures: list) -> None:
+    search = stub_search(latency=search_latency)
+    main.app_graph = agent_logic.build_app(checkpointer=build_checkpointer("memory"),
+                                           search_clients={"google": search, "google_scholar": search})
+    main.EXECUTION_MODE = mode
+    agent_logic.RUN_BUDGET = limits
+    # New prompts per scenario, so the fake plays its script from the start.
+    session = f"budget-{mode}-{counter}"
+    first = await _turn(session, f"Write a thank-you email ({session})")
+    second = await _turn(session, f"Write it again ({session})")
+    cap = getattr(limits, dict(budget.LIMITS)[counter])
+    for label, turn in (("request", first), ("next request", second)):
+        usage = turn["usage"]
+        print(f"{mode:>5} {name:<12} {label:<12} stopped by {usage.get('exhausted') or '-':<11} after {turn['wall']:.2f}s: "
+              f"{usage.get('node_visits')} nodes, {usage.get('llm_calls')} model calls, {usage.get('tokens')} tokens")
+        # Usage is charged after each node, so a cap is overshot by at most one node's share.
+        _check(f"{mode}: {label} stops at the {name} cap",
+               usage.get("exhausted") == counter and cap <= usage.get(counter, 0) <= cap + slack, failures)
+        _check(f"{mode}: {label} ends with the best draft after hitting the {name} cap", _stopped_with_draft(turn), failures)
+    _check(f"{mode}: the request after a {name} stop starts with a fresh budget",
+           second["first"].get("request_id") != first["usage"].get("request_id")
+           and second["first"].get("node_visits") == 1 and not second["first"].get("exhausted"), failures)
+    if counter == "seconds":
+        _check(f"{mode}: slow searches are cut off at the time limit",
+               all(turn["wall"] < cap + slack for turn in (first, second)), failures)
+
+
+@tool
+def stalled_tool(query: str) -> str:
+    """Stub tool that answers long after any deadline."""
+    time.sleep(5)
+    return f"results for {query}"
+
+
+async def _timed_atools_node(state) -> tuple:
+    # Timed inside the loop: asyncio.run() also waits for the abandoned call's thread on the way out.
+    started = time.perf_counter()
+    result = await agent_logic.atools_node(state)
+    return result, time.perf_counter() - started
+
+
+def tool_deadline(seconds: float, failures: list) -> None:
+    agent_logic.TOOLS_BY_NAME[stalled_tool.name] = stalled_tool
+    call = {"name": stalled_tool.name, "args": {"query": "late"}, "id": "call_late"}
+    state = {"messages": [HumanMessage(content="research"), AIMessage(content="", tool_calls=[call])], "router": "research"}
+    for mode in ("sync", "async"):
+        # The tool timeout is far off; only the request's deadline can cut the call short.
+        with budget.metering(time.time() + seconds):
+            if mode == "sync":
+                started = time.perf_counter()
+                result = agent_logic.tools_node(state)
+                elapsed = time.perf_counter() - started
+            else:
+                result, elapsed = asyncio.run(_timed_atools_node(state))
+        print(f"{mode:>5} tools_node with {seconds:g}s of budget left: {elapsed:.2f}s")
+        _check(f"{mode}: a tool call stops at the request deadline",
+               elapsed < seconds + 0.2 and "timed out" in result["messages"][-1].content, failures)
+
+
+def run(max_seconds: float, search_latency: float, latency: float) -> int:
+    fake = ScriptedChatModel(looping_script(), latency=latency)
+    install_fake_models(agent_logic, fake)
+    agent_logic.TOOL_CACHE = ToolCache(bypass=True)
+    agent_logic.TOOL_TIMEOUT_SECONDS = 30.0
+    failures: list = []
+    # name, limits, the counter that must trip, how far past its cap it may end, search latency
+    budgets = (
+        ("step", RunBudget(max_node_visits=6, max_llm_calls=0, max_tokens=0, max_seconds=0), "node_visits", 0, 0.0),
+        ("model call", RunBudget(max_node_visits=0, max_llm_calls=8, max_tokens=0, max_seconds=0), "llm_calls", 3, 0.0),
+        ("token", RunBudget(max_node_visits=0, max_llm_calls=0, max_tokens=4000, max_seconds=0), "tokens", 3000, 0.0),
+        ("time", RunBudget(max_node_visits=0, max_llm_calls=0, max_tokens=0, max_seconds=max_seconds), "seconds", 0.5, search_latency),
+    )
+    for mode in ("sync", "async"):
+        for name, limits, counter, slack, latency in budgets:
+            asyncio.run(capped(mode, name, limits, counter, slack, latency, failures))
+    tool_deadline(max_seconds / 2, failures)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-seconds", type=float, default=1.0)
+    parser.add_argument("--search-latency", type=float, default=5.0)
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+    sys.exit(run(args.max_seconds, args.search_latency, args.latency))
@@ -0,0 +1,91 @@
+"""Load test: concurrent /chat turns must overlap instead of queueing on the event loop.
+
+Every fake model call sleeps ``--latency`` seconds, so one turn costs about five model
+latencies. With a non-blocking handler, ``--concurrency`` turns should finish in roughly
+the time of one; the ``blocking`` baseline replays the old behaviour of iterating the
+synchronous ``app_graph.stream()`` inside the async handler.
+
+A turn also spends CPU time (graph, checkpointer, budget and instrumentation) that
+holds the GIL and cannot overlap, so the overlap never reaches ``--concurrency``.
+Single samples swing by a turn's worth of that CPU time, so each mode is measured over
+``--rounds`` rounds and judged by its median.
+
+Run from ``backend/``::
+
+    python -m bench.concurrency --concurrency 8 --latency 0.05 --rounds 5
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+import httpx
+
+import agent_logic
+import main
+from session_store import build_checkpointer
+from bench.fakes import ScriptedChatModel, install_fake_models, single_turn_script
+
+
+async def _blocking_steps(graph_input, config, stream_mode="values"):
+    for step in main.app_graph.stream(graph_input, config, stream_mode=stream_mode):
+        yield step
+
+
+async def _one_turn(client: httpx.AsyncClient, turn: str) -> float:
+    started = time.perf_counter()
+    resp = await client.post("/chat", json={"session_id": f"bench-{time.time_ns()}", "user_input": f"Write a thank-you email #{turn}"})
+    resp.raise_for_status()
+    return time.perf_counter() - started
+
+
+async def _run_mode(mode: str, concurrency: int, rounds: int, fake: ScriptedChatModel) -> dict:
+    fake.reset()
+    main.EXECUTION_MODE = mode
+    graph_steps = main.graph_steps
+    if mode == "blocking":
+        main.graph_steps = _blocking_steps
+    try:
+        transport = httpx.ASGITransport(app=main.api)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            await _one_turn(client, "warm-up")
+            singles, walls, latencies = [], [], []
+            # The fake plays its script once per prompt, so every turn asks something new.
+            for r in range(rounds):
+                singles.append(await _one_turn(client, f"{r}-single"))
+                started = time.perf_counter()
+                latencies += await asyncio.gather(*(_one_turn(client, f"{r}-{i}") for i in range(concurrency)))
+                walls.append(time.perf_counter() - started)
+    finally:
+        main.graph_steps = graph_steps
+    single, wall = statistics.median(singles), statistics.median(walls)
+    # 1.0 means turns ran back to back; `concurrency` means they fully overlapped.
+    overlap = concurrency * single / wall
+    return {"mode": mode, "wall": wall, "single_turn": single, "mean_turn": sum(latencies) / len(latencies), "overlap": overlap}
+
+
+def run(concurrency: int, latency: float, rounds: int) -> int:
+    fake = ScriptedChatModel(single_turn_script(), latency=latency)
+    install_fake_models(agent_logic, fake)
+    main.app_graph = agent_logic.build_app(checkpointer=build_checkpointer("memory"))
+
+    results = [asyncio.run(_run_mode(mode, concurrency, rounds, fake)) for mode in ("blocking", "sync", "async")]
+    for r in results:
+        print(f"{r['mode']:>8}: single_turn={r['single_turn']:.3f}s wall={r['wall']:.3f}s mean_turn={r['mean_turn']:.3f}s overlap={r['overlap']:.2f}x")
+
+    # Both non-blocking modes must overlap at least half of the requested concurrency.
+    failed = [r["mode"] for r in results if r["mode"] != "blocking" and r["overlap"] < concurrency / 2]
+    if failed:
+        print(f"❌ requests did not overlap in mode(s): {', '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    sys.exit(run(args.concurrency, args.latency, args.rounds))
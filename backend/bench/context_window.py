@@ -0,0 +1,110 @@
+"""Replays a long session and reports prompt tokens per node with and without the context window.
+
+Run from ``backend/``::
+
+    python -m bench.context_window --turns 30
+"""
+import argparse
+import statistics
+import sys
+from typing import Dict, List
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+import agent_logic
+from budget import RunBudget
+from context_window import ContextWindow, build_context_window
+from session_store import build_checkpointer
+from tool_cache import ToolCache
+from bench.fakes import ScriptedChatModel, install_fake_models, research_plan, save_call
+
+PARAGRAPH = (
+    "Renewable energy adoption has accelerated as solar and wind costs fell sharply over the past decade, "
+    "while grid operators invested in storage and transmission to absorb variable supply. "
+)
+
+
+class BulkySearch:
+    """SerpAPI stand-in returning result pages about the size of real organic snippets."""
+
+    def __init__(self, params):
+        self.params = params
+
+    def get_dict(self):
+        return {"organic_results": [{"title": self.params["q"], "snippet": PARAGRAPH * 12, "link": "https://example.org"}]}
+
+
+def long_session_script() -> Dict[str, List[AIMessage]]:
+    return {
+        "coordinator": [
+            AIMessage(content='{"description": "Revise the essay on renewable energy as requested.", "notes": ""}'),
+            # A turn only ends once the coordinator saves.
+            save_call("essay"),
+        ],
+        "planner": [research_plan(("web", "renewable energy"))],
+        "researcher": [AIMessage(content="- " + PARAGRAPH * 2)],
+        "drafter": [AIMessage(content=PARAGRAPH * 15)],
+        "editor": [AIMessage(content="Edits applied.\n\n" + PARAGRAPH * 15)],
+        "summarizer": [AIMessage(content="The user is iterating on an essay about renewable energy. " * 8)],
+    }
+
+
+class CheckedModel(ScriptedChatModel):
+    """Also verifies that every ToolMessage in a prompt answers a tool call sent before it."""
+
+    orphans: int = 0
+
+    def _next(self, messages):
+        open_calls = set()
+        for msg in messages:
+            if isinstance(msg, AIMessage):
+                open_calls |= {tc["id"] for tc in msg.tool_calls}
+            elif isinstance(msg, ToolMessage) and msg.tool_call_id not in open_calls:
+                self.orphans += 1
+        return super()._next(messages)
+
+
+def replay(window: ContextWindow, turns: int) -> CheckedModel:
+    fake = CheckedModel(long_session_script())
+    install_fake_models(agent_logic, fake)
+    agent_logic.CONTEXT_WINDOW = window
+    graph = agent_logic.build_app(checkpointer=build_checkpointer("memory"))
+    config = {"configurable": {"thread_id": "long-session"}}
+    for turn in range(turns):
+        graph.invoke({"messages": [HumanMessage(content=f"Revision {turn}: tighten the second paragraph.")]}, config)
+    return fake
+
+
+def run(turns: int) -> int:
+    agent_logic.GoogleSearch = agent_logic.GoogleScholarSearch = BulkySearch
+    # Unbounded, so the full-history baseline is not cut short by the per-request token budget.
+    agent_logic.RUN_BUDGET = RunBudget(max_node_visits=0, max_llm_calls=0, max_tokens=0, max_seconds=0)
+    agent_logic.TOOL_CACHE = ToolCache()
+    before = replay(ContextWindow(enabled=False), turns)
+    after = replay(build_context_window(), turns)
+
+    print(f"{'role':<12}{'calls':>7}{'mean before':>13}{'mean after':>12}{'last before':>13}{'last after':>12}")
+    for role in ("coordinator", "researcher", "drafter", "editor", "summarizer"):
+        b, a = before.prompt_tokens.get(role, []), after.prompt_tokens.get(role, [])
+        print(f"{role:<12}{len(a):>7}{statistics.mean(b) if b else 0:>13.0f}{statistics.mean(a) if a else 0:>12.0f}"
+              f"{b[-1] if b else 0:>13}{a[-1] if a else 0:>12}")
+    total_before = sum(sum(v) for v in before.prompt_tokens.values())
+    total_after = sum(sum(v) for v in after.prompt_tokens.values())
+    print(f"total prompt tokens over {turns} turns: {total_before} -> {total_after} "
+          f"({1 - total_after / total_before:.0%} fewer, summarizer included)")
+
+    failures = 0
+    if after.orphans or before.orphans:
+        failures += 1
+        print(f"❌ {after.orphans} ToolMessages without a matching tool call")
+    budget = max(agent_logic.MODEL_POOL.config(role).context_tokens for role in ("coordinator", "researcher", "drafter", "editor"))
+    if max(max(v) for role, v in after.prompt_tokens.items() if role != "summarizer") > budget:
+        failures += 1
+        print(f"❌ a prompt exceeded the {budget}-token budget")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=30)
+    sys.exit(run(parser.parse_args().turns))
@@ -0,0 +1,394 @@
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Sequence, Tuple
+from pydantic import Field
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from admission import RateLimiters
+from model_pool import ModelPool
+from context_window import count_tokens
+
+
+# First line of each node's system prompt -> agent role.
+ROLE_MARKERS = {
+    "Coordinator Agent": "coordinator",
+    "Research Planner": "planner",
+    "Researcher Agent": "researcher",
+    "Drafter Agent": "drafter",
+    "Editor Agent": "editor",
+    "running summary of a conversation": "summarizer",
+    "Draft Merger": "merger",
+}
+
+
+def role_of(messages: Sequence[BaseMessage]) -> str:
+    for msg in messages:
+        if isinstance(msg, SystemMessage):
+            for marker, role in ROLE_MARKERS.items():
+                if marker in msg.content:
+                    return role
+    return "unknown"
+
+
+def save_call(filename: str = "draft") -> AIMessage:
+    return AIMessage(
+        content="",
+        tool_calls=[{"name": "save", "args": {"filename": filename}, "id": "call_save"}],
+    )
+
+
+def research_plan(*queries: Tuple[str, str]) -> AIMessage:
+    """A planner reply searching each ``(source, query)``; none plans no searches."""
+    return AIMessage(content=json.dumps({"queries": [{"query": q, "source": source} for source, q in queries]}))
+
+
+def single_turn_script() -> Dict[str, List[AIMessage]]:
+    """Coordinator -> Research -> Draft -> Edit -> Coordinator(save) -> Tools -> END."""
+    return {
+        "coordinator": [
+            AIMessage(content='{"description": "Draft a short thank-you email.", "notes": ""}'),
+            save_call(),
+        ],
+        "planner": [research_plan()],
+        "researcher": [AIMessage(content="- Thank-you emails should be brief and specific.")],
+        "drafter": [AIMessage(content="Dear team,\n\nThank you for your help this week.\n\nBest,\nSam")],
+        "editor": [AIMessage(content="Dear team,\n\nThank you for all your help this week.\n\nBest regards,\nSam")],
+    }
+
+
+def _turn_key(messages: Sequence[BaseMessage]) -> str:
+    for msg in reversed(messages):
+        if isinstance(msg, HumanMessage):
+            return str(msg.content)
+    return ""
+
+
+def _tokens(text: str) -> List[str]:
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Stand-in for a bound chat model that replays scripted replies per agent role.
+
+    Scripts are consumed per role and per turn (keyed on the latest user message), so
+    concurrent conversations do not steal each other's replies. Once a script is
+    exhausted its last reply repeats. Every call spends ``latency`` seconds before its
+    first token and ``token_latency`` seconds per further whitespace-delimited token;
+    when LangGraph streams messages the reply is emitted token by token. The size of
+    every prompt is recorded per role in ``prompt_tokens``. With ``prefix_cache`` the
+    replies report usage like a provider with automatic prompt-prefix caching: the
+    longest previously seen message prefix counts as cached once it reaches 1024 tokens.
+    """
+
+    script: Dict[str, List[AIMessage]]
+    latency: float = 0.0
+    token_latency: float = 0.0
+    calls: Dict[str, int] = Field(default_factory=dict)
+    positions: Dict[Tuple[str, str], int] = Field(default_factory=dict)
+    prompt_tokens: Dict[str, List[int]] = Field(default_factory=dict)
+    prefix_cache: bool = False
+    seen_prefixes: set = Field(default_factory=set)
+
+    def __init__(self, script: Dict[str, List[AIMessage]], latency: float = 0.0, **kwargs: Any):
+        super().__init__(script=script, latency=latency, **kwargs)
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def reset(self) -> None:
+        self.calls.clear()
+        self.positions.clear()
+        self.prompt_tokens.clear()
+        self.seen_prefixes.clear()
+
+    def _next(self, messages: Sequence[BaseMessage]) -> AIMessage:
+        role = role_of(messages)
+        key = (role, _turn_key(messages))
+        index = self.positions.get(key, 0)
+        self.positions[key] = index + 1
+        self.calls[role] = self.calls.get(role, 0) + 1
+        self.prompt_tokens.setdefault(role, []).append(count_tokens(messages))
+        replies = self.script.get(role) or [AIMessage(content="")]
+        reply = replies[min(index, len(replies) - 1)].model_copy(deep=True)
+        if self.prefix_cache:
+            reply.usage_metadata = self._cached_usage(messages, reply)
+        return reply
+
+    def _cached_usage(self, messages: Sequence[BaseMessage], reply: AIMessage) -> Dict[str, Any]:
+        digest, cached_upto, prefixes = hashlib.sha256(), 0, []
+        for i, msg in enumerate(messages):
+            digest.update(json.dumps([msg.type, msg.content, getattr(msg, "tool_calls", None)], default=str).encode())
+            prefixes.append(digest.hexdigest())
+            if prefixes[-1] in self.seen_prefixes:
+                cached_upto = i + 1
+        self.seen_prefixes.update(prefixes)
+        input_tokens = count_tokens(messages)
+        cached = count_tokens(messages[:cached_upto])
+        cached = cached if cached >= 1024 else 0
+        output_tokens = len(_tokens(str(reply.content)))
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+            "input_token_details": {"cache_read": cached},
+        }
+
+    def _chunks(self, reply: AIMessage) -> Iterator[ChatGenerationChunk]:
+        tool_call_chunks = [
+            {"name": tc["name"], "args": json.dumps(tc["args"]), "id": tc["id"], "index": i}
+            for i, tc in enumerate(reply.tool_calls)
+        ]
+        tokens = _tokens(str(reply.content)) or [""]
+        for i, token in enumerate(tokens):
+            chunk = AIMessageChunk(
+                content=token,
+                tool_call_chunks=tool_call_chunks if i == 0 else [],
+                usage_metadata=reply.usage_metadata if i == len(tokens) - 1 else None,
+            )
+            yield ChatGenerationChunk(message=chunk)
+
+    def _delays(self, messages: Sequence[BaseMessage], reply: AIMessage) -> Tuple[float, float]:
+        """Seconds before the first token and per further token of ``reply``."""
+        return self.latency, self.token_latency
+
+    def _total_delay(self, messages: Sequence[BaseMessage], reply: AIMessage) -> float:
+        first, per_token = self._delays(messages, reply)
+        return first + per_token * max(0, len(_tokens(str(reply.content))) - 1)
+
+    def bind_tools(self, tools, tool_choice=None, **kwargs) -> "ScriptedChatModel":
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        reply = self._next(messages)
+        time.sleep(self._total_delay(messages, reply))
+        return ChatResult(generations=[ChatGeneration(message=reply)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        reply = self._next(messages)
+        await asyncio.sleep(self._total_delay(messages, reply))
+        return ChatResult(generations=[ChatGeneration(message=reply)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        reply = self._next(messages)
+        first, per_token = self._delays(messages, reply)
+        time.sleep(first)
+        for i, chunk in enumerate(self._chunks(reply)):
+            if i:
+                time.sleep(per_token)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        reply = self._next(messages)
+        first, per_token = self._delays(messages, reply)
+        await asyncio.sleep(first)
+        for i, chunk in enumerate(self._chunks(reply)):
+            if i:
+                await asyncio.sleep(per_token)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+WORDS = (
+    "the report covers revenue growth hiring plans product roadmap customer feedback and market trends "
+    "across regions with clear recommendations for next quarter based on recent research findings"
+).split()
+
+
+def synthetic_text(rng: random.Random, tokens: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(max(1, tokens)))
+
+
+@dataclass(frozen=True)
+class RoleProfile:
+    """Latency and reply-length distribution of one agent role.
+
+    Time to first token is log-normal around ``latency``; text replies are
+    ``tokens`` words on average (normal, ``token_spread`` relative spread). With
+    ``tokens=0`` the scripted content is kept, e.g. the coordinator's JSON.
+    """
+
+    latency: float = 0.0
+    jitter: float = 0.0
+    token_latency: float = 0.0
+    tokens: int = 0
+    token_spread: float = 0.0
+
+
+DEFAULT_PROFILES: Dict[str, RoleProfile] = {
+    "coordinator": RoleProfile(latency=0.4, jitter=0.3, token_latency=0.005),
+    "planner": RoleProfile(latency=0.4, jitter=0.3, token_latency=0.005),
+    "researcher": RoleProfile(latency=0.6, jitter=0.3, token_latency=0.005, tokens=250, token_spread=0.3),
+    "drafter": RoleProfile(latency=0.5, jitter=0.3, token_latency=0.005, tokens=400, token_spread=0.3),
+    "editor": RoleProfile(latency=0.5, jitter=0.3, token_latency=0.005, tokens=400, token_spread=0.3),
+    "summarizer": RoleProfile(latency=0.5, jitter=0.3, token_latency=0.005, tokens=200, token_spread=0.2),
+}
+
+
+class SyntheticChatModel(ScriptedChatModel):
+    """Scripted tool calls and routing with sampled latency and reply lengths per role.
+
+    Sampling uses one seeded RNG, so a run is reproducible for a fixed ``seed`` and
+    call order; roles without a profile fall back to ``latency``/``token_latency``.
+    """
+
+    profiles: Dict[str, RoleProfile] = Field(default_factory=dict)
+    seed: int = 0
+    rng: Any = None
+    rng_lock: Any = None
+
+    def __init__(self, script: Dict[str, List[AIMessage]], profiles: Dict[str, RoleProfile] | None = None, seed: int = 0, **kwargs: Any):
+        super().__init__(
+            script,
+            profiles=DEFAULT_PROFILES if profiles is None else profiles,
+            seed=seed,
+            rng=random.Random(seed),
+            rng_lock=threading.Lock(),
+            **kwargs,
+        )
+
+    def reset(self) -> None:
+        super().reset()
+        self.rng.seed(self.seed)
+
+    def _next(self, messages: Sequence[BaseMessage]) -> AIMessage:
+        reply = super()._next(messages)
+        profile = self.profiles.get(role_of(messages))
+        if profile and profile.tokens and not reply.tool_calls:
+            with self.rng_lock:
+                tokens = round(self.rng.gauss(profile.tokens, profile.tokens * profile.token_spread))
+                reply.content = synthetic_text(self.rng, tokens)
+            if self.prefix_cache:
+                reply.usage_metadata = self._cached_usage(messages, reply)
+        return reply
+
+    def _delays(self, messages: Sequence[BaseMessage], reply: AIMessage) -> Tuple[float, float]:
+        profile = self.profiles.get(role_of(messages))
+        if profile is None:
+            return super()._delays(messages, reply)
+        with self.rng_lock:
+            first = profile.latency * self.rng.lognormvariate(0.0, profile.jitter) if profile.jitter else profile.latency
+        return first, profile.token_latency
+
+
+def stub_search(latency: float = 0.0, jitter: float = 0.0, snippet_tokens: int = 60, results: int = 3, seed: int = 0) -> type:
+    """A SerpAPI-style client class with sampled latency and synthetic organic results.
+
+    Pass it to ``build_app(search_clients={"google": cls, "google_scholar": cls})``.
+    """
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    class StubSearch:
+        calls = 0
+
+        def __init__(self, params: Dict[str, Any]):
+            self.params = params
+
+        def get_dict(self) -> Dict[str, Any]:
+            with lock:
+                StubSearch.calls += 1
+                delay = latency * rng.lognormvariate(0.0, jitter) if jitter else latency
+                snippets = [synthetic_text(rng, snippet_tokens) for _ in range(results)]
+            time.sleep(delay)
+            query = self.params.get("q", "")
+            return {
+                "organic_results": [
+                    {"title": f"{query} ({i + 1})", "snippet": snippet, "link": f"https://example.org/{query.replace(' ', '-')}/{i + 1}"}
+                    for i, snippet in enumerate(snippets)
+                ]
+            }
+
+    return StubSearch
+
+
+def research_turn_script() -> Dict[str, List[AIMessage]]:
+    """Like ``single_turn_script`` but research fans out over a web and a scholar search."""
+    script = single_turn_script()
+    script["planner"] = [research_plan(("web", "thank-you email etiquette"), ("scholar", "gratitude at work"))]
+    return script
+
+
+def history_turns(turns: int, rng: random.Random, draft_tokens: int = 300) -> Tuple[List[BaseMessage], str]:
+    """A finished conversation of ``turns`` full turns and its latest draft, for seeding sessions."""
+    messages: List[BaseMessage] = []
+    draft = ""
+    for turn in range(turns):
+        draft = synthetic_text(rng, draft_tokens)
+        messages += [
+            HumanMessage(content=f"Earlier request {turn}: {synthetic_text(rng, 30)}"),
+            AIMessage(content='{"description": "Research and draft the request.", "notes": ""}', name="coordinator"),
+            AIMessage(content="", name="researcher", tool_calls=[{"name": "web_search", "args": {"query": f"topic {turn}"}, "id": f"call_web_{turn}"}]),
+            ToolMessage(content=synthetic_text(rng, 120), name="web_search", tool_call_id=f"call_web_{turn}"),
+            AIMessage(content=synthetic_text(rng, 150), name="researcher"),
+            AIMessage(content=synthetic_text(rng, draft_tokens), name="drafter"),
+            AIMessage(content=draft, name="editor"),
+            AIMessage(content="", name="coordinator", tool_calls=[{"name": "save", "args": {"filename": f"draft{turn}"}, "id": f"call_save_{turn}"}]),
+            ToolMessage(content=f"Saved draft{turn}.txt", name="save", tool_call_id=f"call_save_{turn}"),
+        ]
+    return messages, draft
+
+
+def disable_rate_limits(agent_logic) -> None:
+    """Fakes and stub searches are not subject to upstream rate limits; benches measure the graph."""
+    agent_logic.RATE_LIMITS = agent_logic.MODEL_INVOKER.limiters = RateLimiters({})
+
+
+def install_fake_models(agent_logic, fake: ScriptedChatModel) -> None:
+    agent_logic.MODEL_POOL = ModelPool(factory=lambda role, config: fake)
+    disable_rate_limits(agent_logic)
+
+
+def count_node_calls(agent_logic, counts: Dict[str, int]) -> Callable[[], None]:
+    """Wrap the graph's node functions so every execution is tallied in ``counts``.
+
+    Sync and async variants of a node share one tally. Must be called before
+    ``build_app()``. Returns a function restoring the originals.
+    """
+    names = {
+        "coordination": "acoordination",
+        "research": "aresearch",
+        "drafting": "adrafting",
+        "editing": "aediting",
+        "tools_node": "atools_node",
+    }
+    originals = {}
+    for name, async_name in names.items():
+        originals[name] = getattr(agent_logic, name)
+        originals[async_name] = getattr(agent_logic, async_name)
+
+    def wrap(name, func):
+        def counted(state):
+            counts[name] = counts.get(name, 0) + 1
+            return func(state)
+        counted.__name__ = func.__name__
+        counted.__annotations__ = func.__annotations__
+        return counted
+
+    def awrap(name, func):
+        async def counted(state):
+            counts[name] = counts.get(name, 0) + 1
+            return await func(state)
+        counted.__name__ = func.__name__
+        counted.__annotations__ = func.__annotations__
+        return counted
+
+    for name, async_name in names.items():
+        setattr(agent_logic, name, wrap(name, originals[name]))
+        setattr(agent_logic, async_name, awrap(name, originals[async_name]))
+
+    def restore() -> None:
+        for name, func in originals.items():
+            setattr(agent_logic, name, func)
+
+    return restore
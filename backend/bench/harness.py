@@ -0,0 +1,162 @@
+"""Offline load harness: /chat latency, throughput and bytes across concurrency and history length.
+
+The graph comes from ``build_app()`` with a synthetic model pool and stubbed search
+clients (see ``bench.fakes``), so runs need no API keys and are reproducible for a
+given ``--seed``. Every (concurrency, history) cell seeds one session per worker with
+``history`` finished turns, then the workers send ``--requests`` turns between them
+through an in-process ASGI client. Latency is measured to the end of the response;
+httpx's ASGI transport buffers bodies, so time to first token is left to ``bench.ttft``.
+
+Run from ``backend/``::
+
+    python -m bench.harness --concurrency 1 4 16 --history 0 5 20 --json bench-results.json
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+import agent_logic
+import main
+from model_pool import ModelPool
+from session_store import build_checkpointer
+from tool_cache import ToolCache
+from wire import decode_lines
+from bench.fakes import DEFAULT_PROFILES, RoleProfile, SyntheticChatModel, disable_rate_limits, history_turns, research_turn_script, stub_search
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = (len(ordered) - 1) * q
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def scaled_profiles(scale: float) -> Dict[str, RoleProfile]:
+    return {
+        role: RoleProfile(p.latency * scale, p.jitter, p.token_latency * scale, p.tokens, p.token_spread)
+        for role, p in DEFAULT_PROFILES.items()
+    }
+
+
+def build_graph(args: argparse.Namespace, seed: int):
+    fake = SyntheticChatModel(research_turn_script(), profiles=scaled_profiles(args.latency_scale), seed=seed)
+    search = stub_search(latency=args.tool_latency, jitter=0.3, seed=seed)
+    disable_rate_limits(agent_logic)
+    return agent_logic.build_app(
+        checkpointer=build_checkpointer("memory"),
+        model_pool=ModelPool(factory=lambda role, config: fake),
+        search_clients={"google": search, "google_scholar": search},
+    )
+
+
+async def _worker(client: httpx.AsyncClient, session_id: str, turns: int, stream: str, samples: List[Dict[str, Any]]) -> None:
+    for turn in range(turns):
+        started = time.perf_counter()
+        try:
+            resp = await client.post("/chat", json={"session_id": session_id, "user_input": f"Revise it, pass {turn} ({session_id})", "stream": stream})
+            events = list(decode_lines(resp.content.splitlines()))
+            # A failed graph run ends the stream before its closing "final" event.
+            ok = resp.status_code == 200 and bool(events) and events[-1]["event"] == "final"
+            size = len(resp.content)
+        except Exception:
+            ok, size = False, 0
+        samples.append({"seconds": time.perf_counter() - started, "bytes": size, "ok": ok})
+
+
+async def run_cell(args: argparse.Namespace, concurrency: int, history: int) -> Dict[str, Any]:
+    seed = args.seed + 1000 * concurrency + history
+    main.app_graph = build_graph(args, seed)
+    rng = random.Random(seed)
+    sessions = [f"harness-{concurrency}-{history}-{i}" for i in range(concurrency)]
+    for session_id in sessions:
+        messages, draft = history_turns(history, rng)
+        if messages:
+            main.app_graph.update_state(
+                main.session_config(session_id),
+                {"messages": messages, "draft_text": draft, "final_response": draft},
+                as_node="Coordinate_node",
+            )
+    # Spread the requests over the workers; the first ones take the remainder.
+    shares = [args.requests // concurrency + (i < args.requests % concurrency) for i in range(concurrency)]
+    samples: List[Dict[str, Any]] = []
+    transport = httpx.ASGITransport(app=main.api)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            _worker(client, session_id, share, args.stream, samples)
+            for session_id, share in zip(sessions, shares) if share
+        ))
+        wall = time.perf_counter() - started
+    latencies = [s["seconds"] for s in samples if s["ok"]]
+    total_bytes = sum(s["bytes"] for s in samples)
+    return {
+        "concurrency": concurrency,
+        "history_turns": history,
+        "requests": len(samples),
+        "errors": sum(not s["ok"] for s in samples),
+        "wall_seconds": round(wall, 4),
+        "requests_per_second": round(len(samples) / wall, 3) if wall else 0.0,
+        "latency_seconds": {
+            "mean": round(statistics.fmean(latencies), 4) if latencies else 0.0,
+            "p50": round(percentile(latencies, 0.50), 4),
+            "p95": round(percentile(latencies, 0.95), 4),
+            "p99": round(percentile(latencies, 0.99), 4),
+            "max": round(max(latencies, default=0.0), 4),
+        },
+        "bytes_streamed": total_bytes,
+        "bytes_per_request": round(total_bytes / len(samples)) if samples else 0,
+    }
+
+
+def run(args: argparse.Namespace) -> int:
+    main.EXECUTION_MODE = args.execution
+    # Every cell should pay for its searches unless the cache itself is under test.
+    agent_logic.TOOL_CACHE = ToolCache(bypass=not args.tool_cache)
+    results = []
+    print(f"{'conc':>5} {'hist':>5} {'reqs':>5} {'err':>4} {'req/s':>7} {'p50':>7} {'p95':>7} {'p99':>7} {'KB/req':>8}")
+    for concurrency in args.concurrency:
+        for history in args.history:
+            cell = asyncio.run(run_cell(args, concurrency, history))
+            results.append(cell)
+            lat = cell["latency_seconds"]
+            print(f"{concurrency:>5} {history:>5} {cell['requests']:>5} {cell['errors']:>4} {cell['requests_per_second']:>7.2f} "
+                  f"{lat['p50']:>7.3f} {lat['p95']:>7.3f} {lat['p99']:>7.3f} {cell['bytes_per_request'] / 1024:>8.1f}")
+    report = {
+        "config": {
+            **{k: v for k, v in vars(args).items() if k != "json"},
+            "python": platform.python_version(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.json}")
+    return 1 if any(cell["errors"] for cell in results) else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--history", type=int, nargs="+", default=[0, 5, 20], help="finished turns seeded per session")
+    parser.add_argument("--requests", type=int, default=32, help="turns per cell, spread over the workers")
+    parser.add_argument("--stream", choices=["delta", "full"], default="delta")
+    parser.add_argument("--execution", choices=["async", "sync"], default="async")
+    parser.add_argument("--latency-scale", type=float, default=0.05, help="multiplier on the role latency profiles")
+    parser.add_argument("--tool-latency", type=float, default=0.02)
+    parser.add_argument("--tool-cache", action="store_true", help="keep the tool cache on")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="write the report to this path")
+    sys.exit(run(parser.parse_args()))
@@ -0,0 +1,170 @@
+"""Background /jobs: detached runs, polling, resumable event streams, turn reuse and restart recovery.
+
+A turn is submitted and the client walks away; it polls until the job is done, then
+replays the event log from the start, from an offset and via SSE Last-Event-ID. The
+same turn is resubmitted (as after a reconnect) and must be served without model
+calls, a turn sent twice at once must make one job, while the same text sent again
+as a new turn must run, and a running job is cancelled. A second manager over the
+same SQLite file stands in for a restarted server. Finally ``--jobs`` turns are
+submitted at once against ``--workers`` workers.
+
+Run from ``backend/``::
+
+    python -m bench.jobs --jobs 20 --workers 4
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+import agent_logic
+import main
+from admission import AdmissionController
+from jobs import CANCELLED, DONE, FAILED, Job, JobManager, JobStore
+from session_store import build_checkpointer
+from wire import decode_lines
+from bench.fakes import ScriptedChatModel, install_fake_models, single_turn_script
+
+
+def _check(label: str, ok: bool, failures: list) -> None:
+    print(f"{'✅' if ok else '❌'} {label}")
+    if not ok:
+        failures.append(label)
+
+
+async def _wait_done(client: httpx.AsyncClient, job_id: str, poll: float = 0.02) -> dict:
+    while True:
+        job = (await client.get(f"/jobs/{job_id}")).json()
+        if job["status"] not in ("queued", "running"):
+            return job
+        await asyncio.sleep(poll)
+
+
+async def _events(client: httpx.AsyncClient, job_id: str, **kwargs) -> list:
+    resp = await client.get(f"/jobs/{job_id}/events", **kwargs)
+    return list(decode_lines(resp.content.splitlines()))
+
+
+async def scenario(path: str, jobs: int, workers: int, fake: ScriptedChatModel, failures: list) -> None:
+    main.JOBS = JobManager(JobStore(path), main.job_events, workers=workers)
+    transport = httpx.ASGITransport(app=main.api)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        turn = {"session_id": "detached", "user_input": "detached|Write a thank-you note.", "turn_id": "detached-1"}
+        started = time.perf_counter()
+        submitted = (await client.post("/jobs", json=turn)).json()
+        submit_ms = (time.perf_counter() - started) * 1e3
+        job_id = submitted["job"]["job_id"]
+        done = await _wait_done(client, job_id)
+        print(f"submit answered in {submit_ms:.1f} ms; job finished {done['finished'] - done['created']:.2f}s after submission")
+        _check("a submitted job runs to completion without a client attached",
+               done["status"] == DONE and bool((done["result"] or {}).get("messages")), failures)
+
+        everything = await _events(client, job_id)
+        _check("the event log replays in order and ends with the final state",
+               [e["seq"] for e in everything] == list(range(len(everything))) and everything[-1]["event"] == "final", failures)
+        offset = len(everything) // 2
+        tail = await _events(client, job_id, params={"offset": offset})
+        _check("streaming resumes from an offset", tail == everything[offset:], failures)
+        resumed = await _events(client, job_id, headers={"Last-Event-ID": str(offset - 1)})
+        _check("streaming resumes after an SSE Last-Event-ID", resumed == everything[offset:], failures)
+
+        calls = sum(fake.calls.values())
+        again = (await client.post("/jobs", json=turn)).json()
+        latest = (await client.get("/jobs", params={"session_id": "detached"})).json()
+        _check("resubmitting the turn reuses the finished job without model calls",
+               again["reused"] and again["job"]["job_id"] == job_id and sum(fake.calls.values()) == calls
+               and latest["job_id"] == job_id, failures)
+
+        # A turn sent twice at once (a client retrying a slow submit) still makes a single job.
+        racing = {"session_id": "racing", "user_input": "racing|Say hi.", "turn_id": "racing-1"}
+        pair = await asyncio.gather(*(client.post("/jobs", json=racing) for _ in range(2)))
+        ids = {r.json()["job"]["job_id"] for r in pair}
+        await _wait_done(client, ids.pop())
+        _check("a turn submitted twice at once makes one job", not ids and sorted(r.json()["reused"] for r in pair) == [False, True],
+               failures)
+
+        # The same text sent twice: a resubmission while the first run is in flight is a
+        # reconnect, the same text after it finished is a second turn.
+        repeat = {"session_id": "repeat", "user_input": "repeat|Make it shorter."}
+        first = (await client.post("/jobs", json=repeat)).json()
+        reconnect = (await client.post("/jobs", json=repeat)).json()
+        await _wait_done(client, first["job"]["job_id"])
+        calls = sum(fake.calls.values())
+        second = (await client.post("/jobs", json=repeat)).json()
+        second_done = await _wait_done(client, second["job"]["job_id"])
+        history = main.app_graph.get_state(main.session_config("repeat")).values["messages"]
+        _check("the same text sent again after its turn finished runs a second turn",
+               reconnect["reused"] and reconnect["job"]["job_id"] == first["job"]["job_id"]
+               and not second["reused"] and second["job"]["job_id"] != first["job"]["job_id"]
+               and second_done["status"] == DONE and sum(fake.calls.values()) > calls
+               and sum(m.type == "human" and m.content == repeat["user_input"] for m in history) == 2, failures)
+
+        # Cancelling a running job answers with the status the job ends up in.
+        running = (await client.post("/jobs", json={"session_id": "cancel", "user_input": "cancel|turn"})).json()["job"]
+        while running["status"] == "queued":
+            await asyncio.sleep(0.005)
+            running = (await client.get(f"/jobs/{running['job_id']}")).json()
+        cancelled = (await client.delete(f"/jobs/{running['job_id']}")).json()
+        stored = (await client.get(f"/jobs/{running['job_id']}")).json()
+        _check("cancelling a running job reports it cancelled",
+               running["status"] == "running" and cancelled["status"] == stored["status"] == CANCELLED, failures)
+
+        # A burst of independent turns against the worker pool.
+        peak = 0
+
+        async def sample():
+            nonlocal peak
+            while True:
+                peak = max(peak, main.JOBS.stats()["running"])
+                await asyncio.sleep(0.005)
+
+        sampler = asyncio.create_task(sample())
+        started = time.perf_counter()
+        burst = [(await client.post("/jobs", json={"session_id": f"burst-{i}", "user_input": f"burst-{i}|turn"})).json()
+                 for i in range(jobs)]
+        results = [await _wait_done(client, b["job"]["job_id"]) for b in burst]
+        wall = time.perf_counter() - started
+        sampler.cancel()
+        print(f"{jobs} jobs on {workers} workers: {wall:.2f}s, peak running {peak}")
+        _check("every burst job finishes", all(r["status"] == DONE for r in results), failures)
+        _check("no more jobs run at once than there are workers", peak <= workers, failures)
+
+    # A "restarted" server: a fresh manager over the same file, with one job left running
+    # and one still queued by the previous process.
+    store = JobStore(path)
+    store.create(Job(session_id="crashed", user_input="crashed|turn", status="running"))
+    waiting = Job(session_id="waiting", user_input="waiting|turn")
+    store.create(waiting)
+    main.JOBS = JobManager(store, main.job_events, workers=workers)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.api), base_url="http://bench", timeout=None) as client:
+        replay = await _events(client, job_id)
+        _check("finished jobs survive a restart", replay == everything, failures)
+        await client.post("/jobs", json={"session_id": "kick", "user_input": "kick|turn"})
+        crashed = (await client.get("/jobs", params={"session_id": "crashed"})).json()
+        requeued = await _wait_done(client, waiting.job_id)
+        _check("a job cut off by the restart is failed, a queued one is run",
+               crashed["status"] == FAILED and requeued["status"] == DONE, failures)
+
+
+def run(jobs: int, workers: int, latency: float) -> int:
+    fake = ScriptedChatModel(single_turn_script(), latency=latency)
+    install_fake_models(agent_logic, fake)
+    main.app_graph = agent_logic.build_app(checkpointer=build_checkpointer("memory"))
+    main.ADMISSION = AdmissionController(max_active=32)
+    failures: list = []
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(scenario(os.path.join(tmp, "jobs.sqlite"), jobs, workers, fake, failures))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+    sys.exit(run(args.jobs, args.workers, args.latency))
@@ -0,0 +1,104 @@
+"""Checks and timings for the LLM response cache on a templated /chat workload.
+
+Run from ``backend/``::
+
+    python -m bench.llm_cache --latency 0.1
+"""
+import argparse
+import sys
+import time
+
+from fastapi.testclient import TestClient
+from langchain_core.messages import AIMessage
+
+import agent_logic
+import main
+from llm_cache import LLMCache
+from model_pool import ROLES
+from session_store import build_checkpointer
+from wire import decode_lines
+from bench.fakes import ScriptedChatModel, install_fake_models, single_turn_script
+
+
+def _with_usage(script):
+    for replies in script.values():
+        for reply in replies:
+            reply.usage_metadata = {"input_tokens": 900, "output_tokens": 100, "total_tokens": 1000}
+    return script
+
+
+def _check(label: str, ok: bool, failures: list) -> None:
+    print(f"{'✅' if ok else '❌'} {label}")
+    if not ok:
+        failures.append(label)
+
+
+def _turn(client: TestClient, fake: ScriptedChatModel, session_id: str, user_input: str) -> str:
+    # Each session replays the script from the start, as a real provider would answer afresh.
+    fake.positions.clear()
+    resp = client.post("/chat", json={"session_id": session_id, "user_input": user_input})
+    final = list(decode_lines(resp.text.splitlines()))[-1]
+    return final["final_response"]
+
+
+def _hits(cache: LLMCache, kind: str) -> int:
+    return sum(counters[kind] for counters in cache.metrics.values())
+
+
+def run(latency: float, requests: int) -> int:
+    fake = ScriptedChatModel(_with_usage(single_turn_script()))
+    install_fake_models(agent_logic, fake)
+    main.app_graph = agent_logic.build_app(checkpointer=build_checkpointer("memory"))
+    client = TestClient(main.api)
+    failures: list = []
+
+    agent_logic.LLM_CACHE = LLMCache()
+    _turn(client, fake, "off-1", "Write a thank-you email to the team")
+    _turn(client, fake, "off-2", "Write a thank-you email to the team")
+    _check("disabled by default: every node calls the model", sum(fake.calls.values()) == 12, failures)
+
+    agent_logic.LLM_CACHE = cache = LLMCache(roles=ROLES)
+    fake.reset()
+    first = _turn(client, fake, "exact-1", "Write a thank-you email to the team")
+    calls = sum(fake.calls.values())
+    second = _turn(client, fake, "exact-2", "Write a thank-you email to the team")
+    _check("identical prompt in a new session is served from cache",
+           sum(fake.calls.values()) == calls and _hits(cache, "exact_hits") == calls and first == second, failures)
+    _check("tokens saved are recorded", _hits(cache, "tokens_saved") == calls * 1000, failures)
+
+    agent_logic.LLM_CACHE = cache = LLMCache(roles=ROLES, semantic_roles=ROLES)
+    fake.reset()
+    _turn(client, fake, "sem-1", "Write a thank-you email to the team")
+    calls = sum(fake.calls.values())
+    _turn(client, fake, "sem-2", "write a thank you email to the team!")
+    _check("near-identical wording is a semantic hit", sum(fake.calls.values()) == calls and _hits(cache, "semantic_hits") == calls, failures)
+    _turn(client, fake, "sem-3", "Write a thank-you email to Alice")
+    _check("a different recipient is not", sum(fake.calls.values()) == 2 * calls, failures)
+
+    bounded = LLMCache(roles=["drafter"], max_entries=2)
+    for i in range(3):
+        bounded.store("drafter", [AIMessage(content=f"prompt {i}")], AIMessage(content=str(i)))
+    _check("size bound evicts least recently used", bounded.stats()["entries"] == 2
+           and bounded.lookup("drafter", [AIMessage(content="prompt 0")]) is None, failures)
+
+    fake.latency = latency
+    templates = [f"Write a thank-you email to team {i % 3}" for i in range(requests)]
+    for label, roles in (("uncached", ()), ("cached", ROLES)):
+        agent_logic.LLM_CACHE = cache = LLMCache(roles=roles)
+        fake.reset()
+        started = time.perf_counter()
+        for i, text in enumerate(templates):
+            _turn(client, fake, f"{label}-{i}", text)
+        elapsed = time.perf_counter() - started
+        print(f"{label}: {requests} requests over 3 templates at {latency:.2f}s/call: {elapsed:.2f}s, "
+              f"model_calls={sum(fake.calls.values())}, stats={cache.stats()}")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--requests", type=int, default=12)
+    args = parser.parse_args()
+    sys.exit(run(args.latency, args.requests))
@@ -0,0 +1,179 @@
+"""Memory and append cost of session histories, LangChain message lists vs. the message log.
+
+``--sessions`` sessions of ``--messages`` messages each are built with the metadata a
+provider attaches to real replies (ids, token usage, model name, tool calls). Three
+things are measured for both representations:
+
+* live memory of the histories themselves (tracemalloc);
+* memory held by the in-memory session store once every session has been written
+  through a graph whose node appends one reply, the old way (copy the list, merge it
+  with ``add_messages``) or the new way (return the reply, ``append_messages``);
+* time for one node to append a reply to a history of 100 and of 1000 messages.
+
+Run from ``backend/``::
+
+    python -m bench.message_log --sessions 1000 --messages 100
+"""
+import argparse
+import gc
+import logging
+import sys
+import time
+import tracemalloc
+import uuid
+from typing import Annotated, Sequence, TypedDict
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langgraph.graph import END, StateGraph
+from langgraph.graph.message import add_messages
+
+from message_log import MessageLog, append_messages
+from session_store import LRUMemorySaver, checkpoint_serde
+
+
+def _reply(session: int, i: int, tool_call: bool = False) -> AIMessage:
+    usage = {"prompt_tokens": 900 + i, "completion_tokens": 60, "total_tokens": 960 + i}
+    return AIMessage(
+        content="" if tool_call else f"Session {session} reply {i}: the draft now covers revenue, hiring and the roadmap.",
+        id=f"run-{uuid.uuid4()}",
+        name="drafter",
+        tool_calls=[{"name": "save", "args": {"filename": f"draft-{session}.txt"}, "id": f"call_{uuid.uuid4().hex[:24]}"}] if tool_call else [],
+        response_metadata={"token_usage": usage, "model_name": "gpt-4o-mini-2024-07-18", "system_fingerprint": "fp_0ba0d124f1",
+                           "finish_reason": "tool_calls" if tool_call else "stop", "logprobs": None},
+        usage_metadata={"input_tokens": usage["prompt_tokens"], "output_tokens": 60, "total_tokens": usage["total_tokens"],
+                        "input_token_details": {"cache_read": 0}, "output_token_details": {"reasoning": 0}},
+    )
+
+
+def history(session: int, length: int) -> list:
+    messages = []
+    for i in range(length):
+        if i % 10 == 0:
+            messages.append(HumanMessage(content=f"Session {session} request {i}: tighten the second paragraph.", id=str(uuid.uuid4())))
+        elif i % 10 == 8:
+            messages.append(_reply(session, i, tool_call=True))
+        elif i % 10 == 9:
+            messages.append(ToolMessage(content="Saved.", tool_call_id=messages[-1].tool_calls[0]["id"], id=str(uuid.uuid4())))
+        else:
+            messages.append(_reply(session, i))
+    return messages
+
+
+def _traced(build):
+    """Bytes still allocated by ``build()`` while its result is alive, and the result."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used, result
+
+
+class ListState(TypedDict):
+    messages: Annotated[Sequence[BaseMessage], add_messages]
+
+
+class LogState(TypedDict):
+    messages: Annotated[MessageLog, append_messages]
+
+
+def session_graph(compact: bool, saver):
+    def respond(state):
+        reply = _reply(-1, len(state["messages"]))
+        return {"messages": [reply]} if compact else {"messages": list(state["messages"]) + [reply]}
+
+    graph = StateGraph(LogState if compact else ListState)
+    graph.add_node("respond", respond)
+    graph.set_entry_point("respond")
+    graph.add_edge("respond", END)
+    return graph.compile(checkpointer=saver)
+
+
+def store_bytes(compact: bool, sessions: int, length: int) -> int:
+    histories = [history(s, length - 1) for s in range(sessions)]
+
+    def fill():
+        saver = LRUMemorySaver(max_sessions=sessions, serde=checkpoint_serde())
+        graph = session_graph(compact, saver)
+        for s, messages in enumerate(histories):
+            # The last request's history as loaded from the store, then one turn appending a reply.
+            graph.invoke({"messages": MessageLog.of(messages) if compact else messages}, {"configurable": {"thread_id": str(s)}})
+        return saver
+
+    used, saver = _traced(fill)
+    assert len(saver._last_access) == sessions
+    return used
+
+
+def append_seconds(compact: bool, length: int, repeat: int) -> float:
+    messages = history(0, length)
+    current = MessageLog.of(messages) if compact else messages
+    reply = _reply(0, length)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        if compact:
+            append_messages(current, [reply])
+        else:
+            add_messages(current, list(current) + [reply])
+    return (time.perf_counter() - started) / repeat
+
+
+def _check(label: str, ok: bool, failures: list) -> None:
+    print(f"{'✅' if ok else '❌'} {label}")
+    if not ok:
+        failures.append(label)
+
+
+def run(sessions: int, length: int) -> int:
+    logging.getLogger("langgraph").setLevel(logging.ERROR)
+    failures: list = []
+    total = sessions * length
+
+    list_bytes, _ = _traced(lambda: [history(s, length) for s in range(sessions)])
+    log_bytes, _ = _traced(lambda: [MessageLog.of(history(s, length)) for s in range(sessions)])
+    list_store, log_store = store_bytes(False, sessions, length), store_bytes(True, sessions, length)
+    print(f"{sessions} sessions x {length} messages")
+    print(f"{'':<22}{'message lists':>15}{'message log':>13}{'ratio':>8}")
+    print(f"{'histories MB':<22}{list_bytes / 1e6:>15.1f}{log_bytes / 1e6:>13.1f}{list_bytes / log_bytes:>7.1f}x")
+    print(f"{'  bytes per message':<22}{list_bytes / total:>15.0f}{log_bytes / total:>13.0f}")
+    print(f"{'session store MB':<22}{list_store / 1e6:>15.1f}{log_store / 1e6:>13.1f}{list_store / log_store:>7.1f}x")
+
+    timings = {}
+    for size in (100, 1000):
+        timings[size] = (append_seconds(False, size, 50), append_seconds(True, size, 2000))
+        print(f"{f'append at {size} us':<22}{timings[size][0] * 1e6:>15.1f}{timings[size][1] * 1e6:>13.1f}")
+    log = MessageLog.of(history(0, length))
+    started = time.perf_counter()
+    prompt = list(log)
+    print(f"building a {length}-message prompt from the log: {(time.perf_counter() - started) * 1e3:.2f} ms")
+
+    _check("the log holds histories in at most half the memory", log_bytes * 2 <= list_bytes, failures)
+    _check("the session store holds less with the log", log_store < list_store, failures)
+    _check("appending to the log does not grow with the history",
+           timings[1000][1] <= timings[100][1] * 3 and timings[1000][1] * 10 <= timings[1000][0], failures)
+    original = history(1, length)
+    log = MessageLog.of(original)
+    serde = checkpoint_serde()
+    restored = serde.loads_typed(serde.dumps_typed(log))
+    _check("messages read back from the log and from a checkpoint match the originals",
+           restored == log and all(
+               (a.type, a.id, a.content, getattr(a, "tool_calls", None), getattr(a, "tool_call_id", None))
+               == (b.type, b.id, b.content, getattr(b, "tool_calls", None), getattr(b, "tool_call_id", None))
+               for a, b in zip(original, restored)) and len(prompt) == length, failures)
+    older = MessageLog.of(original[:10])
+    newer = append_messages(older, original[10:])
+    branch = append_messages(older, [_reply(1, 10)])
+    _check("a branch off an older log leaves the newer log intact",
+           newer.extends(older) and not branch.extends(older) and len(older) == 10 and len(branch) == 11
+           and newer == log and branch[10].id != newer[10].id, failures)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=100)
+    args = parser.parse_args()
+    sys.exit(run(args.sessions, args.messages))
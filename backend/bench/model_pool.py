@@ -0,0 +1,61 @@
+"""Microbenchmark: per-turn model client overhead, per-call construction vs. ModelPool.
+
+No requests are sent; this measures client construction and ``bind_tools`` schema
+conversion. The pooled run reports its one-off warm-up turn separately.
+
+Run from ``backend/``::
+
+    python -m bench.model_pool --turns 200
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+from langchain_openai import ChatOpenAI
+
+from agent_logic import COORDINATION_TOOLS, TOOLS
+from model_pool import ModelPool
+
+# Model-calling node executions in a Coordinate -> Research -> Draft -> Edit -> Coordinate turn.
+TURN = ["coordinator", "researcher", "drafter", "editor", "coordinator"]
+
+
+def legacy_get_models():
+    """The pre-pool _get_models(): three fresh clients on every node call."""
+    model = ChatOpenAI(openai_api_key=os.getenv("OPENAI_API_KEY"), model="gpt-4o-mini", temperature=0.2).bind_tools(TOOLS, tool_choice="any")
+    coordinator_model = ChatOpenAI(openai_api_key=os.getenv("OPENAI_API_KEY"), model="gpt-4o-mini", temperature=0.2).bind_tools(COORDINATION_TOOLS)
+    model_no_tools = ChatOpenAI(openai_api_key=os.getenv("OPENAI_API_KEY"), model="gpt-4o-mini", temperature=0.2)
+    return model, coordinator_model, model_no_tools
+
+
+def _get_pooled(pool: ModelPool, role: str):
+    if role == "coordinator":
+        return pool.get(role, COORDINATION_TOOLS)
+    return pool.get(role, TOOLS, tool_choice="any")
+
+
+def _time_turns(turns: int, get_client) -> float:
+    started = time.perf_counter()
+    for _ in range(turns):
+        for role in TURN:
+            get_client(role)
+    return time.perf_counter() - started
+
+
+def run(turns: int) -> None:
+    legacy = _time_turns(turns, lambda role: legacy_get_models())
+    pool = ModelPool()
+    warm_up = _time_turns(1, lambda role: _get_pooled(pool, role))
+    pooled = _time_turns(turns, lambda role: _get_pooled(pool, role))
+
+    print(f"per-call: {legacy / turns * 1e3:9.3f} ms/turn")
+    print(f"  pooled: {pooled / turns * 1e3:9.3f} ms/turn (first turn warm-up {warm_up * 1e3:.3f} ms)")
+    print(f"speed-up: {legacy / pooled:9.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=200)
+    run(parser.parse_args().turns)
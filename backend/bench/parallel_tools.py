@@ -0,0 +1,95 @@
+"""Benchmark: tools_node latency with N concurrent tool calls, serial vs. parallel.
+
+A latency-injecting stub tool stands in for SerpAPI. The run also checks that results
+keep the order of the tool calls and that timeouts and failures stay per-call.
+
+Run from ``backend/``::
+
+    python -m bench.parallel_tools --calls 4 --latency 0.2
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.tools import tool
+
+import agent_logic
+
+
+@tool
+def slow_search(query: str, delay: float = 0.0) -> str:
+    """Stub search that answers after ``delay`` seconds."""
+    time.sleep(delay)
+    if query == "boom":
+        raise RuntimeError("upstream exploded")
+    return f"results for {query}"
+
+
+def _state(calls):
+    tool_calls = [{"name": name, "args": args, "id": f"call_{i}"} for i, (name, args) in enumerate(calls)]
+    return {"messages": [HumanMessage(content="research"), AIMessage(content="", tool_calls=tool_calls)], "router": "research"}
+
+
+def _serial_tools_node(state):
+    # The pre-change behaviour: one call after another.
+    calls = agent_logic._pending_tool_calls(state)
+    return agent_logic._tools_state(state, [agent_logic._tool_message(c, agent_logic._tool_output(c)) for c in calls])
+
+
+def _tool_messages(result):
+    return [m for m in result["messages"] if isinstance(m, ToolMessage)]
+
+
+def run(calls: int, latency: float) -> int:
+    agent_logic.TOOLS_BY_NAME[slow_search.name] = slow_search
+    state = _state([("slow_search", {"query": f"q{i}", "delay": latency}) for i in range(calls)])
+
+    timings = {}
+    for name, node in (("serial", _serial_tools_node), ("thread pool", agent_logic.tools_node)):
+        started = time.perf_counter()
+        node(state)
+        timings[name] = time.perf_counter() - started
+    started = time.perf_counter()
+    asyncio.run(agent_logic.atools_node(state))
+    timings["asyncio.gather"] = time.perf_counter() - started
+    for name, elapsed in timings.items():
+        print(f"{name:>15}: {elapsed:.3f}s for {calls} calls at {latency:.2f}s each")
+
+    failures = []
+    agent_logic.TOOL_TIMEOUT_SECONDS = latency * 2
+    mixed = _state([
+        ("slow_search", {"query": "first", "delay": latency}),
+        ("slow_search", {"query": "boom"}),
+        ("slow_search", {"query": "stuck", "delay": latency * 5}),
+        ("missing_tool", {}),
+        ("slow_search", {"query": "last"}),
+    ])
+    for name, result in (("sync", agent_logic.tools_node(mixed)), ("async", asyncio.run(agent_logic.atools_node(mixed)))):
+        messages = _tool_messages(result)
+        ids = [m.tool_call_id for m in messages]
+        contents = [m.content for m in messages]
+        ok = (
+            ids == [f"call_{i}" for i in range(5)]
+            and contents[0] == "results for first"
+            and "failed" in contents[1]
+            and "timed out" in contents[2]
+            and "not found" in contents[3]
+            and contents[4] == "results for last"
+        )
+        print(f"{'✅' if ok else '❌'} {name}: ordered results with isolated failure, timeout and unknown tool")
+        if not ok:
+            failures.append(name)
+    if timings["thread pool"] > timings["serial"] / 2 or timings["asyncio.gather"] > timings["serial"] / 2:
+        failures.append("speed-up")
+        print("❌ parallel execution was not at least 2x faster than serial")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+    sys.exit(run(args.calls, args.latency))
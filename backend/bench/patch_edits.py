@@ -0,0 +1,198 @@
+"""Output tokens and latency of small revisions to a long draft, full rewrites vs. patch edits.
+
+A scripted session drafts an essay of ``--essay-tokens`` tokens and then asks for a
+series of small edit-only revisions (greeting, one sentence, the closing). The
+Editor answers each with the full revised essay when patching is off, and with
+find/replace edits when it is on; one revision sends a stale patch that cannot be
+applied, which must fall back to a full rewrite. Replies cost ``--token-latency``
+seconds per output token. Both runs must end every turn with the same document.
+A first draft that is itself a JSON document must still stream all of its tokens.
+
+Run from ``backend/``::
+
+    python -m bench.patch_edits --essay-tokens 1500 --token-latency 0.0005
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from typing import Dict, List
+
+from langchain_core.messages import AIMessage
+from pydantic import Field
+
+import agent_logic
+import instrumentation
+import main
+from session_store import build_checkpointer
+from patching import looks_like_patch
+from wire import apply_diff
+from bench.fakes import ScriptedChatModel, _tokens, _turn_key, install_fake_models, synthetic_text
+
+FIRST = "Draft an essay on quarterly planning for the board."
+# (request, find, replace); the find text of the stale edit is not in the document.
+REVISIONS = [
+    ("Change the greeting.", "Dear members of the board,", "Hello everyone,"),
+    ("Reword the opening of section 3.", "Section 3 looks at hiring.", "Section 3 turns to our hiring plans."),
+    ("Make the closing warmer.", "Regards,", "With warm regards and thanks,"),
+    ("Fix the wording of section 5.", "Section five covers the roadmap.", "Section 5 sets out the roadmap."),
+]
+
+
+def _edit(text: str) -> str:
+    return json.dumps({"edits": [{"find": text[0], "replace": text[1]}]})
+
+
+class RevisionModel(ScriptedChatModel):
+    """Scripted replies per turn (keyed on the user message); tallies the Editor's output tokens."""
+
+    turns: Dict[str, Dict[str, List[AIMessage]]] = Field(default_factory=dict)
+    output_tokens: Dict[str, int] = Field(default_factory=dict)
+
+    def _next(self, messages):
+        self.script = self.turns[_turn_key(messages)]
+        reply = super()._next(messages)
+        role = reply.name or "unknown"
+        self.output_tokens[role] = self.output_tokens.get(role, 0) + len(_tokens(str(reply.content)))
+        return reply
+
+
+def session(essay_tokens: int, patch: bool) -> tuple:
+    """Scripts for every turn and the document expected after each."""
+    rng = random.Random(0)
+    sections = [f"Section {i} looks at hiring." if i == 3 else f"Section {i} {synthetic_text(rng, 4)}." for i in range(1, 7)]
+    body = "\n\n".join(f"{s} {synthetic_text(rng, essay_tokens // 6)}" for s in sections)
+    document = f"Dear members of the board,\n\n{body}\n\nRegards,\nSam"
+
+    def reply(role: str, content: str) -> AIMessage:
+        return AIMessage(content=content, name=role)
+
+    turns = {FIRST: {
+        "coordinator": [reply("coordinator", '{"route": "draft", "description": "Draft the essay."}'),
+                        reply("coordinator", '{"route": "reply", "description": "Here is the draft."}')],
+        "drafter": [reply("drafter", document)],
+        "editor": [reply("editor", document)],
+    }}
+    expected = [document]
+    for request, find, replace in REVISIONS:
+        stale = find not in document
+        revised = document.replace(find, replace, 1) if not stale else document.replace("Section 5", "Section 5 (revised)", 1)
+        if not patch:
+            editor = [reply("editor", revised)]
+        elif stale:
+            # A patch against text that is not there, then the full rewrite it falls back to.
+            editor = [reply("editor", _edit((find, replace))), reply("editor", revised)]
+        else:
+            editor = [reply("editor", _edit((find, replace)))]
+        turns[request] = {
+            "coordinator": [reply("coordinator", json.dumps({"route": "edit", "description": request})),
+                            reply("coordinator", '{"route": "reply", "description": "Updated."}')],
+            "editor": editor,
+        }
+        document = revised
+        expected.append(document)
+    return turns, expected
+
+
+async def run_session(essay_tokens: int, token_latency: float, patch: bool) -> dict:
+    turns, expected = session(essay_tokens, patch)
+    fake = RevisionModel({}, turns=turns, token_latency=token_latency)
+    install_fake_models(agent_logic, fake)
+    agent_logic.PATCH_EDITS = patch
+    main.app_graph = agent_logic.build_app(checkpointer=build_checkpointer("memory"))
+    session_id = f"patch-{patch}"
+    documents, seconds, stream_bytes, diffs = [], [], 0, 0
+    previews_ok = True
+    for request in [FIRST] + [r[0] for r in REVISIONS]:
+        started = time.perf_counter()
+        async for event, payload in main.turn_events(session_id, request):
+            stream_bytes += len(json.dumps(payload))
+            if event == "token":
+                previews_ok &= not payload["content"].lstrip().startswith("{")
+            elif event == "step" and payload.get("diff"):
+                diffs += 1
+                previews_ok &= "final_response" not in payload["changes"]
+            elif event == "final":
+                documents.append(payload["final_response"])
+        if request != FIRST:
+            seconds.append(time.perf_counter() - started)
+    return {
+        "documents": documents,
+        "expected": expected,
+        "editor_tokens": fake.output_tokens.get("editor", 0) - len(_tokens(expected[0])),
+        "seconds": sum(seconds),
+        "stream_bytes": stream_bytes,
+        "previews_ok": previews_ok,
+        "diffs": diffs,
+    }
+
+
+async def json_document_tokens(document: str) -> str:
+    """The tokens streamed for a first draft that is itself a JSON document."""
+    request = "Draft the release manifest as JSON."
+
+    def reply(role: str, content: str) -> AIMessage:
+        return AIMessage(content=content, name=role)
+
+    fake = RevisionModel({}, turns={request: {
+        "coordinator": [reply("coordinator", '{"route": "draft", "description": "Draft the manifest."}'),
+                        reply("coordinator", '{"route": "reply", "description": "Here it is."}')],
+        "drafter": [reply("drafter", document)],
+        "editor": [reply("editor", document)],
+    }})
+    install_fake_models(agent_logic, fake)
+    main.app_graph = agent_logic.build_app(checkpointer=build_checkpointer("memory"))
+    tokens = []
+    async for event, payload in main.turn_events("patch-json", request):
+        if event == "token" and payload["node"] == "Draft_node":
+            tokens.append(payload["content"])
+    return "".join(tokens)
+
+
+def _check(label: str, ok: bool, failures: list) -> None:
+    print(f"{'✅' if ok else '❌'} {label}")
+    if not ok:
+        failures.append(label)
+
+
+def run(essay_tokens: int, token_latency: float) -> int:
+    failures: list = []
+    results = {}
+    for patch in (False, True):
+        before = instrumentation.METRICS.value("draft_revisions_total", role="editor", outcome="rejected")
+        results[patch] = r = asyncio.run(run_session(essay_tokens, token_latency, patch))
+        r["rejected"] = instrumentation.METRICS.value("draft_revisions_total", role="editor", outcome="rejected") - before
+    print(f"{len(REVISIONS)} revisions of a {essay_tokens}-token essay")
+    print(f"{'mode':<10}{'editor out tokens':>19}{'seconds':>9}{'stream bytes':>14}")
+    for patch, r in results.items():
+        print(f"{'patch' if patch else 'rewrite':<10}{r['editor_tokens']:>19}{r['seconds']:>9.2f}{r['stream_bytes']:>14}")
+    full, patched = results[False], results[True]
+    _check("both modes produce the expected document after every turn",
+           full["documents"] == full["expected"] and patched["documents"] == patched["expected"], failures)
+    _check("patch edits cut the Editor's output tokens at least 3x", patched["editor_tokens"] * 3 <= full["editor_tokens"], failures)
+    _check("patch edits make the revisions faster", patched["seconds"] < full["seconds"], failures)
+    _check("a patch that does not apply falls back to a full rewrite", patched["rejected"] == 1 and full["rejected"] == 0, failures)
+    _check("patched revisions stream as diffs, not as document text",
+           patched["previews_ok"] and patched["diffs"] == len(REVISIONS) - 1 and full["diffs"] == 0
+           and patched["stream_bytes"] < full["stream_bytes"], failures)
+    edits = [{"find": "Regards,", "replace": "Thanks,"}]
+    _check("wire.apply_diff applies edits and refuses ones that do not match",
+           apply_diff("Hi,\n\nRegards,\nSam", edits) == "Hi,\n\nThanks,\nSam" and apply_diff("Hi", edits) is None, failures)
+    prefixes = {'{"name": "release"': False, "```python\nprint(1)": False, '```json\n{"edits": [': True,
+                '{"discard": true}': True, '{"ed': None, "```": None}
+    _check("only replies opening with an edits or discard object are held back as patches",
+           all(looks_like_patch(prefix) is expected for prefix, expected in prefixes.items()), failures)
+    document = json.dumps({"name": "release", "version": "2.1", "notes": ["Faster drafting", "Patch edits"]}, indent=2)
+    _check("a draft that is a JSON document streams all of its tokens",
+           asyncio.run(json_document_tokens(document)) == document, failures)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--essay-tokens", type=int, default=1500)
+    parser.add_argument("--token-latency", type=float, default=0.0005)
+    args = parser.parse_args()
+    sys.exit(run(args.essay_tokens, args.token_latency))
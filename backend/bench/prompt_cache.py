@@ -0,0 +1,83 @@
+"""Provider prompt-prefix cache hit rates for the static-prefix prompt layout vs. the old inline one.
+
+The old layout interpolated per-turn state into the top of the system prompt. It is
+reproduced here by folding the dynamic suffix back into the first system message.
+
+Run from ``backend/``::
+
+    python -m bench.prompt_cache --turns 12
+"""
+import argparse
+import sys
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+import agent_logic
+from prompts import PromptCacheStats
+from session_store import build_checkpointer
+from tool_cache import ToolCache
+from bench.context_window import BulkySearch, long_session_script
+from bench.fakes import ScriptedChatModel, _turn_key, install_fake_models
+
+ROLES = ("coordinator", "researcher", "drafter", "editor")
+
+
+class EvolvingModel(ScriptedChatModel):
+    """Scripted replies that differ every turn, as real drafts and instructions do."""
+
+    def _next(self, messages):
+        reply = super()._next(messages)
+        if reply.content:
+            reply.content = f"{reply.content} [{_turn_key(messages)}]"
+        return reply
+
+
+def _inline_layout(prompt_messages):
+    def inline(state, role, **fields):
+        prefix, *rest, suffix = prompt_messages(state, role, **fields)
+        return [SystemMessage(content=prefix.content + "\n" + suffix.content)] + rest
+    return inline
+
+
+def replay(turns: int, inline: bool) -> PromptCacheStats:
+    fake = EvolvingModel(long_session_script(), prefix_cache=True)
+    install_fake_models(agent_logic, fake)
+    agent_logic.PROMPT_CACHE = stats = PromptCacheStats()
+    original = agent_logic._prompt_messages
+    if inline:
+        agent_logic._prompt_messages = _inline_layout(original)
+    try:
+        graph = agent_logic.build_app(checkpointer=build_checkpointer("memory"))
+        config = {"configurable": {"thread_id": "prefix-cache"}}
+        for turn in range(turns):
+            graph.invoke({"messages": [HumanMessage(content=f"Revision {turn}: tighten the second paragraph.")]}, config)
+    finally:
+        agent_logic._prompt_messages = original
+    return stats
+
+
+def run(turns: int) -> int:
+    agent_logic.GoogleSearch = agent_logic.GoogleScholarSearch = BulkySearch
+    agent_logic.TOOL_CACHE = ToolCache()
+    layouts = {"inline": replay(turns, inline=True), "prefix+suffix": replay(turns, inline=False)}
+
+    print(f"{'role':<12}" + "".join(f"{name + ' cached':>22}" for name in layouts))
+    for role in ROLES:
+        row = f"{role:<12}"
+        for stats in layouts.values():
+            c = stats.stats().get(role, {"cached_tokens": 0, "input_tokens": 0, "cached_ratio": 0.0})
+            row += f"{c['cached_tokens']:>10}/{c['input_tokens']:<6} {c['cached_ratio']:>4.0%}"
+        print(row)
+    ratios = {}
+    for name, stats in layouts.items():
+        totals = stats.stats().values()
+        cached, total = sum(c["cached_tokens"] for c in totals), sum(c["input_tokens"] for c in totals)
+        ratios[name] = cached / total if total else 0.0
+        print(f"{name}: {cached}/{total} prompt tokens served from the provider cache ({ratios[name]:.0%})")
+    return 0 if ratios["prefix+suffix"] > ratios["inline"] else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=12)
+    sys.exit(run(parser.parse_args().turns))
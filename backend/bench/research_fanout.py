@@ -0,0 +1,76 @@
+"""Research subgraph latency as the number of planned sub-queries grows, sequential vs. concurrent searches.
+
+Every stubbed search takes ``--search-latency`` seconds and the planner and researcher
+models ``--latency`` each. With searches running concurrently the research step
+should stay near one search latency as breadth grows instead of scaling linearly.
+Results shared between queries must be cited once.
+
+Run from ``backend/``::
+
+    python -m bench.research_fanout --queries 1 2 4 8 --search-latency 0.2
+"""
+import argparse
+import sys
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+import agent_logic
+from tool_cache import ToolCache
+from bench.fakes import ScriptedChatModel, install_fake_models, research_plan, stub_search
+
+
+class OverlappingSearch:
+    """Wraps a stub search so every query also returns one shared result."""
+
+    inner = None
+
+    def __init__(self, params):
+        self.params = params
+
+    def get_dict(self):
+        response = self.inner(self.params).get_dict()
+        shared = {"title": "Shared overview", "snippet": "Cited by every query.", "link": "https://example.org/overview/"}
+        return {"organic_results": response["organic_results"] + [shared]}
+
+
+def research_once(queries: int, concurrency: int, latency: float) -> dict:
+    plan = research_plan(*[("scholar" if i % 2 else "web", f"sub-query {i}") for i in range(queries)])
+    install_fake_models(agent_logic, ScriptedChatModel(
+        {"planner": [plan], "researcher": [AIMessage(content="- Findings [1].")]}, latency=latency,
+    ))
+    agent_logic.RESEARCH_MAX_QUERIES = queries
+    state = {**agent_logic.empty_state(), "messages": [HumanMessage(content=f"Research {queries} angles")]}
+    started = time.perf_counter()
+    result = agent_logic.RESEARCH_GRAPH.invoke(state, {"max_concurrency": concurrency})
+    summary = result["messages"][-1].content
+    return {"seconds": time.perf_counter() - started, "summary": summary}
+
+
+def run(query_counts, search_latency: float, latency: float, concurrency: int) -> int:
+    OverlappingSearch.inner = stub_search(latency=search_latency)
+    agent_logic.GoogleSearch = agent_logic.GoogleScholarSearch = OverlappingSearch
+    agent_logic.TOOL_CACHE = ToolCache(bypass=True)
+    failures = 0
+    print(f"{'queries':>8}{'sequential':>12}{'concurrent':>12}{'speedup':>9}{'sources':>9}")
+    for queries in query_counts:
+        sequential = research_once(queries, 1, latency)
+        concurrent = research_once(queries, concurrency, latency)
+        sources = concurrent["summary"].split("Sources:\n", 1)[-1].splitlines()
+        expected = queries * 3 + 1
+        print(f"{queries:>8}{sequential['seconds']:>11.2f}s{concurrent['seconds']:>11.2f}s"
+              f"{sequential['seconds'] / concurrent['seconds']:>8.1f}x{len(sources):>9}")
+        if len(sources) != expected or sum("overview" in line for line in sources) != 1:
+            failures += 1
+            print(f"❌ expected {expected} deduplicated sources, got {len(sources)}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--search-latency", type=float, default=0.2)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    sys.exit(run(args.queries, args.search_latency, args.latency, args.concurrency))
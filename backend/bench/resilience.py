@@ -0,0 +1,306 @@
+"""Model call resilience against local fake OpenAI-compatible servers: retries, fallback and hedging.
+
+Two local HTTP servers speak the chat completions API: the primary (reached through
+the real ``ChatOpenAI`` factory) misbehaves per scenario, the fallback (reached through
+the real ``ChatGroq`` factory) is healthy. Each scenario sends ``--calls`` coordinator
+calls through ``ModelInvoker``, first with resilience off and then on, and reports
+errors, latency percentiles and which provider answered. Hedging is then rerun
+against a nearly empty request-rate bucket, which hedges must not overdraw, and a
+streamed reply that drops partway is retried without its tokens being sent twice.
+
+Run from ``backend/``::
+
+    python -m bench.resilience --calls 60
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, TypedDict
+
+import httpx
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langgraph.graph import END, StateGraph
+
+from admission import RateLimiters, TokenBucket
+from model_pool import ModelPool, RoleConfig, groq_chat_model, openai_chat_model
+from resilience import Backoff, ModelInvoker
+from bench.fakes import ScriptedChatModel
+
+
+@dataclass
+class Behavior:
+    latency: float = 0.02
+    error_rate: float = 0.0
+    error_status: int = 500
+    slow_rate: float = 0.0
+    slow_latency: float = 2.0
+    # How many of an unlucky call's attempts misbehave; later ones (the retry or hedge) take the fast path.
+    attempts: int = 1
+
+
+class FakeProvider:
+    """A threaded HTTP server answering ``*/chat/completions`` according to its behaviour.
+
+    Which calls misbehave is a seeded function of the call (its last message), not of
+    arrival order, so a scenario fails the same calls on every run and in every mode.
+    """
+
+    def __init__(self, name: str, seed: int = 0):
+        self.name = name
+        self.behavior = Behavior()
+        self.requests = 0
+        self.seed = seed
+        self._attempts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                status, delay = provider._draw(body.get("messages", [{}])[-1].get("content", ""))
+                time.sleep(delay)
+                if status != 200:
+                    payload = {"error": {"message": f"{provider.name} says {status}", "type": "server_error"}}
+                    return self._send(status, payload, {"Retry-After": "0"} if status == 429 else {})
+                self._send(200, provider.completion(body))
+
+            def _send(self, status: int, payload: dict, headers: Optional[Dict[str, str]] = None):
+                data = json.dumps(payload).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    for key, value in (headers or {}).items():
+                        self.send_header(key, value)
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client gave up on this attempt
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._attempts.clear()
+
+    def _draw(self, call: str):
+        with self._lock:
+            self.requests += 1
+            attempt = self._attempts.get(call, 0)
+            self._attempts[call] = attempt + 1
+        b = self.behavior
+        if attempt >= b.attempts:
+            return 200, b.latency
+        rng = random.Random(f"{self.seed}:{call}")
+        if rng.random() < b.error_rate:
+            return b.error_status, b.latency
+        return 200, b.slow_latency if rng.random() < b.slow_rate else b.latency
+
+    def completion(self, body: dict) -> dict:
+        return {
+            "id": f"chatcmpl-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": f'{{"route": "reply", "description": "from {self.name}"}}'}}],
+            "usage": {"prompt_tokens": 20, "completion_tokens": 8, "total_tokens": 28},
+        }
+
+
+@dataclass
+class Scenario:
+    name: str
+    primary: Behavior
+    baseline: RoleConfig
+    resilient: RoleConfig
+    # What resilience must improve: "errors" (at least 4x fewer) or "p99" latency.
+    target: str = "errors"
+
+
+def _pool(config: RoleConfig) -> ModelPool:
+    return ModelPool(configs={"coordinator": config}, providers={"openai": openai_chat_model, "groq": groq_chat_model})
+
+
+async def _run(invoker: ModelInvoker, primary: FakeProvider, config: RoleConfig, calls: int, concurrency: int) -> dict:
+    pool = _pool(config)
+    primary.reset()
+    latencies: List[float] = []
+    served: Dict[str, int] = {}
+    errors = 0
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(call: int):
+        nonlocal errors
+        messages = [SystemMessage(content="You are the Coordinator Agent."), HumanMessage(content=f"Thanks! #{call}")]
+        async with gate:
+            started = time.perf_counter()
+            try:
+                provider, _ = await invoker.ainvoke(pool, "coordinator", messages)
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - started)
+            served[provider] = served.get(provider, 0) + 1
+
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    latencies.sort()
+    pct = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else float("nan")
+    return {"errors": errors, "p50": statistics.median(latencies) if latencies else float("nan"), "p99": pct(0.99), "served": served}
+
+
+def scenarios() -> List[Scenario]:
+    off = RoleConfig(model="gpt-4o-mini", timeout=10.0, retries=0)
+    return [
+        Scenario("flaky (30% 500/429)", Behavior(error_rate=0.3),
+                 off, RoleConfig(model="gpt-4o-mini", timeout=10.0, retries=2)),
+        Scenario("outage (all 503)", Behavior(error_rate=1.0, error_status=503, attempts=sys.maxsize),
+                 off, RoleConfig(model="gpt-4o-mini", timeout=10.0, retries=1, fallbacks=("groq",))),
+        Scenario("hung (10% never answer)", Behavior(slow_rate=0.1, slow_latency=30.0),
+                 RoleConfig(model="gpt-4o-mini", timeout=2.0, retries=0), RoleConfig(model="gpt-4o-mini", timeout=0.5, retries=2)),
+        Scenario("tail (10% take 1.5s)", Behavior(slow_rate=0.1, slow_latency=1.5),
+                 off, RoleConfig(model="gpt-4o-mini", timeout=10.0, retries=0, hedge_after=0.2), target="p99"),
+    ]
+
+
+async def compare(invoker: ModelInvoker, primary: FakeProvider, calls: int, concurrency: int, failures: list) -> None:
+    # One event loop for every scenario: the shared async HTTP pool is bound to it.
+    print(f"{'scenario':<26}{'mode':<11}{'errors':>7}{'p50':>8}{'p99':>8}  served by")
+    for scenario in scenarios():
+        primary.behavior = scenario.primary
+        results = {}
+        for mode, config in (("baseline", scenario.baseline), ("resilient", scenario.resilient)):
+            results[mode] = r = await _run(invoker, primary, config, calls, concurrency)
+            print(f"{scenario.name:<26}{mode:<11}{r['errors']:>7}{r['p50']:>8.3f}{r['p99']:>8.3f}  {r['served']}")
+        before, after = results["baseline"], results["resilient"]
+        improved = after["p99"] < before["p99"] if scenario.target == "p99" else after["errors"] <= before["errors"] // 4
+        if not improved or after["errors"] > before["errors"]:
+            failures.append(scenario.name)
+
+
+async def hedge_limits(primary: FakeProvider, calls: int, concurrency: int, failures: list) -> None:
+    # Room for every call's first attempt and hardly any more: the tail's hedges must wait their turn or be skipped.
+    primary.behavior = Behavior(slow_rate=0.1, slow_latency=1.5)
+    invoker = ModelInvoker(RateLimiters({"openai_requests": TokenBucket(per_minute=6, burst=calls)}), backoff=Backoff(base=0.05, cap=0.5))
+    sent = primary.requests
+    started = time.perf_counter()
+    r = await _run(invoker, primary, RoleConfig(model="gpt-4o-mini", timeout=10.0, retries=0, hedge_after=0.2), calls, concurrency)
+    allowed = calls + int((time.perf_counter() - started) * 6 / 60) + 1
+    print(f"hedging under a rate limit: {primary.requests - sent} requests for {calls} calls (limit {allowed})")
+    if r["errors"] or primary.requests - sent > allowed:
+        failures.append("hedges stay within the rate limit")
+
+
+class DroppingModel(ScriptedChatModel):
+    """Streams the first few tokens of its first reply, then loses the connection."""
+
+    drops: int = 1
+
+    def _dropped(self) -> bool:
+        if self.drops <= 0:
+            return False
+        self.drops -= 1
+        return True
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        drop = self._dropped()
+        for i, chunk in enumerate(super()._stream(messages, stop, run_manager, **kwargs)):
+            if drop and i == 3:
+                raise httpx.ReadError("connection dropped mid-stream")
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        drop = self._dropped()
+        i = 0
+        async for chunk in super()._astream(messages, stop, run_manager, **kwargs):
+            if drop and i == 3:
+                raise httpx.ReadError("connection dropped mid-stream")
+            i += 1
+            yield chunk
+
+
+class _Turn(TypedDict):
+    reply: str
+
+
+def stream_retry(failures: list) -> None:
+    reply = "Dear team, thank you for all your help this week. Best, Sam"
+    invoker = ModelInvoker(RateLimiters({}), backoff=Backoff(base=0.01, cap=0.05))
+
+    for mode in ("async", "sync"):
+        model = DroppingModel({"drafter": [AIMessage(content=reply)]})
+        pool = ModelPool(factory=lambda role, config: model, configs={"drafter": RoleConfig(retries=1)})
+        messages = [SystemMessage(content="You are the Drafter Agent."), HumanMessage(content="Thank the team.")]
+
+        def draft(state: _Turn) -> _Turn:
+            return {"reply": invoker.invoke(pool, "drafter", messages)[1].content}
+
+        async def adraft(state: _Turn) -> _Turn:
+            return {"reply": (await invoker.ainvoke(pool, "drafter", messages))[1].content}
+
+        graph = StateGraph(_Turn)
+        graph.add_node("draft", adraft if mode == "async" else draft)
+        graph.set_entry_point("draft")
+        graph.add_edge("draft", END)
+        app = graph.compile()
+
+        async def streamed() -> str:
+            return "".join([m.content async for m, _ in app.astream({"reply": ""}, stream_mode="messages")])
+
+        text = asyncio.run(streamed()) if mode == "async" else "".join(m.content for m, _ in app.stream({"reply": ""}, stream_mode="messages"))
+        print(f"{mode} stream of a retried reply: {text!r}")
+        # The dropped attempt's tokens are out already; the retry must not send the reply again after them.
+        if model.calls.get("drafter") != 2 or not reply.startswith(text):
+            failures.append(f"{mode} retry streams no duplicate tokens")
+
+
+def run(calls: int, concurrency: int) -> int:
+    primary, fallback = FakeProvider("primary", seed=1), FakeProvider("fallback", seed=2)
+    os.environ.update({"OPENAI_API_KEY": "sk-bench", "OPENAI_BASE_URL": f"{primary.url}/v1", "OPENAI_API_BASE": f"{primary.url}/v1",
+                       "GROQ_API_KEY": "gsk-bench", "GROQ_API_BASE": fallback.url, "GROQ_MODEL": "llama-3.1-8b-instant"})
+    invoker = ModelInvoker(RateLimiters({}), backoff=Backoff(base=0.05, cap=0.5))
+    failures: list = []
+
+    async def both():
+        await compare(invoker, primary, calls, concurrency, failures)
+        await hedge_limits(primary, calls, concurrency, failures)
+
+    asyncio.run(both())
+
+    # The sync path shares the same logic but runs attempts on the invoker's thread pool.
+    primary.behavior = Behavior(error_rate=1.0, error_status=503, attempts=sys.maxsize)
+    provider, reply = invoker.invoke(_pool(RoleConfig(model="gpt-4o-mini", retries=0, fallbacks=("groq",))), "coordinator",
+                                     [HumanMessage(content="Thanks!")])
+    if provider != "groq" or "fallback" not in reply.content:
+        failures.append("sync fallback")
+    print(f"sync invoke during an outage answered by {provider}")
+
+    stream_retry(failures)
+
+    for name in failures:
+        print(f"❌ {name}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    sys.exit(run(args.calls, args.concurrency))
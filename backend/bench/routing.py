@@ -0,0 +1,116 @@
+"""Model and search calls per turn on a feedback-iteration session, fast-path routing vs. the fixed pipeline.
+
+The scripted user asks for a draft, then iterates on it: edits, a thank-you, a
+rewrite with new content and a question. With ``COORDINATOR_FAST_PATHS=off`` every
+turn runs Research -> Draft -> Edit with forced tool calls, as before structured
+routing; with fast paths the coordinator's ``route`` picks the first node.
+
+Run from ``backend/``::
+
+    python -m bench.routing --rounds 3
+"""
+import argparse
+import sys
+from typing import Dict, List
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+import agent_logic
+from model_pool import ModelPool
+from session_store import build_checkpointer
+from tool_cache import ToolCache
+from bench.fakes import ScriptedChatModel, _turn_key, disable_rate_limits, research_plan, role_of, save_call, stub_search
+
+DRAFT_TEXT = "Dear hiring manager,\n\nI am applying for the data analyst role at Acme.\n\nSincerely,\nAlex"
+
+# (user message, coordinator route)
+FEEDBACK_SESSION = [
+    ("Write a cover letter for a data analyst role at Acme.", "research"),
+    ("Make it shorter.", "edit"),
+    ("Thanks, that reads well!", "reply"),
+    ("Mention my SQL certification in the second paragraph.", "draft"),
+    ("What tone would suit a startup?", "reply"),
+    ("Make the closing more formal.", "edit"),
+]
+
+
+def turn_script(route: str) -> Dict[str, List[AIMessage]]:
+    decision = AIMessage(content=f'{{"route": "{route}", "description": "Handle: {route}.", "notes": ""}}')
+    return {
+        # The fixed pipeline only ends a turn once the coordinator saves.
+        "coordinator": [decision, save_call("cover_letter")],
+        "planner": [research_plan(("web", "Acme data analyst role"), ("web", "data analyst cover letter tips"))],
+        "researcher": [AIMessage(content="- Acme values SQL and dashboarding experience.")],
+        "drafter": [AIMessage(content=DRAFT_TEXT)],
+        "editor": [AIMessage(content=DRAFT_TEXT.replace("I am applying", "I am excited to apply"))],
+    }
+
+
+class FeedbackModel(ScriptedChatModel):
+    """Per-turn scripts; models bound with ``tool_choice="any"`` always answer with a search call."""
+
+    turns: Dict[str, Dict[str, List[AIMessage]]]
+    forced: bool = False
+
+    def bind_tools(self, tools, tool_choice=None, **kwargs) -> "FeedbackModel":
+        # A shallow copy shares the call counters with the unbound model.
+        return self.model_copy(update={"forced": True}) if tool_choice == "any" else self
+
+    def _next(self, messages):
+        self.script = self.turns.get(_turn_key(messages), {})
+        if not self.forced:
+            return super()._next(messages)
+        role = role_of(messages)
+        self.calls[role] = self.calls.get(role, 0) + 1
+        return AIMessage(content="", tool_calls=[{"name": "web_search", "args": {"query": "cover letter tips"}, "id": f"call_{role}"}])
+
+
+def replay(rounds: int, fast_paths: bool) -> List[Dict[str, int]]:
+    turns = {f"{text} (round {r})": route for r in range(rounds) for text, route in FEEDBACK_SESSION}
+    fake = FeedbackModel({}, turns={text: turn_script(route) for text, route in turns.items()})
+    search = stub_search()
+    agent_logic.FAST_PATHS = fast_paths
+    disable_rate_limits(agent_logic)
+    graph = agent_logic.build_app(
+        checkpointer=build_checkpointer("memory"),
+        model_pool=ModelPool(factory=lambda role, config: fake),
+        search_clients={"google": search, "google_scholar": search},
+    )
+    config = {"configurable": {"thread_id": f"feedback-{fast_paths}"}}
+    per_turn = []
+    for text, route in turns.items():
+        fake.calls.clear()
+        searches = search.calls
+        graph.invoke({"messages": [HumanMessage(content=text)]}, config)
+        per_turn.append({"route": route, "model_calls": sum(fake.calls.values()), "searches": search.calls - searches})
+    return per_turn
+
+
+def run(rounds: int) -> int:
+    agent_logic.TOOL_CACHE = ToolCache(bypass=True)
+    fast_paths = agent_logic.FAST_PATHS
+    try:
+        fixed, fast = replay(rounds, fast_paths=False), replay(rounds, fast_paths=True)
+    finally:
+        agent_logic.FAST_PATHS = fast_paths
+
+    print(f"{'route':<10}{'turns':>6}{'calls before':>14}{'calls after':>13}{'searches before':>17}{'searches after':>16}")
+    for route in ("research", "draft", "edit", "reply"):
+        b = [t for t in fixed if t["route"] == route]
+        a = [t for t in fast if t["route"] == route]
+        print(f"{route:<10}{len(a):>6}{sum(t['model_calls'] for t in b) / len(b):>14.1f}{sum(t['model_calls'] for t in a) / len(a):>13.1f}"
+              f"{sum(t['searches'] for t in b) / len(b):>17.1f}{sum(t['searches'] for t in a) / len(a):>16.1f}")
+    calls_before = sum(t["model_calls"] for t in fixed)
+    calls_after = sum(t["model_calls"] for t in fast)
+    print(f"model calls per turn: {calls_before / len(fixed):.2f} -> {calls_after / len(fast):.2f} "
+          f"({1 - calls_after / calls_before:.0%} fewer); searches: {sum(t['searches'] for t in fixed)} -> {sum(t['searches'] for t in fast)}")
+    researched = all(t["searches"] for t in fast if t["route"] == "research")
+    if not researched:
+        print("❌ a turn routed to research did not search")
+    return 0 if calls_after < calls_before and researched else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=3)
+    sys.exit(run(parser.parse_args().rounds))
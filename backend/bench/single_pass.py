@@ -0,0 +1,65 @@
+"""Regression benchmark: one /chat turn must execute each routed node exactly once.
+
+Run from ``backend/``::
+
+    python -m bench.single_pass --turns 20
+"""
+import argparse
+import sys
+import time
+
+from fastapi.testclient import TestClient
+
+import agent_logic
+import main
+from session_store import build_checkpointer
+from wire import decode_lines
+from bench.fakes import ScriptedChatModel, count_node_calls, install_fake_models, single_turn_script
+
+NODE_FUNCTIONS = {
+    "Coordinate_node": "coordination",
+    "Research_node": "research",
+    "Draft_node": "drafting",
+    "Edit_node": "editing",
+    "Tools_node": "tools_node",
+}
+
+
+def run(turns: int) -> int:
+    fake = ScriptedChatModel(single_turn_script())
+    install_fake_models(agent_logic, fake)
+    counts: dict[str, int] = {}
+    restore = count_node_calls(agent_logic, counts)
+    try:
+        main.app_graph = agent_logic.build_app(checkpointer=build_checkpointer("memory"))
+    finally:
+        restore()
+
+    client = TestClient(main.api)
+    failures = 0
+    started = time.perf_counter()
+    for turn in range(turns):
+        counts.clear()
+        fake.reset()
+        resp = client.post("/chat", json={"session_id": f"bench-{turn}", "user_input": f"Write a thank-you email #{turn}"})
+        events = list(decode_lines(resp.text.splitlines()))
+        # Every delta step event is one routing decision into the node it names.
+        decisions: dict[str, int] = {}
+        for event in events:
+            if event.get("event") == "step":
+                name = NODE_FUNCTIONS[event["node"]]
+                decisions[name] = decisions.get(name, 0) + 1
+        if counts != decisions or events[-1].get("event") != "final":
+            failures += 1
+            print(f"❌ turn {turn}: node executions {counts} for routing decisions {decisions}")
+    elapsed = time.perf_counter() - started
+
+    print(f"turns={turns} node_executions/turn={counts} model_calls/turn={fake.calls}")
+    print(f"elapsed={elapsed:.3f}s ({elapsed / turns * 1000:.2f} ms/turn)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=20)
+    sys.exit(run(parser.parse_args().turns))
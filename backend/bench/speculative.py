@@ -0,0 +1,173 @@
+"""End-to-end turn latency of research turns, serial vs. speculative drafting.
+
+Each turn takes the full Research -> Draft -> Edit path with fake models whose
+latency is set per role (``--token-latency`` seconds per output token) and stub
+searches taking ``--search-latency``. Three runs are compared:
+
+* serial: the Drafter waits for the research summary;
+* speculative, merged: a provisional draft is written during research and the
+  merger patches the research into it;
+* speculative, discarded: the merger rejects the provisional draft, so the Drafter
+  runs again after research (the worst case).
+
+Every run must end with the same draft. A last run drives concurrent sync turns
+through a tool pool with one worker per search, to show that provisional drafts
+never take a search worker.
+
+Run from ``backend/``::
+
+    python -m bench.speculative --turns 3
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import AIMessage
+
+import agent_logic
+import instrumentation
+from session_store import build_checkpointer
+from tool_cache import ToolCache
+from bench.fakes import RoleProfile, SyntheticChatModel, install_fake_models, research_plan, stub_search, synthetic_text
+
+PROVISIONAL = "Dear board,\n\nOur quarterly plan focuses on hiring and the roadmap.\n\nBest,\nSam"
+FINAL = "Dear board,\n\nOur quarterly plan focuses on hiring, which grew 12% [1], and the roadmap.\n\nBest,\nSam"
+
+
+def profiles(token_latency: float) -> dict:
+    return {
+        "coordinator": RoleProfile(latency=0.2, token_latency=token_latency),
+        "planner": RoleProfile(latency=0.2, token_latency=token_latency),
+        "researcher": RoleProfile(latency=0.3, token_latency=token_latency),
+        "drafter": RoleProfile(latency=0.3, token_latency=token_latency),
+        "merger": RoleProfile(latency=0.2, token_latency=token_latency),
+        "editor": RoleProfile(latency=0.3, token_latency=token_latency),
+    }
+
+
+def script(mode: str, draft_tokens: int) -> dict:
+    # Long enough that writing the draft takes about as long as the research does.
+    rng = random.Random(0)
+    padding = "\n\n" + synthetic_text(rng, draft_tokens)
+    provisional, final = PROVISIONAL + padding, FINAL + padding
+    merge = {
+        "merged": json.dumps({"edits": [{"find": "on hiring and", "replace": "on hiring, which grew 12% [1], and"}]}),
+        "discarded": '{"discard": true}',
+    }
+    return {
+        "coordinator": [AIMessage(content='{"route": "research", "description": "Draft the quarterly plan."}'),
+                        AIMessage(content='{"route": "reply", "description": "Here is the plan."}')],
+        "planner": [research_plan(("web", "quarterly hiring"), ("scholar", "roadmap planning"))],
+        "researcher": [AIMessage(content="- Hiring grew 12% [1].")],
+        # Speculative runs ask the Drafter for the provisional draft first.
+        "drafter": [AIMessage(content=final)] if mode == "serial" else [AIMessage(content=provisional), AIMessage(content=final)],
+        "merger": [AIMessage(content=merge.get(mode, ""))],
+        "editor": [AIMessage(content=final)],
+    }, final
+
+
+def build(mode: str, token_latency: float, search_latency: float, draft_tokens: int) -> tuple:
+    turn_script, final = script(mode, draft_tokens)
+    fake = SyntheticChatModel(turn_script, profiles=profiles(token_latency))
+    install_fake_models(agent_logic, fake)
+    agent_logic.SPECULATIVE_DRAFTING = mode != "serial"
+    # Every turn pays for its searches, as a turn on a new topic would.
+    agent_logic.TOOL_CACHE = ToolCache(bypass=True)
+    search = stub_search(latency=search_latency)
+    graph = agent_logic.build_app(checkpointer=build_checkpointer("memory"), search_clients={"google": search, "google_scholar": search})
+    return graph, fake, final
+
+
+async def run_mode(mode: str, turns: int, token_latency: float, search_latency: float, draft_tokens: int) -> dict:
+    graph, fake, final = build(mode, token_latency, search_latency, draft_tokens)
+    seconds, ok = [], True
+    for turn in range(turns):
+        config = {"configurable": {"thread_id": f"{mode}-{turn}"}}
+        started = time.perf_counter()
+        state = await graph.ainvoke({"messages": [("user", f"{mode} {turn}|Draft the quarterly plan for the board.")]}, config)
+        seconds.append(time.perf_counter() - started)
+        ok &= state["draft_text"] == final and state["final_response"] == final and not state["provisional_draft"]
+    return {"seconds": seconds, "ok": ok, "drafter_calls": fake.calls.get("drafter", 0), "merger_calls": fake.calls.get("merger", 0)}
+
+
+def run_saturated(turns: int, token_latency: float, search_latency: float, draft_tokens: int) -> dict:
+    # Each research plan searches twice, so the pool is exactly full with the turns' searches.
+    graph, fake, final = build("merged", token_latency, search_latency, draft_tokens)
+    executor, timeout = agent_logic.TOOL_EXECUTOR, agent_logic.TOOL_TIMEOUT_SECONDS
+    agent_logic.TOOL_EXECUTOR = ThreadPoolExecutor(max_workers=2 * turns, thread_name_prefix="tool")
+    # Shorter than a provisional draft: a search queued behind one would time out.
+    agent_logic.TOOL_TIMEOUT_SECONDS = search_latency * 1.5
+    timeouts = sum(instrumentation.METRICS.value("tool_timeouts_total", tool=t) for t in ("web_search", "google_scholar"))
+
+    def turn(i: int) -> dict:
+        return graph.invoke({"messages": [("user", f"saturated {i}|Draft the quarterly plan for the board.")]},
+                            {"configurable": {"thread_id": f"saturated-{i}"}})
+
+    try:
+        with ThreadPoolExecutor(max_workers=turns) as clients:
+            states = list(clients.map(turn, range(turns)))
+    finally:
+        agent_logic.TOOL_EXECUTOR.shutdown(wait=False)
+        agent_logic.TOOL_EXECUTOR, agent_logic.TOOL_TIMEOUT_SECONDS = executor, timeout
+    timeouts = sum(instrumentation.METRICS.value("tool_timeouts_total", tool=t) for t in ("web_search", "google_scholar")) - timeouts
+    return {"timeouts": timeouts, "ok": all(s["draft_text"] == final and "Sources:" in s["research_summary"] for s in states),
+            "merger_calls": fake.calls.get("merger", 0)}
+
+
+def _check(label: str, ok: bool, failures: list) -> None:
+    print(f"{'✅' if ok else '❌'} {label}")
+    if not ok:
+        failures.append(label)
+
+
+def run(turns: int, token_latency: float, search_latency: float, draft_tokens: int) -> int:
+    failures: list = []
+    results = {}
+    print(f"{'mode':<12}{'median s':>10}{'max s':>8}{'drafter':>9}{'merger':>8}")
+    for mode in ("serial", "merged", "discarded"):
+        results[mode] = r = asyncio.run(run_mode(mode, turns, token_latency, search_latency, draft_tokens))
+        r["median"] = statistics.median(r["seconds"])
+        print(f"{mode:<12}{r['median']:>10.2f}{max(r['seconds']):>8.2f}{r['drafter_calls']:>9}{r['merger_calls']:>8}")
+    serial, merged, discarded = results["serial"], results["merged"], results["discarded"]
+    print(f"speculation saves {1 - merged['median'] / serial['median']:.0%} of the turn when the draft is kept")
+    _check("every run ends with the same draft and no provisional draft left over",
+           all(r["ok"] for r in results.values()), failures)
+    _check("a merged provisional draft cuts turn latency by at least 20%", merged["median"] <= serial["median"] * 0.8, failures)
+    _check("a merged turn calls the Drafter once, during research",
+           merged["drafter_calls"] == turns and merged["merger_calls"] == turns, failures)
+    _check("a discarded provisional draft is redrafted after research",
+           discarded["drafter_calls"] == 2 * turns
+           and instrumentation.METRICS.value("speculative_drafts_total", outcome="discarded") == turns, failures)
+    _check("discarding costs at most one extra merger call over serial drafting",
+           discarded["median"] <= serial["median"] * 1.25, failures)
+
+    # The sync graph (GRAPH_EXECUTION_MODE=sync) writes the provisional draft on a worker thread.
+    graph, fake, final = build("merged", token_latency, search_latency, draft_tokens)
+    started = time.perf_counter()
+    state = graph.invoke({"messages": [("user", "sync|Draft the quarterly plan for the board.")]},
+                         {"configurable": {"thread_id": "sync"}})
+    sync_seconds = time.perf_counter() - started
+    print(f"sync merged turn: {sync_seconds:.2f}s")
+    _check("the sync graph speculates too", state["draft_text"] == final and fake.calls.get("merger") == 1
+           and sync_seconds <= serial["median"] * 0.8, failures)
+
+    saturated = run_saturated(turns, token_latency, search_latency, draft_tokens)
+    print(f"saturated tool pool: {saturated['timeouts']:g} search timeouts")
+    _check("speculation leaves every search worker free", saturated["timeouts"] == 0 and saturated["ok"]
+           and saturated["merger_calls"] == turns, failures)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--token-latency", type=float, default=0.003)
+    parser.add_argument("--search-latency", type=float, default=1.0)
+    parser.add_argument("--draft-tokens", type=int, default=400)
+    args = parser.parse_args()
+    sys.exit(run(args.turns, args.token_latency, args.search_latency, args.draft_tokens))
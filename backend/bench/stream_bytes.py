@@ -0,0 +1,54 @@
+"""Benchmark: bytes streamed per /chat turn, full-state vs. delta events.
+
+Each session is seeded with a synthetic history of ``--history`` messages before one
+scripted Coordinator -> Research -> Draft -> Edit -> save turn is streamed. The
+count includes the closing "final" event, which in delta mode carries only the
+turn's last message rather than the whole history.
+
+Run from ``backend/``::
+
+    python -m bench.stream_bytes --history 10 40 100
+"""
+import argparse
+
+from fastapi.testclient import TestClient
+from langchain_core.messages import AIMessage, HumanMessage
+
+import agent_logic
+import main
+from bench.fakes import ScriptedChatModel, install_fake_models, single_turn_script
+from session_store import build_checkpointer
+
+PARAGRAPH = "The quarterly report covers revenue, hiring and the product roadmap in detail. " * 8
+
+
+def synthetic_history(length: int):
+    return [
+        HumanMessage(content=f"Request {i}: {PARAGRAPH}") if i % 2 == 0 else AIMessage(content=f"Draft {i}: {PARAGRAPH}")
+        for i in range(length)
+    ]
+
+
+def run(histories) -> None:
+    install_fake_models(agent_logic, ScriptedChatModel(single_turn_script()))
+    main.app_graph = agent_logic.build_app(checkpointer=build_checkpointer("memory"))
+    client = TestClient(main.api)
+
+    print(f"{'history':>8} {'full bytes':>12} {'delta bytes':>12} {'ratio':>7} {'full final':>11} {'delta final':>12}")
+    for length in histories:
+        sizes, finals = {}, {}
+        for mode in ("full", "delta"):
+            session_id = f"bytes-{mode}-{length}"
+            main.app_graph.update_state(main.session_config(session_id), {"messages": synthetic_history(length)})
+            resp = client.post("/chat", json={"session_id": session_id, "user_input": f"Write it up ({mode} {length})", "stream": mode})
+            events = resp.content.split(b"\n\n")[:-1]
+            # Every event counts, including the closing "final" one, also shown on its own.
+            sizes[mode] = sum(len(event) for event in events)
+            finals[mode] = len(events[-1])
+        print(f"{length:>8} {sizes['full']:>12} {sizes['delta']:>12} {sizes['full'] / sizes['delta']:>6.1f}x "
+              f"{finals['full']:>11} {finals['delta']:>12}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--history", type=int, nargs="+", default=[10, 40, 100])
+    run(parser.parse_args().history)
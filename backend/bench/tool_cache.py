@@ -0,0 +1,96 @@
+"""Checks and timings for the SerpAPI tool-result cache against a local SerpAPI stub.
+
+Run from ``backend/``::
+
+    python -m bench.tool_cache --latency 0.2
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import agent_logic
+from tool_cache import ToolCache
+
+
+class StubSearch:
+    """Replaces serpapi.GoogleSearch / GoogleScholarSearch; ``get_dict`` answers locally."""
+
+    calls = 0
+    latency = 0.0
+    fail = False
+
+    def __init__(self, params):
+        self.params = params
+
+    def get_dict(self):
+        StubSearch.calls += 1
+        time.sleep(StubSearch.latency)
+        if StubSearch.fail:
+            return {"error": "Your account has run out of searches."}
+        q = self.params["q"]
+        return {
+            "search_metadata": {"status": "Success"},
+            "organic_results": [{"title": f"Result for {q}", "snippet": f"About {q}.", "link": "https://example.org/1"}],
+        }
+
+
+def _check(label: str, ok: bool, failures: list) -> None:
+    print(f"{'✅' if ok else '❌'} {label}")
+    if not ok:
+        failures.append(label)
+
+
+def run(latency: float) -> int:
+    agent_logic.GoogleSearch = agent_logic.GoogleScholarSearch = StubSearch
+    failures: list = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "tool_cache.sqlite")
+        agent_logic.TOOL_CACHE = cache = ToolCache(sqlite_path=path)
+
+        agent_logic.web_search.invoke({"query": "Climate change"})
+        agent_logic.web_search.invoke({"query": "  climate   CHANGE "})
+        _check("normalised repeat query is a memory hit", StubSearch.calls == 1 and cache.metrics["memory_hits"] == 1, failures)
+
+        agent_logic.google_scholar.invoke({"query": "Climate change"})
+        _check("same query on another engine is a separate entry", StubSearch.calls == 2, failures)
+
+        agent_logic.TOOL_CACHE = restarted = ToolCache(sqlite_path=path)
+        agent_logic.web_search.invoke({"query": "climate change"})
+        _check("fresh process reads the SQLite tier", StubSearch.calls == 2 and restarted.metrics["disk_hits"] == 1, failures)
+
+        restarted.bypass = True
+        agent_logic.web_search.invoke({"query": "climate change"})
+        restarted.bypass = False
+        _check("bypass flag skips the cache", StubSearch.calls == 3 and restarted.metrics["bypassed"] == 1, failures)
+
+        agent_logic.TOOL_CACHE = short = ToolCache(ttl_seconds=0.05)
+        agent_logic.web_search.invoke({"query": "renewables"})
+        time.sleep(0.1)
+        agent_logic.web_search.invoke({"query": "renewables"})
+        _check("entries expire after the TTL", StubSearch.calls == 5 and short.metrics["expired"] == 1, failures)
+
+        StubSearch.fail = True
+        agent_logic.web_search.invoke({"query": "quota"})
+        StubSearch.fail = False
+        agent_logic.web_search.invoke({"query": "quota"})
+        _check("upstream errors are not cached", StubSearch.calls == 7, failures)
+
+        agent_logic.TOOL_CACHE = timed = ToolCache()
+        StubSearch.latency = latency
+        queries = [f"topic {i % 5}" for i in range(20)]
+        started = time.perf_counter()
+        for q in queries:
+            agent_logic.web_search.invoke({"query": q})
+        elapsed = time.perf_counter() - started
+        print(f"20 queries over 5 topics at {latency:.2f}s per SerpAPI call: {elapsed:.2f}s "
+              f"(uncached {len(queries) * latency:.2f}s), stats={timed.stats()}")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.2)
+    sys.exit(run(parser.parse_args().latency))
@@ -0,0 +1,56 @@
+"""Benchmark: time to first visible draft text on /chat, token events vs. final event.
+
+The stream is consumed in-process from the handler's body iterator so per-event
+timings are not hidden by response buffering. Every fake model call spends
+``--latency`` seconds before its first token and ``--token-latency`` per token after.
+
+Run from ``backend/``::
+
+    python -m bench.ttft --turns 5 --latency 0.3
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import agent_logic
+import main
+from bench.fakes import ScriptedChatModel, install_fake_models, single_turn_script
+from session_store import build_checkpointer
+from wire import decode_lines
+
+
+async def _one_turn(turn: int) -> dict:
+    req = main.ChatRequest(session_id=f"ttft-{turn}", user_input=f"Write a thank-you email #{turn}")
+    started = time.perf_counter()
+    resp = await main.chat_handler(req)
+    first_token = draft_start = None
+    async for chunk in resp.body_iterator:
+        event = next(decode_lines(chunk.splitlines()))
+        if event["event"] == "step" and event["node"] == "Research_node":
+            draft_start = time.perf_counter() - started
+        if event["event"] == "token" and first_token is None:
+            first_token = time.perf_counter() - started
+    return {"first_token": first_token, "draft_start": draft_start, "final": time.perf_counter() - started}
+
+
+def run(turns: int, latency: float, token_latency: float) -> None:
+    install_fake_models(agent_logic, ScriptedChatModel(single_turn_script(), latency=latency, token_latency=token_latency))
+    main.app_graph = agent_logic.build_app(checkpointer=build_checkpointer("memory"))
+
+    results = [asyncio.run(_one_turn(turn)) for turn in range(turns)]
+    first = statistics.median(r["first_token"] for r in results)
+    final = statistics.median(r["final"] for r in results)
+    wait = statistics.median(r["first_token"] - r["draft_start"] for r in results)
+    print(f"model round trip: {latency:.3f}s")
+    print(f"first token     : {first:.3f}s (median of {turns}), {wait:.3f}s after Draft_node starts")
+    print(f"final event     : {final:.3f}s (median of {turns}) -> first text {final / first:.1f}x sooner")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--token-latency", type=float, default=0.01)
+    args = parser.parse_args()
+    run(args.turns, args.latency, args.token_latency)
@@ -0,0 +1,52 @@
+"""Benchmark: encode+decode throughput of /chat events, repr/eval vs. the wire codec.
+
+Each payload is a "final" event for a synthetic conversation of ``--history`` messages,
+the largest event a turn sends.
+
+Run from ``backend/``::
+
+    python -m bench.wire_codec --history 10 100 1000
+"""
+import argparse
+import time
+
+from agent_logic import serialize_state
+from bench.stream_bytes import synthetic_history
+from wire import decode_lines, encode_event
+
+
+def _repr_eval(payload) -> int:
+    line = (payload | {"event": "final"}).__repr__() + "\n"
+    eval(line)
+    return len(line)
+
+
+def _codec(payload) -> int:
+    data = encode_event("final", payload)
+    next(decode_lines(data.decode().splitlines()))
+    return len(data)
+
+
+def _throughput(fn, payload, min_seconds: float = 0.5):
+    size, rounds = fn(payload), 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < min_seconds:
+        fn(payload)
+        rounds += 1
+    elapsed = time.perf_counter() - started
+    return rounds / elapsed, size * rounds / elapsed / 1e6
+
+
+def run(histories) -> None:
+    print(f"{'history':>8} {'repr/eval ev/s':>15} {'MB/s':>8} {'codec ev/s':>12} {'MB/s':>8} {'speed-up':>9}")
+    for length in histories:
+        payload = serialize_state({"messages": synthetic_history(length), "router": "edit"})
+        old_rate, old_mb = _throughput(_repr_eval, payload)
+        new_rate, new_mb = _throughput(_codec, payload)
+        print(f"{length:>8} {old_rate:>15.1f} {old_mb:>8.1f} {new_rate:>12.1f} {new_mb:>8.1f} {new_rate / old_rate:>8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--history", type=int, nargs="+", default=[10, 100, 1000])
+    run(parser.parse_args().history)
@@ -0,0 +1,127 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterator, Mapping, Optional
+import os
+import threading
+import time
+
+# Usage counter -> limit it is checked against, in the order exhaustion is reported.
+LIMITS = (
+    ("node_visits", "max_node_visits"),
+    ("llm_calls", "max_llm_calls"),
+    ("tokens", "max_tokens"),
+    ("seconds", "max_seconds"),
+)
+
+
+@dataclass(frozen=True)
+class RunBudget:
+    """Limits on the work a single request may do; 0 disables a limit.
+
+    The usage of the current request lives in the agent state under ``budget`` so it
+    is checkpointed and streamed with the rest of the state. It is restarted whenever
+    a node sees a new user message, i.e. once per request.
+    """
+
+    max_node_visits: int = 25
+    max_llm_calls: int = 20
+    max_tokens: int = 120_000
+    max_seconds: float = 180.0
+
+    def start(self, request_id: str, started_at: Optional[float] = None) -> Dict[str, Any]:
+        return {
+            "request_id": request_id,
+            # Wall clock rather than perf_counter: the usage outlives the process in checkpoints.
+            "started_at": time.time() if started_at is None else started_at,
+            "node_visits": 0,
+            "llm_calls": 0,
+            "tokens": 0,
+            "seconds": 0.0,
+            "limits": asdict(self),
+            "exhausted": "",
+        }
+
+    def for_request(self, usage: Optional[Mapping[str, Any]], request_id: str, started_at: Optional[float] = None) -> Dict[str, Any]:
+        """Usage of ``request_id`` so far; a new request's clock starts at ``started_at``."""
+        if usage and usage.get("request_id") == request_id:
+            return dict(usage)
+        return self.start(request_id, started_at)
+
+
+@dataclass
+class Meter:
+    llm_calls: int = 0
+    tokens: int = 0
+    # Wall-clock time at which the request runs out of time; None without a time limit.
+    deadline: Optional[float] = None
+    # Calls are recorded from tool threads and concurrent research branches.
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def add(self, tokens: int) -> None:
+        with self._lock:
+            self.llm_calls += 1
+            self.tokens += tokens
+
+
+_meter: ContextVar[Optional[Meter]] = ContextVar("drafting_budget_meter", default=None)
+
+
+@contextmanager
+def metering(deadline: Optional[float] = None) -> Iterator[Meter]:
+    """Collect the model calls made while one node runs."""
+    meter = Meter(deadline=deadline)
+    token = _meter.set(meter)
+    try:
+        yield meter
+    finally:
+        _meter.reset(token)
+
+
+def record_llm_call(tokens: int) -> None:
+    meter = _meter.get()
+    if meter is not None:
+        meter.add(tokens)
+
+
+def deadline(usage: Mapping[str, Any]) -> Optional[float]:
+    max_seconds = usage.get("limits", {}).get("max_seconds")
+    return usage["started_at"] + max_seconds if max_seconds else None
+
+
+def time_left(timeout: float) -> float:
+    """``timeout``, cut to what is left of the current request's time limit."""
+    meter = _meter.get()
+    if meter is None or meter.deadline is None:
+        return timeout
+    return max(0.0, min(timeout, meter.deadline - time.time()))
+
+
+def exhausted_reason(usage: Mapping[str, Any]) -> str:
+    limits = usage.get("limits", {})
+    for counter, limit in LIMITS:
+        if limits.get(limit) and usage.get(counter, 0) >= limits[limit]:
+            return counter
+    return ""
+
+
+def charge(usage: Mapping[str, Any], meter: Meter) -> Dict[str, Any]:
+    """Usage after one more node visit with the calls recorded by ``meter``."""
+    charged = {
+        **usage,
+        "node_visits": usage["node_visits"] + 1,
+        "llm_calls": usage["llm_calls"] + meter.llm_calls,
+        "tokens": usage["tokens"] + meter.tokens,
+        "seconds": round(time.time() - usage["started_at"], 3),
+    }
+    charged["exhausted"] = usage.get("exhausted") or exhausted_reason(charged)
+    return charged
+
+
+def build_run_budget() -> RunBudget:
+    return RunBudget(
+        max_node_visits=int(os.getenv("BUDGET_MAX_NODE_VISITS", "25")),
+        max_llm_calls=int(os.getenv("BUDGET_MAX_LLM_CALLS", "20")),
+        max_tokens=int(os.getenv("BUDGET_MAX_TOKENS", "120000")),
+        max_seconds=float(os.getenv("BUDGET_MAX_SECONDS", "180")),
+    )
@@ -0,0 +1,162 @@
+from functools import lru_cache
+from typing import Any, List, Optional, Sequence
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+import json
+import os
+import threading
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken ships with langchain-openai
+    tiktoken = None
+
+_encoding_lock = threading.Lock()
+_encoding: Any = None
+
+# Chat framing adds a few tokens per message on top of its content.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Responses are tagged with the role that wrote them; these are full drafts of the document.
+DRAFT_AUTHORS = ("drafter", "editor")
+
+SUMMARY_PROMPT = """
+    You maintain the running summary of a conversation between a user and a multi-agent drafting system.
+    Merge the new part of the conversation into the existing summary. Keep the user's requests, preferences,
+    constraints and feedback, the decisions made, and key facts from research with their sources. Do not
+    reproduce drafts in full; the current document is tracked separately. Reply with the updated summary only.
+    """
+
+
+def _get_encoding() -> Any:
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                _encoding = tiktoken.get_encoding(os.getenv("CONTEXT_TOKEN_ENCODING", "o200k_base")) if tiktoken else False
+            except Exception:
+                # tiktoken downloads its BPE tables on first use; offline hosts fall back to an estimate.
+                _encoding = False
+        return _encoding
+
+
+@lru_cache(maxsize=8192)
+def count_text_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def count_tokens(messages: Sequence[BaseMessage]) -> int:
+    total = 0
+    for msg in messages:
+        total += MESSAGE_OVERHEAD_TOKENS + count_text_tokens(str(msg.content))
+        for call in getattr(msg, "tool_calls", None) or []:
+            total += count_text_tokens(call["name"] + json.dumps(call.get("args", {}), sort_keys=True))
+    return total
+
+
+def split_turns(messages: Sequence[BaseMessage]) -> List[List[BaseMessage]]:
+    """Each turn starts at a user message, so a tool call and its results never straddle turns."""
+    turns: List[List[BaseMessage]] = []
+    for msg in messages:
+        if isinstance(msg, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(msg)
+    return turns
+
+
+def _is_tool_exchange(msg: BaseMessage) -> bool:
+    return isinstance(msg, ToolMessage) or (isinstance(msg, AIMessage) and bool(msg.tool_calls))
+
+
+def _latest_draft(messages: Sequence[BaseMessage]) -> Optional[BaseMessage]:
+    for msg in reversed(messages):
+        if getattr(msg, "name", None) in DRAFT_AUTHORS and not _is_tool_exchange(msg):
+            return msg
+    return None
+
+
+def prune_turn(turn: Sequence[BaseMessage], latest_draft: Optional[BaseMessage]) -> List[BaseMessage]:
+    """A finished turn keeps its user message and answers; tool exchanges and superseded drafts go."""
+    kept = []
+    for msg in turn:
+        if _is_tool_exchange(msg):
+            continue
+        if getattr(msg, "name", None) in DRAFT_AUTHORS and msg is not latest_draft:
+            continue
+        kept.append(msg)
+    return kept
+
+
+class ContextWindow:
+    """Builds each agent's prompt from the session history within a token budget.
+
+    Finished turns are pruned, and once they exceed ``summary_trigger_tokens`` all but
+    the last ``keep_turns`` are folded into a running summary kept in the agent state,
+    so the summary is extended incrementally rather than rebuilt every turn. If a
+    prompt is still over its role's budget, whole turns are dropped oldest first. The
+    current turn is always sent in full.
+    """
+
+    def __init__(self, summary_trigger_tokens: int = 3000, keep_turns: int = 2, enabled: bool = True):
+        self.summary_trigger_tokens = summary_trigger_tokens
+        self.keep_turns = max(1, keep_turns)
+        self.enabled = enabled
+
+    def turns(self, messages: Sequence[BaseMessage], summarized_count: int = 0) -> List[List[BaseMessage]]:
+        turns = split_turns(messages[summarized_count:])
+        if not turns:
+            return []
+        latest_draft = _latest_draft(messages[summarized_count:])
+        return [prune_turn(turn, latest_draft) for turn in turns[:-1]] + [list(turns[-1])]
+
+    def summary_span(self, messages: Sequence[BaseMessage], summarized_count: int = 0) -> Optional[int]:
+        """Index up to which messages should be folded into the summary, or None if they still fit."""
+        if not self.enabled or self.summary_trigger_tokens <= 0:
+            return None
+        turns = self.turns(messages, summarized_count)
+        if len(turns) <= self.keep_turns:
+            return None
+        if sum(count_tokens(turn) for turn in turns[:-1]) <= self.summary_trigger_tokens:
+            return None
+        starts = [i for i in range(summarized_count, len(messages)) if isinstance(messages[i], HumanMessage)]
+        return starts[-self.keep_turns]
+
+    def summary_request(self, summary: str, messages: Sequence[BaseMessage], start: int, end: int) -> List[BaseMessage]:
+        latest_draft = _latest_draft(messages[start:])
+        folded = [msg for turn in split_turns(messages[start:end]) for msg in prune_turn(turn, latest_draft)]
+        transcript = "\n\n".join(f"{getattr(msg, 'name', None) or msg.type}: {msg.content}" for msg in folded)
+        return [
+            SystemMessage(content=SUMMARY_PROMPT),
+            HumanMessage(content=f"Existing summary:\n{summary or '(none)'}\n\nNew conversation:\n{transcript}"),
+        ]
+
+    def build(
+        self,
+        system: Sequence[BaseMessage],
+        messages: Sequence[BaseMessage],
+        summary: str = "",
+        summarized_count: int = 0,
+        budget: int = 0,
+        suffix: Sequence[BaseMessage] = (),
+    ) -> List[BaseMessage]:
+        if not self.enabled:
+            return list(system) + list(messages) + list(suffix)
+        head = list(system)
+        if summary:
+            head.append(SystemMessage(content=f"Summary of the earlier conversation:\n{summary}"))
+        turns = self.turns(messages, summarized_count)
+        used = count_tokens(head) + count_tokens(suffix) + sum(count_tokens(turn) for turn in turns)
+        while budget and used > budget and len(turns) > 1:
+            used -= count_tokens(turns.pop(0))
+        return head + [msg for turn in turns for msg in turn] + list(suffix)
+
+
+def build_context_window() -> ContextWindow:
+    """CONTEXT_WINDOW=off sends the full history; per-role budgets live in <ROLE>_CONTEXT_TOKENS."""
+    return ContextWindow(
+        summary_trigger_tokens=int(os.getenv("CONTEXT_SUMMARY_TRIGGER_TOKENS", "3000")),
+        keep_turns=int(os.getenv("CONTEXT_KEEP_TURNS", "2")),
+        enabled=os.getenv("CONTEXT_WINDOW", "on").lower() not in ("0", "off", "false", "no"),
+    )
@@ -0,0 +1,343 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+VISIT_BUCKETS = (1, 2, 4, 6, 8, 10, 15, 20, 25, 50)
+
+# USD per 1M tokens: (input, cached input, output). Unlisted models are not costed.
+MODEL_PRICES: Dict[str, Tuple[float, float, float]] = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+}
+
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def configure_logging() -> None:
+    """LOG_LEVEL (default INFO) applies to every backend logger."""
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+
+
+def _label_key(labels: Mapping[str, Any]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: Iterable[Tuple[str, str]]) -> str:
+    parts = []
+    for name, value in key:
+        value = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class MetricsRegistry:
+    """Counters and histograms rendered in the Prometheus text exposition format.
+
+    Gauges come from collectors, callables returning ``(name, labels, value)`` samples
+    that are evaluated on every scrape (e.g. cache statistics).
+    """
+
+    def __init__(self, namespace: str = "drafting"):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._meta: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[Tuple, float]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._histograms: Dict[str, Dict[Tuple, List[float]]] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    def counter(self, name: str, help: str) -> None:
+        self._meta[name] = ("counter", help)
+        self._counters.setdefault(name, {})
+
+    def histogram(self, name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self._meta[name] = ("histogram", help)
+        self._buckets[name] = buckets
+        self._histograms.setdefault(name, {})
+
+    def register_collector(self, collector: Callable[[], Iterable[Sample]]) -> None:
+        self._collectors.append(collector)
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        key = _label_key(labels)
+        buckets = self._buckets[name]
+        with self._lock:
+            series = self._histograms[name].get(key)
+            if series is None:
+                # per-bucket counts, then sum and count
+                series = self._histograms[name][key] = [0.0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def value(self, name: str, **labels: Any) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0.0)
+
+    def render(self) -> str:
+        ns = self.namespace
+        lines: List[str] = []
+        with self._lock:
+            for name, (kind, help) in self._meta.items():
+                lines += [f"# HELP {ns}_{name} {help}", f"# TYPE {ns}_{name} {kind}"]
+                if kind == "counter":
+                    for key, value in self._counters[name].items():
+                        lines.append(f"{ns}_{name}{_format_labels(key)} {_format_value(value)}")
+                    continue
+                buckets = self._buckets[name]
+                for key, series in self._histograms[name].items():
+                    for bound, count in zip(buckets, series):
+                        lines.append(f"{ns}_{name}_bucket{_format_labels(key + (('le', _format_value(bound)),))} {_format_value(count)}")
+                    lines.append(f"{ns}_{name}_bucket{_format_labels(key + (('le', '+Inf'),))} {_format_value(series[-1])}")
+                    lines.append(f"{ns}_{name}_sum{_format_labels(key)} {_format_value(series[-2])}")
+                    lines.append(f"{ns}_{name}_count{_format_labels(key)} {_format_value(series[-1])}")
+        gauges: Dict[str, List[Tuple[Tuple, float]]] = {}
+        for collector in self._collectors:
+            try:
+                for name, labels, value in collector():
+                    gauges.setdefault(name, []).append((_label_key(labels), value))
+            except Exception:
+                logger.exception("Metrics collector failed")
+        for name, samples in gauges.items():
+            lines.append(f"# TYPE {ns}_{name} gauge")
+            lines += [f"{ns}_{name}{_format_labels(key)} {_format_value(value)}" for key, value in samples]
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+METRICS.counter("requests_total", "Chat requests handled.")
+METRICS.histogram("request_seconds", "Wall time of a chat request.")
+METRICS.histogram("request_node_visits", "Graph node executions (loop iterations) per request.", VISIT_BUCKETS)
+METRICS.histogram("node_seconds", "Wall time per graph node execution.")
+METRICS.histogram("model_seconds", "Chat model call latency by agent role.")
+METRICS.counter("model_tokens_total", "Model tokens by role and kind (prompt, cached_prompt, completion).")
+METRICS.counter("model_cost_usd_total", "Estimated model spend in USD by role.")
+METRICS.counter("llm_cache_hits_total", "Model calls answered by the LLM response cache.")
+METRICS.histogram("tool_seconds", "Tool call latency.")
+METRICS.counter("tool_calls_total", "Finished tool calls by outcome (ok, error, cancelled, not_found).")
+METRICS.counter("tool_timeouts_total", "Tool calls whose result was not awaited past TOOL_TIMEOUT_SECONDS.")
+METRICS.counter("tool_cache_hits_total", "Search tool calls answered by the tool cache.")
+METRICS.histogram("admission_wait_seconds", "Time chat requests waited in the admission queue.")
+METRICS.counter("admission_rejected_total", "Chat requests turned away by admission control, by reason.")
+METRICS.histogram("rate_limit_wait_seconds", "Time upstream calls waited for their rate limit, by limit.")
+METRICS.counter("model_retries_total", "Model call attempts retried, by role, provider and reason (timeout or HTTP status).")
+METRICS.counter("model_fallbacks_total", "Model calls served by a fallback provider, by role and provider.")
+METRICS.counter("model_hedges_total", "Model calls that sent a hedged second request, by whether the hedge won.")
+METRICS.counter("draft_revisions_total", "Drafter and Editor revisions of an existing document, by outcome (patched, rejected, rewritten).")
+METRICS.counter("speculative_drafts_total", "Provisional drafts written during research, by outcome (merged, discarded, failed).")
+METRICS.counter("budget_exhausted_total", "Requests stopped early by their budget, by the limit reached.")
+
+
+@dataclass
+class RequestRecord:
+    session_id: str
+    request_id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    started: float = field(default_factory=time.perf_counter)
+    node_visits: Dict[str, int] = field(default_factory=dict)
+    node_seconds: Dict[str, float] = field(default_factory=dict)
+    model_calls: int = 0
+    model_seconds: float = 0.0
+    prompt_tokens: int = 0
+    cached_prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost_usd: float = 0.0
+    tool_calls: int = 0
+    tool_seconds: float = 0.0
+    tool_timeouts: int = 0
+    llm_cache_hits: int = 0
+    tool_cache_hits: int = 0
+    model_retries: int = 0
+    model_fallbacks: int = 0
+    model_hedges: int = 0
+    patched_revisions: int = 0
+    budget_exhausted: str = ""
+
+    def summary(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop("started")
+        data["seconds"] = round(time.perf_counter() - self.started, 4)
+        data["cost_usd"] = round(self.cost_usd, 6)
+        data["loop_iterations"] = sum(self.node_visits.values())
+        return data
+
+
+_current: ContextVar[Optional[RequestRecord]] = ContextVar("drafting_request", default=None)
+_record_lock = threading.Lock()
+
+
+def current_request() -> Optional[RequestRecord]:
+    return _current.get()
+
+
+def _update(**amounts: float) -> None:
+    record = _current.get()
+    if record is None:
+        return
+    # Nodes of one request may run on several threads (tool pool, sync graph executor).
+    with _record_lock:
+        for name, amount in amounts.items():
+            setattr(record, name, getattr(record, name) + amount)
+
+
+@contextmanager
+def track_request(session_id: str, mode: str = "") -> Iterator[RequestRecord]:
+    record = RequestRecord(session_id=session_id)
+    token = _current.set(record)
+    try:
+        yield record
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            # Closed from another context, e.g. a client disconnect tearing down the stream.
+            pass
+        summary = record.summary()
+        METRICS.inc("requests_total", mode=mode)
+        METRICS.observe("request_seconds", summary["seconds"], mode=mode)
+        METRICS.observe("request_node_visits", summary["loop_iterations"])
+        logger.info("📊 Request summary: %s", json.dumps(summary))
+
+
+def _record_node(name: str, seconds: float) -> None:
+    METRICS.observe("node_seconds", seconds, node=name)
+    record = _current.get()
+    if record is not None:
+        with _record_lock:
+            record.node_visits[name] = record.node_visits.get(name, 0) + 1
+            record.node_seconds[name] = record.node_seconds.get(name, 0.0) + seconds
+
+
+def instrument_node(name: str, func: Callable) -> Callable:
+    """Time every execution of a graph node function, sync or async."""
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def timed_async(state):
+            started = time.perf_counter()
+            try:
+                return await func(state)
+            finally:
+                _record_node(name, time.perf_counter() - started)
+        return timed_async
+
+    @functools.wraps(func)
+    def timed(state):
+        started = time.perf_counter()
+        try:
+            return func(state)
+        finally:
+            _record_node(name, time.perf_counter() - started)
+    return timed
+
+
+def model_cost(model: str, prompt: int, cached: int, completion: int) -> float:
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return 0.0
+    input_price, cached_price, output_price = prices
+    return ((prompt - cached) * input_price + cached * cached_price + completion * output_price) / 1_000_000
+
+
+def record_model_call(role: str, model: str, seconds: float, usage: Optional[Mapping[str, Any]]) -> None:
+    usage = usage or {}
+    prompt = usage.get("input_tokens", 0)
+    completion = usage.get("output_tokens", 0)
+    cached = (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+    cost = model_cost(model, prompt, cached, completion)
+    METRICS.observe("model_seconds", seconds, role=role)
+    METRICS.inc("model_tokens_total", prompt, role=role, kind="prompt")
+    METRICS.inc("model_tokens_total", cached, role=role, kind="cached_prompt")
+    METRICS.inc("model_tokens_total", completion, role=role, kind="completion")
+    METRICS.inc("model_cost_usd_total", cost, role=role)
+    _update(model_calls=1, model_seconds=seconds, prompt_tokens=prompt, cached_prompt_tokens=cached,
+            completion_tokens=completion, cost_usd=cost)
+
+
+def record_llm_cache_hit(role: str, kind: str) -> None:
+    METRICS.inc("llm_cache_hits_total", role=role, kind=kind)
+    _update(llm_cache_hits=1)
+
+
+def record_model_retry(role: str, provider: str, reason: str) -> None:
+    METRICS.inc("model_retries_total", role=role, provider=provider, reason=reason)
+    _update(model_retries=1)
+
+
+def record_model_fallback(role: str, provider: str) -> None:
+    METRICS.inc("model_fallbacks_total", role=role, provider=provider)
+    _update(model_fallbacks=1)
+
+
+def record_model_hedge(role: str, outcome: str) -> None:
+    METRICS.inc("model_hedges_total", role=role, outcome=outcome)
+    _update(model_hedges=1)
+
+
+def record_revision(role: str, outcome: str) -> None:
+    METRICS.inc("draft_revisions_total", role=role, outcome=outcome)
+    if outcome == "patched":
+        _update(patched_revisions=1)
+
+
+def record_speculation(outcome: str) -> None:
+    METRICS.inc("speculative_drafts_total", outcome=outcome)
+
+
+def record_tool_call(tool: str, seconds: float, outcome: str) -> None:
+    METRICS.observe("tool_seconds", seconds, tool=tool)
+    METRICS.inc("tool_calls_total", tool=tool, outcome=outcome)
+    _update(tool_calls=1, tool_seconds=seconds)
+
+
+def record_tool_timeout(tool: str) -> None:
+    METRICS.inc("tool_timeouts_total", tool=tool)
+    _update(tool_timeouts=1)
+
+
+def record_tool_cache_hit(engine: str) -> None:
+    METRICS.inc("tool_cache_hits_total", engine=engine)
+    _update(tool_cache_hits=1)
+
+
+def record_budget_exhausted(reason: str) -> None:
+    METRICS.inc("budget_exhausted_total", reason=reason)
+    record = _current.get()
+    if record is not None:
+        record.budget_exhausted = reason
+
+
+def stats_samples(prefix: str, stats: Mapping[str, Any], **labels: str) -> List[Sample]:
+    """Numeric entries of a ``stats()`` dict as gauge samples named ``<prefix>_<key>``."""
+    return [
+        (f"{prefix}_{key}", labels, float(value))
+        for key, value in stats.items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    ]
@@ -0,0 +1,357 @@
+from dataclasses import asdict, dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from wire import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+TERMINAL = (DONE, FAILED, CANCELLED)
+# Reported, never stored: a running job that was asked to stop and has not yet.
+CANCELLING = "cancelling"
+
+# (event, payload) pairs, as produced for the /chat stream.
+Event = Tuple[str, Dict[str, Any]]
+
+
+@dataclass
+class Job:
+    session_id: str
+    user_input: str
+    user_id: Optional[str] = None
+    stream: str = "delta"
+    # Optional client key; a resubmission with the same key returns the same job.
+    turn_id: Optional[str] = None
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = QUEUED
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    error: str = ""
+    event_count: int = 0
+
+
+_COLUMNS = tuple(Job.__dataclass_fields__)
+
+
+class JobStore:
+    """Jobs and their event logs in SQLite, so results outlive the request and the process.
+
+    Token events are committed in batches; every other event is committed as it is
+    appended, so a reader never sees a step without the tokens before it.
+    """
+
+    def __init__(self, path: str = ":memory:", token_batch: int = 64):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._uncommitted = 0
+        self.token_batch = token_batch
+        with self._lock:
+            if path != ":memory:":
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, session_id TEXT NOT NULL, user_input TEXT NOT NULL,"
+                " user_id TEXT, stream TEXT NOT NULL, turn_id TEXT, status TEXT NOT NULL, created REAL NOT NULL,"
+                " started REAL, finished REAL, error TEXT NOT NULL, event_count INTEGER NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS jobs_session ON jobs (session_id, created)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS job_events (job_id TEXT NOT NULL, seq INTEGER NOT NULL, event TEXT NOT NULL,"
+                " payload BLOB NOT NULL, PRIMARY KEY (job_id, seq))"
+            )
+            self._db.commit()
+
+    def _row(self, row: Optional[tuple]) -> Optional[Job]:
+        return Job(**dict(zip(_COLUMNS, row))) if row else None
+
+    def create(self, job: Job) -> None:
+        with self._lock:
+            self._db.execute(f"INSERT INTO jobs ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                             tuple(asdict(job).values()))
+            self._db.commit()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._row(self._db.execute(f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE job_id = ?", (job_id,)).fetchone())
+
+    def latest(self, session_id: str, turn_id: Optional[str] = None) -> Optional[Job]:
+        """The session's newest job, or the one submitted with ``turn_id``."""
+        query = f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE session_id = ?"
+        params: tuple = (session_id,)
+        if turn_id:
+            query, params = query + " AND turn_id = ?", params + (turn_id,)
+        with self._lock:
+            return self._row(self._db.execute(query + " ORDER BY created DESC LIMIT 1", params).fetchone())
+
+    def with_status(self, *statuses: str) -> List[Job]:
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE status IN ({', '.join('?' * len(statuses))}) ORDER BY created",
+                statuses,
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def update(self, job: Job) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, started = ?, finished = ?, error = ?, event_count = ? WHERE job_id = ?",
+                (job.status, job.started, job.finished, job.error, job.event_count, job.job_id),
+            )
+            self._db.commit()
+            self._uncommitted = 0
+
+    def append(self, job: Job, event: str, payload: Dict[str, Any]) -> int:
+        """Store the job's next event and return its sequence number."""
+        with self._lock:
+            seq = job.event_count
+            self._db.execute("INSERT INTO job_events (job_id, seq, event, payload) VALUES (?, ?, ?, ?)",
+                             (job.job_id, seq, event, dumps(payload)))
+            job.event_count = seq + 1
+            self._uncommitted += 1
+            if event != "token" or self._uncommitted >= self.token_batch:
+                self._db.execute("UPDATE jobs SET event_count = ? WHERE job_id = ?", (job.event_count, job.job_id))
+                self._db.commit()
+                self._uncommitted = 0
+        return seq
+
+    def events(self, job_id: str, offset: int = 0, limit: int = 500) -> List[Tuple[int, str, Dict[str, Any]]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, event, payload FROM job_events WHERE job_id = ? AND seq >= ? ORDER BY seq LIMIT ?",
+                (job_id, offset, limit),
+            ).fetchall()
+        return [(seq, event, loads(payload)) for seq, event, payload in rows]
+
+    def last_event(self, job_id: str, event: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT payload FROM job_events WHERE job_id = ? AND event = ? ORDER BY seq DESC LIMIT 1", (job_id, event)
+            ).fetchone()
+        return loads(row[0]) if row else None
+
+    def close(self) -> None:
+        # Closing the last connection folds the write-ahead log back into the database file.
+        with self._lock:
+            self._db.commit()
+            self._db.close()
+
+    def purge(self, before: float) -> int:
+        """Drop finished jobs, and their events, that ended before ``before``."""
+        with self._lock:
+            old = [row[0] for row in self._db.execute(
+                f"SELECT job_id FROM jobs WHERE finished < ? AND status IN ({', '.join('?' * len(TERMINAL))})", (before, *TERMINAL)
+            )]
+            for job_id in old:
+                self._db.execute("DELETE FROM job_events WHERE job_id = ?", (job_id,))
+                self._db.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+            self._db.commit()
+        return len(old)
+
+
+class JobManager:
+    """Runs submitted chat turns on a pool of worker tasks, detached from any client.
+
+    ``run`` turns a job into its (event, payload) stream, the same events /chat sends;
+    each one is appended to the store as it arrives, and readers follow the log from
+    any offset. Workers start on the first submission, which also requeues jobs a
+    previous process left queued and fails the ones it left running. Every store call
+    runs in a thread, as SQLite reads and commits would otherwise block the event loop.
+    """
+
+    def __init__(self, store: JobStore, run: Callable[[Job], AsyncIterator[Event]], workers: int = 4,
+                 max_queue: int = 256, ttl_seconds: float = 86400.0):
+        self.store = store
+        self.run = run
+        self.workers = workers
+        self.max_queue = max_queue
+        self.ttl_seconds = ttl_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        self._starting: Optional[asyncio.Future] = None
+        # Held from the lookup to the insert, so a turn submitted twice at once still makes one job.
+        self._submitting = asyncio.Lock()
+        self._tasks: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._changed: Dict[str, asyncio.Event] = {}
+        # Queued jobs cancelled in this process; noted before the store is, so no worker picks one up meanwhile.
+        self._cancelled: Set[str] = set()
+        self._purged = 0.0
+        self._closing = False
+        self.metrics = {"submitted": 0, "reused": 0, "done": 0, "failed": 0, "cancelled": 0}
+
+    def _recover(self) -> List[Job]:
+        # The previous process's jobs: running ones are failed, queued ones returned to be run.
+        for job in self.store.with_status(RUNNING):
+            job.status, job.error, job.finished = FAILED, "interrupted by a server restart", time.time()
+            self.store.update(job)
+        return self.store.with_status(QUEUED)
+
+    async def _start(self) -> None:
+        # Submissions racing the first one all wait for the same recovery.
+        if self._starting is None:
+            self._starting = asyncio.ensure_future(self._start_workers())
+        await self._starting
+
+    async def _start_workers(self) -> None:
+        queue: asyncio.Queue = asyncio.Queue()
+        for job in await asyncio.to_thread(self._recover):
+            queue.put_nowait(job)
+        self._queue = queue
+        self._tasks = [asyncio.create_task(self._work(), name=f"job-worker-{i}") for i in range(self.workers)]
+
+    async def submit(self, job: Job) -> Tuple[Job, bool]:
+        """Queue ``job``, or return the session's matching job and True if this turn was already submitted.
+
+        Without a ``turn_id``, a resubmission of the session's latest input (e.g. after a
+        reconnect) reuses that job only while it is still queued or running; the same
+        text sent again after it finished is a new turn.
+        """
+        await self._start()
+        async with self._submitting:
+            previous = await asyncio.to_thread(self.store.latest, job.session_id, job.turn_id)
+            if previous is not None and (
+                    previous.status not in (FAILED, CANCELLED) if job.turn_id
+                    else previous.status in (QUEUED, RUNNING) and previous.user_input == job.user_input):
+                self.metrics["reused"] += 1
+                return previous, True
+            if self.max_queue and self._queue.qsize() >= self.max_queue:
+                raise OverflowError("job queue is full")
+            await self._purge()
+            await asyncio.to_thread(self.store.create, job)
+        self._queue.put_nowait(job)
+        self.metrics["submitted"] += 1
+        return job, False
+
+    async def _purge(self) -> None:
+        now = time.time()
+        if self.ttl_seconds and now - self._purged > 60:
+            self._purged = now
+            await asyncio.to_thread(self.store.purge, now - self.ttl_seconds)
+
+    def _notify(self, job_id: str) -> None:
+        changed = self._changed.pop(job_id, None)
+        if changed is not None:
+            changed.set()
+
+    async def _work(self) -> None:
+        while True:
+            job = await self._queue.get()
+            current = await asyncio.to_thread(self.store.get, job.job_id)
+            cancelled = job.job_id in self._cancelled
+            self._cancelled.discard(job.job_id)
+            if cancelled or current is None or current.status != QUEUED:
+                continue  # cancelled or purged while waiting
+            task = asyncio.create_task(self._execute(job))
+            self._running[job.job_id] = task
+            try:
+                await task
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    raise  # the worker itself is shutting down, not just this job
+            finally:
+                self._running.pop(job.job_id, None)
+
+    async def _execute(self, job: Job) -> None:
+        job.status, job.started = RUNNING, time.time()
+        await asyncio.to_thread(self.store.update, job)
+        self._notify(job.job_id)
+        try:
+            async for event, payload in self.run(job):
+                await asyncio.to_thread(self.store.append, job, event, payload)
+                self._notify(job.job_id)
+            job.status = DONE
+        except asyncio.CancelledError:
+            if self._closing:
+                job.status, job.error = FAILED, "interrupted by a server shutdown"
+            else:
+                job.status = CANCELLED
+            raise
+        except Exception as exc:
+            logger.exception("💥 Job %s failed", job.job_id)
+            job.status, job.error = FAILED, str(exc) or type(exc).__name__
+            await asyncio.to_thread(self.store.append, job, "error", {"error": job.error})
+        finally:
+            job.finished = time.time()
+            self.metrics[job.status] = self.metrics.get(job.status, 0) + 1
+            await asyncio.to_thread(self.store.update, job)
+            self._notify(job.job_id)
+
+    async def cancel(self, job_id: str, wait: float = 5.0) -> Optional[Job]:
+        """Cancel the job and return it as it stands afterwards.
+
+        A running job gets ``wait`` seconds to record that it was cancelled; one still
+        finishing its current step by then is returned as ``cancelling``.
+        """
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None or job.status in TERMINAL:
+            return job
+        task = self._running.get(job_id)
+        if task is None:
+            job.status, job.finished = CANCELLED, time.time()
+            self._cancelled.add(job_id)
+            await asyncio.to_thread(self.store.update, job)
+            self.metrics["cancelled"] += 1
+            self._notify(job_id)
+            return job
+        task.cancel()
+        await asyncio.wait({task}, timeout=wait)
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is not None and job.status not in TERMINAL:
+            job.status = CANCELLING
+        return job
+
+    async def follow(self, job_id: str, offset: int = 0, poll: float = 1.0) -> AsyncIterator[Tuple[int, str, Dict[str, Any]]]:
+        """The job's events from ``offset`` on, live until the job ends."""
+        while True:
+            # Registered before reading, so an event appended in between still wakes us.
+            changed = self._changed.setdefault(job_id, asyncio.Event())
+            events = await asyncio.to_thread(self.store.events, job_id, offset)
+            for seq, event, payload in events:
+                yield seq, event, payload
+                offset = seq + 1
+            if events:
+                continue
+            job = await asyncio.to_thread(self.store.get, job_id)
+            if job is None or (job.status in TERMINAL and offset >= job.event_count):
+                return
+            try:
+                # The timeout also picks up jobs run by another process sharing the store.
+                await asyncio.wait_for(changed.wait(), poll)
+            except asyncio.TimeoutError:
+                pass
+
+    async def aclose(self) -> None:
+        """Stop the workers, failing the jobs they were running, and close the store."""
+        self._closing = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.store.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.metrics, "queue_length": self._queue.qsize() if self._queue else 0, "running": len(self._running)}
+
+
+def build_job_store() -> JobStore:
+    """SQLite file at JOB_STORE_PATH, else jobs.sqlite in DATA_DIR; without either, jobs last as long as the process."""
+    data_dir = os.getenv("DATA_DIR")
+    return JobStore(os.getenv("JOB_STORE_PATH") or (os.path.join(data_dir, "jobs.sqlite") if data_dir else ":memory:"))
+
+
+def build_job_manager(run: Callable[[Job], AsyncIterator[Event]]) -> JobManager:
+    """JOB_WORKERS concurrent turns, JOB_MAX_QUEUE waiting ones, finished jobs kept for JOB_TTL_SECONDS."""
+    return JobManager(
+        build_job_store(),
+        run,
+        workers=int(os.getenv("JOB_WORKERS", "4")),
+        max_queue=int(os.getenv("JOB_MAX_QUEUE", "256")),
+        ttl_seconds=float(os.getenv("JOB_TTL_SECONDS", "86400")),
+    )
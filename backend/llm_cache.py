@@ -0,0 +1,177 @@
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from langchain_core.messages import AIMessage, BaseMessage
+import hashlib
+import json
+import os
+import re
+import threading
+import zlib
+import numpy as np
+
+
+def _message_signature(message: BaseMessage) -> List[Any]:
+    # Message and tool-call ids change on every run, so only content-bearing fields count.
+    tool_calls = [[tc.get("name"), tc.get("args")] for tc in getattr(message, "tool_calls", None) or []]
+    return [message.type, message.content, getattr(message, "name", None), tool_calls]
+
+
+def prompt_key(role: str, messages: Sequence[BaseMessage]) -> str:
+    raw = json.dumps([role, [_message_signature(m) for m in messages]], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _latest_request(messages: Sequence[BaseMessage]) -> int:
+    for i in range(len(messages) - 1, -1, -1):
+        if messages[i].type == "human":
+            return i
+    return -1
+
+
+def prompt_shape(role: str, messages: Sequence[BaseMessage]) -> str:
+    """Everything but the latest user message; semantic hits must match it exactly."""
+    latest = _latest_request(messages)
+    rest = [m for i, m in enumerate(messages) if i != latest]
+    return prompt_key(role, rest) + f":{latest}"
+
+
+def request_text(messages: Sequence[BaseMessage]) -> str:
+    latest = _latest_request(messages)
+    return str(messages[latest].content) if latest >= 0 else ""
+
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def hashed_embedding(text: str, dim: int = 512) -> np.ndarray:
+    """Local CPU-only embedding: L2-normalised feature hashing of words and word bigrams."""
+    words = _TOKEN_RE.findall(text.lower())
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature in features:
+        h = zlib.crc32(feature.encode())
+        vector[h % dim] += 1.0 if (h >> 31) & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticIndex:
+    """Fixed-capacity cosine index over unit vectors, scored with one matrix-vector product."""
+
+    def __init__(self, capacity: int, dim: int = 512):
+        self.dim = dim
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._keys: List[Optional[str]] = [None] * capacity
+        self._shapes: List[Optional[str]] = [None] * capacity
+        self._slots: Dict[str, int] = {}
+        self._free = list(range(capacity - 1, -1, -1))
+
+    def add(self, key: str, shape: str, vector: np.ndarray) -> None:
+        if key in self._slots or not self._free:
+            return
+        slot = self._free.pop()
+        self._vectors[slot] = vector
+        self._keys[slot] = key
+        self._shapes[slot] = shape
+        self._slots[key] = slot
+
+    def remove(self, key: str) -> None:
+        slot = self._slots.pop(key, None)
+        if slot is None:
+            return
+        self._vectors[slot] = 0.0
+        self._keys[slot] = None
+        self._shapes[slot] = None
+        self._free.append(slot)
+
+    def nearest(self, shape: str, vector: np.ndarray) -> Tuple[Optional[str], float]:
+        if not self._slots:
+            return None, 0.0
+        scores = self._vectors @ vector
+        # Empty slots score 0 (zero vectors); slots for a different prompt are masked out.
+        mask = np.fromiter((s == shape for s in self._shapes), dtype=bool, count=len(self._shapes))
+        scores = np.where(mask, scores, -1.0)
+        best = int(np.argmax(scores))
+        return self._keys[best], float(scores[best])
+
+
+class LLMCache:
+    """Opt-in response cache for agent model calls.
+
+    Exact hits match the role plus the full prompt (system prompt and message list,
+    ignoring ids). Roles in ``semantic_roles`` may also reuse the response of a cached
+    prompt that differs only in the wording of the latest user message, when the
+    cosine similarity of the two messages' embeddings reaches ``similarity``. Entries
+    are evicted least recently used.
+    """
+
+    def __init__(self, roles: Iterable[str] = (), semantic_roles: Iterable[str] = (), max_entries: int = 512, similarity: float = 0.97):
+        self.roles = set(roles)
+        self.semantic_roles = set(semantic_roles) & self.roles
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self._entries: "OrderedDict[str, AIMessage]" = OrderedDict()
+        self._index = SemanticIndex(max_entries)
+        self._lock = threading.Lock()
+        self.metrics: Dict[str, Dict[str, int]] = {}
+
+    def enabled(self, role: str) -> bool:
+        return role in self.roles
+
+    def _count(self, role: str, name: str, amount: int = 1) -> None:
+        counters = self.metrics.setdefault(role, {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "tokens_saved": 0})
+        counters[name] += amount
+
+    def lookup(self, role: str, messages: Sequence[BaseMessage]) -> Optional[AIMessage]:
+        if not self.enabled(role):
+            return None
+        key = prompt_key(role, messages)
+        with self._lock:
+            kind = "exact_hits"
+            cached = self._entries.get(key)
+            if cached is None and role in self.semantic_roles:
+                near, score = self._index.nearest(prompt_shape(role, messages), hashed_embedding(request_text(messages)))
+                if near is not None and score >= self.similarity:
+                    key, cached, kind = near, self._entries.get(near), "semantic_hits"
+            if cached is None:
+                self._count(role, "misses")
+                return None
+            self._entries.move_to_end(key)
+            self._count(role, kind)
+            usage = cached.usage_metadata or {}
+            self._count(role, "tokens_saved", usage.get("total_tokens", 0))
+        # A fresh id keeps add_messages from treating the replay as an edit of the original.
+        return cached.model_copy(update={"id": None, "response_metadata": {**cached.response_metadata, "llm_cache": kind}}, deep=True)
+
+    def store(self, role: str, messages: Sequence[BaseMessage], response: AIMessage) -> None:
+        if not self.enabled(role):
+            return
+        key = prompt_key(role, messages)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            while len(self._entries) >= self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._index.remove(evicted)
+            self._entries[key] = response.model_copy(deep=True)
+            if role in self.semantic_roles:
+                self._index.add(key, prompt_shape(role, messages), hashed_embedding(request_text(messages)))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "roles": {r: dict(c) for r, c in self.metrics.items()}}
+
+
+def _roles(name: str) -> List[str]:
+    return [r.strip() for r in os.getenv(name, "").split(",") if r.strip()]
+
+
+def build_llm_cache() -> LLMCache:
+    """Disabled unless LLM_CACHE_ROLES lists roles, e.g. "coordinator,drafter"."""
+    return LLMCache(
+        roles=_roles("LLM_CACHE_ROLES"),
+        semantic_roles=_roles("LLM_CACHE_SEMANTIC_ROLES"),
+        max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512")),
+        similarity=float(os.getenv("LLM_CACHE_SIMILARITY", "0.97")),
+    )
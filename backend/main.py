@@ -1,52 +1,362 @@
-from typing import Dict, Any, AsyncIterator
-from fastapi import FastAPI
-from fastapi.responses import StreamingResponse
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+import asyncio
+import logging
+import os
+from typing import Annotated, Dict, Any, AsyncIterator, List, Literal, Set
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import iterate_in_threadpool
 from pydantic import BaseModel
 from langchain_core.messages import HumanMessage
-from agent_logic import build_app, deserialize_state, serialize_state, empty_state
+from admission import AdmissionRejected, build_admission
+from batch import build_batch_checkpoint, batch_key, parse_items, run_batch
+from agent_logic import build_app, serialize_final, serialize_state, serialize_update
+from instrumentation import METRICS, configure_logging, stats_samples, track_request
+from jobs import DONE, Event, Job, build_job_manager
+from patching import looks_like_patch, patch_diff
+from session_store import build_checkpointer
+from wire import NDJSON_MEDIA_TYPE, dumps, encode_event, negotiate
+import agent_logic
 
+configure_logging()
+logger = logging.getLogger(__name__)
 
-print("🚀 Starting FastAPI server initialization...")
-api = FastAPI(title="Agent Backend")
-print("📊 Building LangGraph app...")
-app_graph = build_app()
-print("✅ LangGraph app built successfully!")
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    yield
+    # Closing the SQLite stores checkpoints their write-ahead logs into the database files.
+    await JOBS.aclose()
+    BATCH_CHECKPOINT.close()
+    agent_logic.TOOL_CACHE.close()
+
+
+logger.info("🚀 Starting FastAPI server initialization...")
+api = FastAPI(title="Agent Backend", lifespan=lifespan)
+logger.info("📊 Building LangGraph app...")
+# Conversation state lives server-side, keyed by session id (SESSION_STORE=memory|sqlite).
+app_graph = build_app(checkpointer=build_checkpointer())
+logger.info("✅ LangGraph app built successfully!")
+
+# "async" drives the graph with astream() and async nodes; "sync" runs the blocking
+# stream() in a worker thread. Neither blocks the event loop.
+EXECUTION_MODE = os.getenv("GRAPH_EXECUTION_MODE", "async")
+
+# Nodes whose LLM output is forwarded token by token as "token" events in delta mode.
+TOKEN_STREAM_NODES = ("Draft_node", "Edit_node")
+
+# The document field each of those nodes revises; a revision made with a patch is streamed
+# as its edits (a "diff" against the field's previous value) instead of the full text.
+REVISED_FIELDS = {"Draft_node": "draft_text", "Edit_node": "final_response"}
+
+# Global, per-session and per-user caps on running /chat requests, with a bounded queue.
+ADMISSION = build_admission()
 
 
 class ChatRequest(BaseModel):
+    session_id: str
     user_input: str
-    conversation_state: Dict[str, Any] | None = None
+    # Optional; requests that carry it are also capped per user (CHAT_MAX_PER_USER).
+    user_id: str | None = None
+    # "delta" step events carry only what each node changed; "full" resends the whole state.
+    stream: Literal["delta", "full"] = "delta"
 
 
-async def stream_chat(state_payload: Dict[str, Any]) -> AsyncIterator[str]:
-    for step in app_graph.stream(state_payload, stream_mode="values"):
-        yield f"data: {serialize_state(step)}\n\n"
+def session_config(session_id: str) -> Dict[str, Any]:
+    return {"configurable": {"thread_id": session_id}}
 
 
-@api.post("/chat")
-async def chat_handler(req: ChatRequest):
-    print(f"📨 Received chat request: '{req.user_input[:50]}{'...' if len(req.user_input) > 50 else ''}'")
-    print("🔄 Deserializing state...")
-    state = deserialize_state(req.conversation_state or empty_state())
-    print("💬 Adding user message to state...")
-    updated_messages = list(state["messages"]) + [HumanMessage(content=req.user_input)]
-    state["messages"] = updated_messages
-    print(f"📊 Current state has {len(state['messages'])} messages")
+def graph_steps(graph_input: Dict[str, Any], config: Dict[str, Any], stream_mode: str | List[str] = "values") -> AsyncIterator[Any]:
+    if EXECUTION_MODE == "sync":
+        return iterate_in_threadpool(app_graph.stream(graph_input, config, stream_mode=stream_mode))
+    return app_graph.astream(graph_input, config, stream_mode=stream_mode)
 
-    async def iterator():
-        print("🔄 Starting graph stream...")
+
+def _diffed(node: str, known: Dict[str, Any], payload: Dict[str, Any], update: Dict[str, Any]) -> Dict[str, Any]:
+    # Budget usage goes out in its own "budget" event and with the final state, not with every step.
+    payload = {**payload, "changes": {k: v for k, v in payload["changes"].items() if k != "budget"}}
+    field = REVISED_FIELDS.get(node)
+    if field not in payload["changes"] or not update.get("messages"):
+        return payload
+    base = known.get("draft_text", "") if field == "final_response" else known.get("final_response") or known.get("draft_text", "")
+    edits = patch_diff(base, update["messages"][-1].content, update[field])
+    if edits is None:
+        return payload
+    changes = {k: v for k, v in payload["changes"].items() if k != field}
+    return {**payload, "changes": changes, "diff": {"field": field, "edits": edits}}
+
+
+async def stream_chat(graph_input: Dict[str, Any], config: Dict[str, Any]) -> AsyncIterator[bytes]:
+    async for step in graph_steps(graph_input, config):
+        yield encode_event("step", serialize_state(step))
+
+
+async def turn_events(session_id: str, user_input: str, stream: str = "delta") -> AsyncIterator[Event]:
+    """Run one chat turn and yield its (event, payload) pairs: steps, tokens, budget and the final state."""
+    # The checkpointer restores the session's state; only the new message is sent in.
+    config = session_config(session_id)
+    graph_input = {"messages": [HumanMessage(content=user_input)]}
+
+    async def full_steps():
         step_count = 0
-        for step in app_graph.stream(state, stream_mode="values"):
+        async for step in graph_steps(graph_input, config):
             step_count += 1
-            print(f"📈 Stream step {step_count}: {step.get('router', 'unknown')} node")
-            yield (serialize_state(step) | {"event": "step"}).__repr__() + "\n"
-        print("🏁 Stream completed, getting final state...")
-        # return final state
-        final_state = app_graph.invoke(state)
-        print("✅ Final state obtained, sending to client...")
-        yield (serialize_state(final_state) | {"event": "final"}).__repr__() + "\n"
-        print("🎉 Response sent successfully!")
+            logger.debug("📈 Stream step %d: %s node", step_count, step.get("router", "unknown"))
+            yield step, ("step", serialize_state(step))
+
+    async def delta_steps():
+        # "values" chunks keep the known state current; "updates" chunks are diffed against it;
+        # "messages" chunks carry LLM tokens as they are generated.
+        known: Dict[str, Any] = {}
+        streamed: Dict[str, str] = {}
+        sent: Dict[str, int] = {}
+        async for mode, chunk in graph_steps(graph_input, config, ["values", "updates", "messages"]):
+            if mode == "values":
+                known = chunk
+                yield known, None
+                continue
+            if mode == "messages":
+                message, metadata = chunk
+                node = metadata.get("langgraph_node")
+                if node in TOKEN_STREAM_NODES and isinstance(message.content, str) and message.content:
+                    # A patch is not document text; its edits arrive with the node's step. Tokens
+                    # are held back until the reply's opening shows which of the two it is.
+                    text = streamed[message.id] = streamed.get(message.id, "") + message.content
+                    if looks_like_patch(text) is False:
+                        yield known, ("token", {"node": node, "content": text[sent.get(message.id, 0):]})
+                        sent[message.id] = len(text)
+                continue
+            for node, update in (chunk or {}).items():
+                if not update:
+                    continue
+                logger.debug("📈 Stream step: %s", node)
+                yield known, ("step", {"node": node} | _diffed(node, known, serialize_update(known, update), update))
+
+    logger.debug("🔄 Starting graph stream...")
+    with track_request(session_id, mode=stream):
+        final_state = graph_input
+        steps = delta_steps() if stream == "delta" else full_steps()
+        # The first state is the checkpoint as restored, still carrying the previous request's budget.
+        reported_budget = None
+        async for state, event in steps:
+            if final_state is graph_input:
+                reported_budget = state.get("budget")
+            final_state = state
+            if event is not None:
+                yield event
+            usage = state.get("budget")
+            if usage and usage != reported_budget:
+                reported_budget = usage
+                yield "budget", usage
+        # The last "values" step is the final state; re-running the graph would
+        # repeat every LLM and SerpAPI call of the turn. Delta clients already have the
+        # turn's messages, so theirs carries only the last one, not the whole history.
+        logger.debug("🏁 Stream completed, sending final state to client...")
+        yield "final", serialize_final(final_state) if stream == "delta" else serialize_state(final_state)
+    logger.debug("🎉 Response sent successfully!")
+
+
+def _rejected(exc: AdmissionRejected) -> HTTPException:
+    return HTTPException(status_code=429, detail=exc.reason, headers={"Retry-After": str(round(exc.retry_after))})
+
+
+def _admit(session_id: str, user_id: str | None):
+    try:
+        return ADMISSION.enqueue(session_id, user_id)
+    except AdmissionRejected as exc:
+        logger.warning("🚧 Rejected chat request for session %s: %s", session_id, exc.reason)
+        raise _rejected(exc)
+
+
+@api.post("/chat")
+async def chat_handler(req: ChatRequest, accept: Annotated[str | None, Header()] = None):
+    logger.info("📨 Received chat request for session %s: %r", req.session_id, req.user_input[:50] + ("..." if len(req.user_input) > 50 else ""))
+    media_type = negotiate(accept)
+    ticket = _admit(req.session_id, req.user_id)
+
+    async def iterator():
+        try:
+            try:
+                async for position in ADMISSION.wait(ticket):
+                    yield encode_event("queued", {"position": position}, media_type=media_type)
+            except AdmissionRejected as exc:
+                logger.warning("🚧 Chat request for session %s left the queue: %s", req.session_id, exc.reason)
+                yield encode_event("rejected", {"reason": exc.reason, "retry_after": exc.retry_after}, media_type=media_type)
+                return
+            async for event, payload in turn_events(req.session_id, req.user_input, req.stream):
+                yield encode_event(event, payload, media_type=media_type)
+        finally:
+            ADMISSION.release(ticket)
+
+    # The background task also frees the slot if the client leaves before the body starts.
+    return StreamingResponse(iterator(), media_type=media_type, background=BackgroundTask(ADMISSION.release, ticket))
+
+
+async def job_events(job: Job) -> AsyncIterator[Event]:
+    # Jobs obey the same admission limits as /chat, but wait out a full queue instead of failing.
+    while True:
+        try:
+            ticket = ADMISSION.enqueue(job.session_id, job.user_id)
+        except AdmissionRejected as exc:
+            await asyncio.sleep(exc.retry_after)
+            continue
+        try:
+            async for position in ADMISSION.wait(ticket):
+                yield "queued", {"position": position}
+        except AdmissionRejected as exc:
+            await asyncio.sleep(exc.retry_after)
+            continue
+        except BaseException:
+            # Cancelled while queued: the ticket would otherwise be admitted later and never released.
+            ADMISSION.release(ticket)
+            raise
+        try:
+            async for item in turn_events(job.session_id, job.user_input, job.stream):
+                yield item
+        finally:
+            ADMISSION.release(ticket)
+        return
+
+
+# Turns submitted to /jobs run on a worker pool and log their events to SQLite (JOB_STORE_PATH).
+JOBS = build_job_manager(job_events)
+
+
+class JobRequest(ChatRequest):
+    # Optional idempotency key: resubmitting a turn with the same key returns the same job.
+    turn_id: str | None = None
+
+
+async def _job_view(job: Job) -> Dict[str, Any]:
+    view = asdict(job)
+    if job.status == DONE:
+        view["result"] = await asyncio.to_thread(JOBS.store.last_event, job.job_id, "final")
+    return view
+
+
+async def _job(job_id: str) -> Job:
+    job = await asyncio.to_thread(JOBS.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="unknown job")
+    return job
+
+
+@api.post("/jobs", status_code=202)
+async def submit_job(req: JobRequest):
+    """Run a chat turn in the background; poll GET /jobs/{id} or stream GET /jobs/{id}/events."""
+    logger.info("📨 Received job for session %s: %r", req.session_id, req.user_input[:50] + ("..." if len(req.user_input) > 50 else ""))
+    try:
+        job, reused = await JOBS.submit(Job(session_id=req.session_id, user_input=req.user_input, user_id=req.user_id,
+                                            stream=req.stream, turn_id=req.turn_id))
+    except OverflowError as exc:
+        raise HTTPException(status_code=429, detail=str(exc), headers={"Retry-After": "30"})
+    return {"job": asdict(job), "reused": reused}
+
+
+@api.get("/jobs")
+async def latest_job(session_id: str):
+    """The session's most recent job, so a reconnecting client can pick its turn back up."""
+    job = await asyncio.to_thread(JOBS.store.latest, session_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="no jobs for this session")
+    return await _job_view(job)
+
+
+@api.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    return await _job_view(await _job(job_id))
+
+
+@api.get("/jobs/{job_id}/events")
+async def job_event_stream(job_id: str, offset: int = 0, accept: Annotated[str | None, Header()] = None,
+                           last_event_id: Annotated[str | None, Header()] = None):
+    """The job's events from ``offset`` (or after the SSE Last-Event-ID), following it until it ends."""
+    await _job(job_id)
+    media_type = negotiate(accept)
+    if last_event_id and last_event_id.isdigit():
+        offset = max(offset, int(last_event_id) + 1)
+
+    async def iterator():
+        async for seq, event, payload in JOBS.follow(job_id, offset):
+            yield encode_event(event, {**payload, "seq": seq}, media_type=media_type, event_id=seq)
+
+    return StreamingResponse(iterator(), media_type=media_type)
+
+
+@api.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    await _job(job_id)
+    return await _job_view(await JOBS.cancel(job_id))
+
+
+# Batch items run as throwaway sessions on their own graph, so they never crowd the chat session store.
+batch_graph = build_app(checkpointer=build_checkpointer("memory"))
+BATCH_CHECKPOINT = build_batch_checkpoint()
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+# At most BATCH_MAX_ACTIVE batches stream at once; each of their running items also holds an ADMISSION slot.
+BATCH_MAX_ACTIVE = int(os.getenv("BATCH_MAX_ACTIVE", "4"))
+ACTIVE_BATCHES: Set[object] = set()
+
+
+@api.post("/batch")
+async def batch_handler(request: Request, concurrency: int = 8, batch_id: str | None = None):
+    """Draft every JSONL request in the body; results stream back as JSONL in completion order.
+
+    Finished items are checkpointed under ``batch_id`` (by default a hash of the body, returned
+    in X-Batch-Id), so resending an interrupted batch only runs what is left.
+    """
+    try:
+        items = parse_items((await request.body()).decode().splitlines())
+    except (UnicodeDecodeError, ValueError) as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    batch = batch_id or batch_key(items)
+    concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+    try:
+        if BATCH_MAX_ACTIVE and len(ACTIVE_BATCHES) >= BATCH_MAX_ACTIVE:
+            raise AdmissionRejected("too_many_batches", retry_after=30.0)
+        # Items wait for chat slots once the batch runs, but a saturated server turns it away now.
+        ADMISSION.ensure_room()
+    except AdmissionRejected as exc:
+        logger.warning("🚧 Rejected batch %s: %s", batch, exc.reason)
+        raise _rejected(exc)
+    logger.info("📦 Received batch %s with %d items (concurrency %d)", batch, len(items), concurrency)
+    running = object()
+    ACTIVE_BATCHES.add(running)
+
+    async def iterator():
+        try:
+            async for result in run_batch(batch_graph, items, concurrency, BATCH_CHECKPOINT, batch, ADMISSION):
+                yield dumps(result) + b"\n"
+        finally:
+            ACTIVE_BATCHES.discard(running)
+
+    # As with /chat, the background task also frees the batch's place if the client leaves before the body starts.
+    return StreamingResponse(iterator(), media_type=NDJSON_MEDIA_TYPE, headers={"X-Batch-Id": batch},
+                             background=BackgroundTask(ACTIVE_BATCHES.discard, running))
+
+
+def cache_samples():
+    # Looked up on every scrape: the caches are module globals that can be swapped at runtime.
+    samples = stats_samples("tool_cache", agent_logic.TOOL_CACHE.stats())
+    llm_cache = agent_logic.LLM_CACHE.stats()
+    samples += stats_samples("llm_cache", {"entries": llm_cache["entries"]})
+    for role, counters in llm_cache["roles"].items():
+        samples += stats_samples("llm_cache", counters, role=role)
+    for role, counters in agent_logic.PROMPT_CACHE.stats().items():
+        samples += stats_samples("prompt_cache", counters, role=role)
+    samples += stats_samples("admission", ADMISSION.stats())
+    samples += stats_samples("jobs", JOBS.stats())
+    session_count = getattr(app_graph.checkpointer, "session_count", None)
+    if session_count is not None:
+        samples.append(("sessions", {}, float(session_count())))
+    return samples
+
 
-    return StreamingResponse(iterator(), media_type="text/event-stream")
+METRICS.register_collector(cache_samples)
 
 
+@api.get("/metrics")
+def metrics_handler():
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,202 @@
+"""Compact, append-only conversation history for the agent state.
+
+``AgentState.messages`` holds a ``MessageLog`` instead of a list of LangChain
+messages. Each message is stored as a slotted ``Record`` with only the fields the
+agents use (no response metadata or token usage), and becomes a ``BaseMessage``
+again only when it is read, i.e. when a prompt is built or the state is sent to a
+client. Nodes return just their new messages and the ``append_messages`` reducer
+adds them to the log.
+
+A log is a view of the first ``len(log)`` records of a backing list that views
+share. Appending at the end of the backing list is O(1) and leaves every older
+view unchanged; appending to an older view (a branch) copies it first. Records
+have stable ids, so a message appended again, e.g. a subgraph's reply handed back
+to the parent graph, is recognised rather than duplicated.
+"""
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union, overload
+import threading
+import uuid
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage, convert_to_messages
+
+# Appends to one backing list may come from several graph branches at once.
+_lock = threading.Lock()
+
+
+class Record:
+    """One message as stored in the log."""
+
+    __slots__ = ("id", "type", "content", "name", "tool_calls", "tool_call_id")
+
+    def __init__(self, id: str, type: str, content: Any, name: Optional[str] = None, tool_calls: Optional[list] = None,
+                 tool_call_id: Optional[str] = None):
+        self.id = id
+        self.type = type
+        self.content = content
+        self.name = name
+        self.tool_calls = tool_calls or None
+        self.tool_call_id = tool_call_id
+
+    @classmethod
+    def from_message(cls, msg: BaseMessage) -> "Record":
+        if isinstance(msg, AIMessage):
+            # Chunks (e.g. from streaming) are stored as the message they add up to.
+            return cls(msg.id or str(uuid.uuid4()), "ai", msg.content, msg.name, list(msg.tool_calls))
+        if isinstance(msg, ToolMessage):
+            return cls(msg.id or str(uuid.uuid4()), "tool", msg.content, msg.name, tool_call_id=msg.tool_call_id)
+        if isinstance(msg, (HumanMessage, SystemMessage)):
+            return cls(msg.id or str(uuid.uuid4()), msg.type, msg.content, msg.name)
+        raise TypeError(f"Unsupported message type in the message log: {type(msg).__name__}")
+
+    def to_message(self) -> BaseMessage:
+        if self.type == "ai":
+            return AIMessage(content=self.content, id=self.id, name=self.name, tool_calls=self.tool_calls or [])
+        if self.type == "tool":
+            return ToolMessage(content=self.content, id=self.id, name=self.name, tool_call_id=self.tool_call_id)
+        if self.type == "human":
+            return HumanMessage(content=self.content, id=self.id, name=self.name)
+        return SystemMessage(content=self.content, id=self.id, name=self.name)
+
+    def row(self) -> tuple:
+        return (self.id, self.type, self.content, self.name, self.tool_calls, self.tool_call_id)
+
+
+class _Backing:
+    __slots__ = ("records", "index")
+
+    def __init__(self, records: List[Record]):
+        self.records = records
+        # id -> position; a view holds an id if the position is inside it.
+        self.index: Dict[str, int] = {r.id: i for i, r in enumerate(records)}
+
+
+class MessageLog(Sequence[BaseMessage]):
+    """Read-only sequence of LangChain messages over shared, append-only records."""
+
+    __slots__ = ("_backing", "_length")
+
+    def __init__(self, rows: Iterable[Sequence[Any]] = ()):
+        records = [Record(*row) for row in rows]
+        self._backing = _Backing(records)
+        self._length = len(records)
+
+    @classmethod
+    def of(cls, messages: Iterable[Any]) -> "MessageLog":
+        return cls().appended(messages)
+
+    def _view(self, backing: _Backing, length: int) -> "MessageLog":
+        log = MessageLog.__new__(MessageLog)
+        log._backing, log._length = backing, length
+        return log
+
+    def __len__(self) -> int:
+        return self._length
+
+    @overload
+    def __getitem__(self, i: int) -> BaseMessage: ...
+
+    @overload
+    def __getitem__(self, i: slice) -> List[BaseMessage]: ...
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[BaseMessage, List[BaseMessage]]:
+        records = self._backing.records
+        if isinstance(i, slice):
+            return [records[j].to_message() for j in range(*i.indices(self._length))]
+        if i < 0:
+            i += self._length
+        if not 0 <= i < self._length:
+            raise IndexError("message log index out of range")
+        return records[i].to_message()
+
+    def __iter__(self) -> Iterator[BaseMessage]:
+        records = self._backing.records
+        for i in range(self._length):
+            yield records[i].to_message()
+
+    def __reversed__(self) -> Iterator[BaseMessage]:
+        records = self._backing.records
+        for i in range(self._length - 1, -1, -1):
+            yield records[i].to_message()
+
+    def __add__(self, other: Iterable[Any]) -> "MessageLog":
+        return self.appended(other)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, MessageLog):
+            return len(self) == len(other) and all(a.row() == b.row() for a, b in zip(self.records(), other.records()))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"MessageLog({self._length} messages)"
+
+    def records(self) -> Iterator[Record]:
+        records = self._backing.records
+        return (records[i] for i in range(self._length))
+
+    def has_id(self, message_id: Optional[str]) -> bool:
+        position = self._backing.index.get(message_id) if message_id else None
+        return position is not None and position < self._length
+
+    def extends(self, other: "MessageLog") -> bool:
+        """Whether this log is ``other`` plus zero or more appended messages."""
+        return self._backing is other._backing and self._length >= other._length
+
+    def appended(self, messages: Iterable[Any]) -> "MessageLog":
+        """A log with ``messages`` added; ones already in the log (by id) replace their earlier version."""
+        incoming = [m if isinstance(m, Record) else Record.from_message(m) for m in _as_messages(messages)]
+        if not incoming:
+            return self
+        with _lock:
+            backing, length = self._backing, self._length
+            records = backing.records
+            for record in incoming:
+                position = backing.index.get(record.id)
+                if position is not None and position < length:
+                    if records[position].row() != record.row():
+                        backing, records = self._copied(backing, length)
+                        records[position] = record
+                    continue
+                if length < len(records) and records[length].id == record.id and records[length].row() == record.row():
+                    # Already appended through another view sharing this backing list.
+                    length += 1
+                    continue
+                if length < len(records):
+                    backing, records = self._copied(backing, length)
+                records.append(record)
+                backing.index[record.id] = length
+                length += 1
+        return self._view(backing, length)
+
+    @staticmethod
+    def _copied(backing: _Backing, length: int):
+        fresh = _Backing(backing.records[:length])
+        return fresh, fresh.records
+
+    def _asdict(self) -> Dict[str, Any]:
+        # Checkpoint form: rebuilt with MessageLog(rows=...), only the records in this view.
+        return {"rows": [r.row() for r in self.records()]}
+
+
+def _as_messages(messages: Any) -> List[Any]:
+    if isinstance(messages, MessageLog):
+        return list(messages.records())
+    if isinstance(messages, (BaseMessage, Record, str, tuple, dict)):
+        messages = [messages]
+    return [m if isinstance(m, (BaseMessage, Record)) else convert_to_messages([m])[0] for m in messages]
+
+
+def append_messages(left: Any, right: Any) -> MessageLog:
+    """Reducer for ``AgentState.messages``: add the node's new messages to the log."""
+    log = left if isinstance(left, MessageLog) else MessageLog.of(left or [])
+    if isinstance(right, MessageLog) and (right.extends(log) or not log):
+        # A node handed back the log it was given, possibly with messages appended, or a
+        # subgraph was started on its parent's log.
+        return right
+    return log.appended(right or [])
+
+
+def message_ids(messages: Sequence[BaseMessage]):
+    """A membership test for message ids that does not convert a log's records."""
+    if isinstance(messages, MessageLog):
+        return messages.has_id
+    return {m.id for m in messages if m.id}.__contains__
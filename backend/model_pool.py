@@ -0,0 +1,224 @@
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+from dotenv import load_dotenv
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_groq import ChatGroq
+from langchain_openai import ChatOpenAI
+import httpx
+import os
+import threading
+
+load_dotenv()
+
+ROLES = ("coordinator", "planner", "researcher", "drafter", "editor", "summarizer", "merger")
+
+# Default model per provider, overridable with <PROVIDER>_MODEL (e.g. GROQ_MODEL).
+PROVIDER_MODELS = {
+    "openai": "gpt-4o-mini",
+    "groq": "llama-3.1-8b-instant",
+    "google": "gemini-1.5-flash-latest",
+}
+
+
+@dataclass(frozen=True)
+class RoleConfig:
+    model: str = "gpt-4o-mini"
+    temperature: float = 0.2
+    # Prompt budget for the role's context window; 0 leaves the history untrimmed.
+    context_tokens: int = 8000
+    provider: str = "openai"
+    # Providers tried in order once the primary one has failed.
+    fallbacks: Tuple[str, ...] = ()
+    # Seconds per attempt, and retries per provider on timeouts, 429s and 5xx errors.
+    timeout: float = 60.0
+    retries: int = 2
+    # Send a second, identical request once the first has taken hedge_after seconds, or
+    # the role's observed latency at hedge_quantile if that is longer; 0 disables either.
+    hedge_after: float = 0.0
+    hedge_quantile: float = 0.0
+
+
+def provider_model(provider: str) -> str:
+    return os.getenv(f"{provider.upper()}_MODEL", PROVIDER_MODELS.get(provider, ""))
+
+
+def _providers(value: str) -> Tuple[str, ...]:
+    return tuple(p.strip().lower() for p in value.split(",") if p.strip())
+
+
+def _hedge(value: str) -> Tuple[float, float]:
+    # "p95" hedges at the observed 95th percentile, "2.5" after 2.5 seconds, "off" never.
+    value = value.strip().lower()
+    if not value or value in ("0", "off", "false", "none"):
+        return 0.0, 0.0
+    if value.startswith("p"):
+        return 0.0, float(value[1:]) / 100
+    return float(value), 0.0
+
+
+def load_role_configs() -> Dict[str, RoleConfig]:
+    """Per-role settings, e.g. DRAFTER_MODEL=gpt-4o, EDITOR_TEMPERATURE=0 or RESEARCHER_CONTEXT_TOKENS=4000.
+
+    Call resilience is set for every role with MODEL_PROVIDER, MODEL_FALLBACKS (e.g. "groq,google"),
+    MODEL_TIMEOUT, MODEL_RETRIES and MODEL_HEDGE ("p95", seconds or "off"), or per role with the
+    same names under the role's prefix, e.g. DRAFTER_TIMEOUT=90 or COORDINATOR_HEDGE=p95.
+    """
+    configs = {}
+    for role in ROLES:
+        prefix = role.upper()
+
+        def setting(name: str, default: Any) -> str:
+            return os.getenv(f"{prefix}_{name}", os.getenv(f"MODEL_{name}", str(default)))
+
+        provider = setting("PROVIDER", RoleConfig.provider).strip().lower()
+        hedge_after, hedge_quantile = _hedge(setting("HEDGE", "off"))
+        configs[role] = RoleConfig(
+            model=os.getenv(f"{prefix}_MODEL", provider_model(provider)),
+            temperature=float(os.getenv(f"{prefix}_TEMPERATURE", RoleConfig.temperature)),
+            context_tokens=int(os.getenv(f"{prefix}_CONTEXT_TOKENS", RoleConfig.context_tokens)),
+            provider=provider,
+            fallbacks=_providers(setting("FALLBACKS", "")),
+            timeout=float(setting("TIMEOUT", RoleConfig.timeout)),
+            retries=int(setting("RETRIES", RoleConfig.retries)),
+            hedge_after=hedge_after,
+            hedge_quantile=hedge_quantile,
+        )
+    return configs
+
+
+def provider_config(config: RoleConfig, provider: str) -> RoleConfig:
+    """The role's settings as served by ``provider``; fallbacks use that provider's default model."""
+    if provider == config.provider:
+        return config
+    return replace(config, provider=provider, model=provider_model(provider))
+
+
+_http_lock = threading.Lock()
+_http_clients: Dict[str, Any] = {}
+
+
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(os.getenv("MODEL_HTTP_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("MODEL_HTTP_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.getenv("MODEL_HTTP_KEEPALIVE_EXPIRY", "60")),
+    )
+
+
+def shared_http_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """Process-wide keep-alive pools reused by every model client."""
+    with _http_lock:
+        if not _http_clients:
+            timeout = httpx.Timeout(float(os.getenv("MODEL_HTTP_TIMEOUT", "120")), connect=10.0)
+            _http_clients["sync"] = httpx.Client(limits=_http_limits(), timeout=timeout)
+            _http_clients["async"] = httpx.AsyncClient(limits=_http_limits(), timeout=timeout)
+        return _http_clients["sync"], _http_clients["async"]
+
+
+# Retries, timeouts and fallbacks are handled by resilience.ModelInvoker, so the SDKs' own
+# retries are switched off and their request timeout matches the per-attempt one.
+
+def openai_chat_model(role: str, config: RoleConfig) -> ChatOpenAI:
+    http_client, http_async_client = shared_http_clients()
+    return ChatOpenAI(
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        model=config.model,
+        temperature=config.temperature,
+        http_client=http_client,
+        http_async_client=http_async_client,
+        # Custom HTTP clients switch streamed usage reporting off unless asked for.
+        stream_usage=True,
+        max_retries=0,
+        timeout=config.timeout,
+    )
+
+
+def groq_chat_model(role: str, config: RoleConfig) -> ChatGroq:
+    http_client, http_async_client = shared_http_clients()
+    return ChatGroq(
+        groq_api_key=os.getenv("GROQ_API_KEY"),
+        model=config.model,
+        temperature=config.temperature,
+        http_client=http_client,
+        http_async_client=http_async_client,
+        max_retries=0,
+        request_timeout=config.timeout,
+    )
+
+
+def google_chat_model(role: str, config: RoleConfig) -> ChatGoogleGenerativeAI:
+    return ChatGoogleGenerativeAI(
+        google_api_key=os.getenv("GOOGLE_API_KEY"),
+        model=config.model,
+        temperature=config.temperature,
+        max_retries=0,
+        timeout=config.timeout,
+    )
+
+
+PROVIDERS: Dict[str, Callable[[str, RoleConfig], Any]] = {
+    "openai": openai_chat_model,
+    "groq": groq_chat_model,
+    "google": google_chat_model,
+}
+
+
+class ModelPool:
+    """Lazily built, shared chat model clients keyed by role, tool binding and provider.
+
+    Clients are created once per (role, tools, tool_choice, provider) and reused by every
+    node call, thread and event loop in the process. Construction happens under a lock and
+    never awaits, so the pool is safe to use from both sync and async nodes. ``providers``
+    maps provider names to client factories; a single ``factory`` serves every provider.
+    """
+
+    def __init__(
+        self,
+        factory: Optional[Callable[[str, RoleConfig], Any]] = None,
+        configs: Optional[Dict[str, RoleConfig]] = None,
+        providers: Optional[Dict[str, Callable[[str, RoleConfig], Any]]] = None,
+    ):
+        self._factories = dict(providers if providers is not None else PROVIDERS)
+        if factory is not None:
+            self._factories = {name: factory for name in self._factories}
+        self._configs = configs if configs is not None else load_role_configs()
+        self._clients: Dict[Tuple[str, Tuple[str, ...], Optional[str], str], Any] = {}
+        self._lock = threading.Lock()
+
+    def config(self, role: str, provider: Optional[str] = None) -> RoleConfig:
+        config = self._configs.get(role, RoleConfig())
+        return provider_config(config, provider) if provider else config
+
+    def providers(self, role: str) -> Tuple[str, ...]:
+        """The role's primary provider, then its fallbacks, skipping unknown names."""
+        config = self.config(role)
+        ordered = dict.fromkeys((config.provider,) + config.fallbacks)
+        return tuple(p for p in ordered if p in self._factories)
+
+    def get(self, role: str, tools: Sequence[Any] = (), tool_choice: Optional[str] = None,
+            provider: Optional[str] = None) -> Any:
+        provider = provider or self.config(role).provider
+        key = (role, tuple(t.name for t in tools), tool_choice, provider)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self._build(role, tools, tool_choice, provider)
+                self._clients[key] = client
+        return client
+
+    def _build(self, role: str, tools: Sequence[Any], tool_choice: Optional[str], provider: str) -> Any:
+        base_key = (role, (), None, provider)
+        base = self._clients.get(base_key)
+        if base is None:
+            base = self._factories[provider](role, self.config(role, provider))
+            self._clients[base_key] = base
+        if not tools:
+            return base
+        return base.bind_tools(list(tools), tool_choice=tool_choice)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clients.clear()
@@ -0,0 +1,107 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+import os
+
+from routing import json_object
+
+# Revisions of an existing document may come back as find/replace edits instead of the
+# full text, so a small change costs a few output tokens rather than the whole draft.
+PATCH_EDITS = os.getenv("PATCH_EDITS", "on").lower() not in ("0", "off", "false", "no")
+
+
+class PatchError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Edit:
+    find: str
+    replace: str
+
+
+def parse_patch(content: Any) -> Optional[List[Edit]]:
+    """The edits of a ``{"edits": [{"find": ..., "replace": ...}]}`` reply; None if the reply is not a patch.
+
+    Raises PatchError for a reply that is a patch but a malformed one.
+    """
+    if not isinstance(content, str) or not content.lstrip().startswith(("{", "```")):
+        return None
+    data = json_object(content)
+    if "edits" not in data:
+        return None
+    edits = data["edits"]
+    if not isinstance(edits, list) or not edits:
+        raise PatchError("a patch needs a non-empty list of edits")
+    parsed = []
+    for i, edit in enumerate(edits):
+        if not isinstance(edit, dict) or not isinstance(edit.get("find"), str) or not isinstance(edit.get("replace", ""), str):
+            raise PatchError(f"edit {i}: expected an object with string find and replace")
+        if not edit["find"]:
+            raise PatchError(f"edit {i}: find is empty")
+        parsed.append(Edit(edit["find"], edit.get("replace", "")))
+    return parsed
+
+
+def apply_patch(text: str, edits: List[Edit]) -> str:
+    """Apply edits in order; each ``find`` must occur exactly once in the text as edited so far."""
+    for i, edit in enumerate(edits):
+        count = text.count(edit.find)
+        if count != 1:
+            raise PatchError(f"edit {i}: find text occurs {count} times, expected once")
+        text = text.replace(edit.find, edit.replace, 1)
+    if not text.strip():
+        raise PatchError("the patch leaves the document empty")
+    return text
+
+
+def is_patch(message: Any) -> bool:
+    """Whether a stored Drafter or Editor reply is a patch rather than the document itself."""
+    try:
+        return parse_patch(getattr(message, "content", None)) is not None
+    except PatchError:
+        return False
+
+
+# Keys a patch-style reply opens with: the edits, or the merger's {"discard": true}.
+PATCH_KEYS = ('"edits"', '"discard"')
+
+
+def looks_like_patch(prefix: str) -> Optional[bool]:
+    """Whether a reply streamed so far is a JSON patch rather than document text.
+
+    A patch is an object whose first key is one of PATCH_KEYS, optionally inside a code
+    fence; documents that merely start with ``{`` or a fence are not. None while the
+    prefix is too short to tell.
+    """
+    text = prefix.lstrip()
+    if text.startswith("```"):
+        text = text[3:]
+        tag = len(text) - len(text.lstrip("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+        if tag == len(text):
+            return None
+        text = text[tag:].lstrip()
+    elif "```".startswith(text):
+        return None
+    if not text:
+        return None
+    if not text.startswith("{"):
+        return False
+    text = text[1:].lstrip()
+    for key in PATCH_KEYS:
+        if len(text) < len(key) and key.startswith(text):
+            return None
+        if text.startswith(key):
+            rest = text[len(key):].lstrip()
+            return None if not rest else rest.startswith(":")
+    return False
+
+
+def patch_diff(base: str, content: Any, text: str) -> Optional[List[Dict[str, str]]]:
+    """The edits in ``content`` as plain dicts if they turn ``base`` into ``text``, else None."""
+    try:
+        edits = parse_patch(content)
+        if edits is None or apply_patch(base, edits) != text:
+            return None
+    except PatchError:
+        return None
+    return [{"find": e.find, "replace": e.replace} for e in edits]
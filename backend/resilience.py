@@ -0,0 +1,282 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait as wait_futures
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Optional, Sequence, Tuple
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+
+import httpx
+from langchain_core.messages import AIMessage, BaseMessage
+
+import instrumentation
+from admission import RateLimiters
+from context_window import count_tokens
+from model_pool import ModelPool, RoleConfig
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504, 529})
+# SDK errors that carry no HTTP status: the request never got an answer.
+RETRYABLE_ERRORS = frozenset({"APIConnectionError", "APITimeoutError", "ServiceUnavailable", "DeadlineExceeded"})
+
+# Only a call's first attempt runs with the caller's callbacks. Hedges, retries and fallbacks
+# are silent, so a stream never shows a second copy of tokens the first attempt already sent;
+# the reply that wins still arrives in the node's final state.
+_SILENT = {"callbacks": []}
+
+
+class AttemptTimeout(TimeoutError):
+    pass
+
+
+def _status(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    return int(status) if isinstance(status, int) else None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Timeouts, dropped connections, 429s and 5xx errors; other errors fail over straight away."""
+    if isinstance(exc, (TimeoutError, httpx.TimeoutException, httpx.TransportError, ConnectionError)):
+        return True
+    status = _status(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return type(exc).__name__ in RETRYABLE_ERRORS
+
+
+def _reason(exc: BaseException) -> str:
+    if isinstance(exc, TimeoutError):
+        return "timeout"
+    status = _status(exc)
+    return str(status) if status is not None else type(exc).__name__
+
+
+def _retry_after(exc: BaseException) -> float:
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+@dataclass(frozen=True)
+class Backoff:
+    """Exponential backoff with full jitter, never shorter than the server's Retry-After."""
+
+    base: float = 0.5
+    cap: float = 8.0
+
+    def delay(self, attempt: int, retry_after: float = 0.0) -> float:
+        return max(random.uniform(0, min(self.cap, self.base * 2 ** attempt)), min(retry_after, self.cap))
+
+
+class LatencyWindow:
+    """Latencies of recent successful calls per role, for hedging at a quantile."""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.size = size
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, role: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(role, deque(maxlen=self.size)).append(seconds)
+
+    def quantile(self, role: str, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(role, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class ModelInvoker:
+    """Calls a role's model with per-attempt timeouts, retries, hedging and provider fallback.
+
+    Each provider in the role's chain (see ``ModelPool.providers``) gets ``retries + 1``
+    attempts; timeouts, 429s and 5xx errors are retried after a jittered backoff, other
+    errors move straight to the next provider. With hedging on, an attempt that is still
+    running after the hedge delay is raced against an identical second request and the
+    first reply wins. Every attempt waits for the provider's rate limits; a hedge is only
+    sent if the limits have room for it right away, and is charged to them.
+    """
+
+    def __init__(self, limiters: RateLimiters, backoff: Backoff = Backoff(), window: Optional[LatencyWindow] = None,
+                 max_workers: int = 32):
+        self.limiters = limiters
+        self.backoff = backoff
+        self.window = window or LatencyWindow()
+        # Hedged sync attempts run here so the loser can be abandoned; it finishes in the background.
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="model")
+
+    def hedge_delay(self, role: str, config: RoleConfig) -> float:
+        delay = config.hedge_after
+        if config.hedge_quantile:
+            observed = self.window.quantile(role, config.hedge_quantile)
+            if observed is not None:
+                delay = max(delay, observed)
+        return delay if 0 < delay < config.timeout else 0.0
+
+    def _limits(self, provider: str, messages: Sequence[BaseMessage]) -> Tuple[Tuple[str, float], ...]:
+        tokens = f"{provider}_tokens"
+        return ((f"{provider}_requests", 1.0), (tokens, count_tokens(messages) if tokens in self.limiters.buckets else 0))
+
+    def _failed(self, role: str, provider: str, attempt: int, config: RoleConfig, exc: Exception) -> float:
+        """Seconds to back off before retrying, or -1 to give up on this provider."""
+        reason = _reason(exc)
+        if not is_retryable(exc) or attempt >= config.retries:
+            logger.warning("⚠️ %s call to %s failed (%s): %s", role, provider, reason, exc)
+            return -1.0
+        delay = self.backoff.delay(attempt, _retry_after(exc))
+        logger.info("🔁 Retrying %s call to %s in %.2fs (%s)", role, provider, delay, reason)
+        instrumentation.record_model_retry(role, provider, reason)
+        return delay
+
+    def _succeeded(self, role: str, provider: str, primary: str, started: float, hedged: Optional[bool]) -> None:
+        self.window.add(role, time.perf_counter() - started)
+        if hedged is not None:
+            instrumentation.record_model_hedge(role, "won" if hedged else "lost")
+        if provider != primary:
+            instrumentation.record_model_fallback(role, provider)
+
+    def invoke(self, pool: ModelPool, role: str, messages: Sequence[BaseMessage], tools: Sequence[Any] = (),
+               tool_choice: Optional[str] = None) -> Tuple[str, AIMessage]:
+        """The reply and the provider that served it; raises the last error if every provider failed."""
+        providers = pool.providers(role)
+        error: Exception = RuntimeError(f"no model provider configured for {role}")
+        for provider in providers:
+            config = pool.config(role, provider)
+            try:
+                model = pool.get(role, tools, tool_choice, provider)
+            except Exception as exc:
+                # e.g. a fallback provider without an API key
+                logger.warning("⚠️ Cannot build %s client for %s: %s", provider, role, exc)
+                error = exc
+                continue
+            limits = self._limits(provider, messages)
+            for attempt in range(config.retries + 1):
+                for name, cost in limits:
+                    self.limiters.acquire(name, cost)
+                started = time.perf_counter()
+                try:
+                    response, hedged = self._attempt(model, messages, config.timeout, self.hedge_delay(role, config),
+                                                     limits, silent=attempt > 0 or provider != providers[0])
+                except Exception as exc:
+                    error = exc
+                    delay = self._failed(role, provider, attempt, config, exc)
+                    if delay < 0:
+                        break
+                    time.sleep(delay)
+                    continue
+                self._succeeded(role, provider, providers[0], started, hedged)
+                return provider, response
+        raise error
+
+    async def ainvoke(self, pool: ModelPool, role: str, messages: Sequence[BaseMessage], tools: Sequence[Any] = (),
+                      tool_choice: Optional[str] = None) -> Tuple[str, AIMessage]:
+        providers = pool.providers(role)
+        error: Exception = RuntimeError(f"no model provider configured for {role}")
+        for provider in providers:
+            config = pool.config(role, provider)
+            try:
+                model = pool.get(role, tools, tool_choice, provider)
+            except Exception as exc:
+                logger.warning("⚠️ Cannot build %s client for %s: %s", provider, role, exc)
+                error = exc
+                continue
+            limits = self._limits(provider, messages)
+            for attempt in range(config.retries + 1):
+                for name, cost in limits:
+                    await self.limiters.aacquire(name, cost)
+                started = time.perf_counter()
+                try:
+                    response, hedged = await self._aattempt(model, messages, config.timeout, self.hedge_delay(role, config),
+                                                            limits, silent=attempt > 0 or provider != providers[0])
+                except Exception as exc:
+                    error = exc
+                    delay = self._failed(role, provider, attempt, config, exc)
+                    if delay < 0:
+                        break
+                    await asyncio.sleep(delay)
+                    continue
+                self._succeeded(role, provider, providers[0], started, hedged)
+                return provider, response
+        raise error
+
+    def _attempt(self, model, messages, timeout: float, hedge_delay: float, limits: Sequence[Tuple[str, float]] = (),
+                 silent: bool = False) -> Tuple[AIMessage, Optional[bool]]:
+        # Returns the reply and, when hedged, whether the hedge won.
+        if not hedge_delay:
+            # Nothing to race: run on the calling thread. The SDK's request timeout is the
+            # per-attempt one (see model_pool), so the attempt is bounded all the same.
+            return model.invoke(messages, _SILENT if silent else None), None
+        # A hedge can only win if the first attempt can be abandoned, so both run on the
+        # executor. Each thread needs its own context copy.
+        deadline = time.monotonic() + timeout
+        first = self._executor.submit(contextvars.copy_context().run, model.invoke, messages, _SILENT if silent else None)
+        pending = {first}
+        hedge = None
+        try:
+            if hedge_delay and not wait_futures(pending, timeout=hedge_delay).done and self.limiters.try_acquire(limits):
+                hedge = self._executor.submit(contextvars.copy_context().run, model.invoke, messages, _SILENT)
+                pending.add(hedge)
+            error = None
+            while pending:
+                done, pending = wait_futures(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+                if not done:
+                    raise AttemptTimeout(f"no reply within {timeout:g}s")
+                for future in done:
+                    if future.exception() is None:
+                        return future.result(), (future is hedge if hedge is not None else None)
+                    error = future.exception()
+            raise error
+        finally:
+            for future in (first, hedge):
+                if future is not None:
+                    future.cancel()
+
+    async def _aattempt(self, model, messages, timeout: float, hedge_delay: float, limits: Sequence[Tuple[str, float]] = (),
+                        silent: bool = False) -> Tuple[AIMessage, Optional[bool]]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        first = asyncio.ensure_future(model.ainvoke(messages, _SILENT if silent else None))
+        pending = {first}
+        hedge = None
+        try:
+            if hedge_delay:
+                done, _ = await asyncio.wait(pending, timeout=hedge_delay)
+                if not done and self.limiters.try_acquire(limits):
+                    hedge = asyncio.ensure_future(model.ainvoke(messages, _SILENT))
+                    pending.add(hedge)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, deadline - loop.time()), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise AttemptTimeout(f"no reply within {timeout:g}s")
+                for task in done:
+                    if task.exception() is None:
+                        return task.result(), (task is hedge if hedge is not None else None)
+                    error = task.exception()
+            raise error
+        finally:
+            for task in (first, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+
+def build_model_invoker(limiters: RateLimiters) -> ModelInvoker:
+    """MODEL_BACKOFF_SECONDS and MODEL_BACKOFF_MAX_SECONDS shape the retry delays; MODEL_MAX_WORKERS bounds hedged sync attempts."""
+    return ModelInvoker(
+        limiters,
+        backoff=Backoff(
+            base=float(os.getenv("MODEL_BACKOFF_SECONDS", "0.5")),
+            cap=float(os.getenv("MODEL_BACKOFF_MAX_SECONDS", "8")),
+        ),
+        max_workers=int(os.getenv("MODEL_MAX_WORKERS", "32")),
+    )
@@ -0,0 +1,58 @@
+from dataclasses import dataclass
+from typing import Any, Dict
+import json
+import re
+
+# What the coordinator may ask for next, cheapest first.
+REPLY = "reply"    # answer the user directly, no drafting
+EDIT = "edit"      # polish the current document
+DRAFT = "draft"    # (re)write the document from the research already gathered
+RESEARCH = "research"  # gather facts, then draft and edit
+ROUTES = (REPLY, EDIT, DRAFT, RESEARCH)
+
+ALIASES = {
+    "reply_only": REPLY,
+    "answer": REPLY,
+    "respond": REPLY,
+    "edit_only": EDIT,
+    "draft_only": DRAFT,
+    "research_draft": RESEARCH,
+    "research_and_draft": RESEARCH,
+}
+
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+@dataclass(frozen=True)
+class CoordinatorDecision:
+    route: str
+    description: str = ""
+    notes: str = ""
+
+
+def json_object(content: str) -> Dict[str, Any]:
+    text = _FENCE.sub("", content.strip())
+    try:
+        parsed = json.loads(text)
+    except ValueError:
+        # Models sometimes wrap the object in prose; take the outermost braces.
+        start, end = text.find("{"), text.rfind("}")
+        if start < 0 or end <= start:
+            return {}
+        try:
+            parsed = json.loads(text[start:end + 1])
+        except ValueError:
+            return {}
+    return parsed if isinstance(parsed, dict) else {}
+
+
+def parse_decision(content: Any) -> CoordinatorDecision:
+    """The coordinator's JSON reply as a decision; anything unreadable takes the full research path."""
+    data = json_object(content) if isinstance(content, str) else {}
+    route = re.sub(r"[\s+\-/&]+", "_", str(data.get("route", "")).strip().lower())
+    route = ALIASES.get(route, route)
+    return CoordinatorDecision(
+        route=route if route in ROUTES else RESEARCH,
+        description=str(data.get("description", "") or ""),
+        notes=str(data.get("notes", "") or ""),
+    )
@@ -0,0 +1,170 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import BaseCheckpointSaver, ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+
+class LRUMemorySaver(InMemorySaver):
+    """In-memory checkpointer that keeps at most ``max_sessions`` conversations.
+
+    Sessions are evicted least-recently-used first, and any session idle for longer
+    than ``ttl_seconds`` is dropped on its next access or on the next write. Only the
+    newest ``max_checkpoints`` checkpoints of a session are retained, so memory per
+    session tracks the size of its current state rather than its full step history.
+    """
+
+    def __init__(self, max_sessions: int = 1000, ttl_seconds: float = 3600.0, max_checkpoints: int = 2, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_checkpoints = max(1, max_checkpoints)
+        self._last_access: "OrderedDict[str, float]" = OrderedDict()
+        # (thread_id, checkpoint_ns) -> [(checkpoint_id, channel_versions), ...], oldest first
+        self._history: Dict[Tuple[str, str], List[Tuple[str, Dict[str, Any]]]] = {}
+        self._lock = threading.RLock()
+
+    def _expired(self, thread_id: str, now: float) -> bool:
+        last = self._last_access.get(thread_id)
+        return last is not None and self.ttl_seconds > 0 and now - last > self.ttl_seconds
+
+    def _touch(self, thread_id: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self._expired(thread_id, now):
+                self._evict(thread_id)
+            self._last_access[thread_id] = now
+            self._last_access.move_to_end(thread_id)
+            while len(self._last_access) > self.max_sessions:
+                oldest = next(iter(self._last_access))
+                self._evict(oldest)
+            while self._last_access and self.ttl_seconds > 0:
+                oldest, last = next(iter(self._last_access.items()))
+                if now - last <= self.ttl_seconds:
+                    break
+                self._evict(oldest)
+
+    def _evict(self, thread_id: str) -> None:
+        self._last_access.pop(thread_id, None)
+        for key in [k for k in self._history if k[0] == thread_id]:
+            del self._history[key]
+        super().delete_thread(thread_id)
+
+    def _prune(self, thread_id: str, checkpoint_ns: str) -> None:
+        history = self._history.get((thread_id, checkpoint_ns), [])
+        if len(history) <= self.max_checkpoints:
+            return
+        dropped, kept = history[:-self.max_checkpoints], history[-self.max_checkpoints:]
+        self._history[(thread_id, checkpoint_ns)] = kept
+        stored = self.storage[thread_id][checkpoint_ns]
+        for checkpoint_id, _ in dropped:
+            stored.pop(checkpoint_id, None)
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+        live = {(ch, v) for _, versions in kept for ch, v in versions.items()}
+        for _, versions in dropped:
+            for ch, v in versions.items():
+                if (ch, v) not in live:
+                    self.blobs.pop((thread_id, checkpoint_ns, ch, v), None)
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            if self._expired(thread_id, time.monotonic()):
+                self._evict(thread_id)
+                return None
+            if thread_id in self._last_access:
+                self._touch(thread_id)
+            return super().get_tuple(config)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        with self._lock:
+            self._touch(thread_id)
+            saved = super().put(config, checkpoint, metadata, new_versions)
+            self._history.setdefault((thread_id, checkpoint_ns), []).append(
+                (checkpoint["id"], dict(checkpoint["channel_versions"]))
+            )
+            self._prune(thread_id, checkpoint_ns)
+            return saved
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        with self._lock:
+            super().put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._evict(thread_id)
+
+    def session_count(self) -> int:
+        return len(self._last_access)
+
+
+class SqliteSessionSaver(SqliteSaver):
+    """SQLite checkpointer usable from both graph.stream() and graph.astream().
+
+    ``SqliteSaver`` only implements the sync interface; the async methods run it in a
+    worker thread. The connection is shared across threads behind SqliteSaver's lock.
+    """
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None, before: Optional[RunnableConfig] = None, limit: Optional[int] = None):
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+def checkpoint_serde() -> JsonPlusSerializer:
+    # AgentState.messages is a message_log.MessageLog; registering it lets checkpoints load
+    # it without the unregistered-type warning (and under LANGGRAPH_STRICT_MSGPACK).
+    return JsonPlusSerializer(allowed_msgpack_modules=[("message_log", "MessageLog")])
+
+
+def build_checkpointer(backend: Optional[str] = None) -> BaseCheckpointSaver:
+    """Session store selected by SESSION_STORE: "memory" (default) or "sqlite".
+
+    The SQLite file is SESSION_SQLITE_PATH, else sessions.sqlite in DATA_DIR, else
+    sessions.sqlite in the working directory.
+    """
+    backend = backend or os.getenv("SESSION_STORE", "memory")
+    if backend == "memory":
+        return LRUMemorySaver(
+            max_sessions=int(os.getenv("SESSION_MAX_SESSIONS", "1000")),
+            ttl_seconds=float(os.getenv("SESSION_TTL_SECONDS", "3600")),
+            serde=checkpoint_serde(),
+        )
+    if backend == "sqlite":
+        data_dir = os.getenv("DATA_DIR")
+        path = os.getenv("SESSION_SQLITE_PATH") or (os.path.join(data_dir, "sessions.sqlite") if data_dir else "sessions.sqlite")
+        return SqliteSessionSaver(sqlite3.connect(path, check_same_thread=False), serde=checkpoint_serde())
+    raise ValueError(f"Unknown SESSION_STORE backend: {backend!r}")
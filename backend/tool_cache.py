@@ -0,0 +1,172 @@
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Parameters that never change what a search returns.
+_IGNORED_PARAMS = {"api_key", "output", "async", "no_cache"}
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(str(query).lower().split())
+
+
+def cache_key(engine: str, params: Dict[str, Any]) -> str:
+    normalized = {k: v for k, v in params.items() if k not in _IGNORED_PARAMS}
+    if "q" in normalized:
+        normalized["q"] = normalize_query(normalized["q"])
+    raw = json.dumps({"engine": engine, "params": normalized}, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class ToolCache:
+    """Two-tier cache for search tool results.
+
+    Lookups go to an in-memory LRU first and then, when ``sqlite_path`` is set, to a
+    SQLite table shared by every worker on the host. Entries expire ``ttl_seconds``
+    after they were fetched. ``bypass`` skips both tiers for every call. Concurrent
+    misses on one key share a single upstream fetch.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 86400.0, sqlite_path: Optional[str] = None, bypass: bool = False):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.bypass = bypass
+        self._memory: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS tool_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.commit()
+        self.metrics = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0, "evictions": 0, "expired": 0, "shared": 0}
+
+    def _count(self, name: str) -> None:
+        self.metrics[name] += 1
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._count("memory_hits")
+                    return value
+                del self._memory[key]
+                self._count("expired")
+            if self._db is not None:
+                row = self._db.execute("SELECT value, expires_at FROM tool_cache WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    if row[1] > now:
+                        value = json.loads(row[0])
+                        self._remember(key, row[1], value)
+                        self._count("disk_hits")
+                        return value
+                    self._db.execute("DELETE FROM tool_cache WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._count("expired")
+            self._count("misses")
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._remember(key, expires_at, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO tool_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value, default=str), expires_at),
+                )
+                self._db.commit()
+
+    def _remember(self, key: str, expires_at: float, value: Any) -> None:
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._count("evictions")
+
+    def get_or_fetch(self, engine: str, params: Dict[str, Any], fetch: Callable[[], Any], bypass: bool = False) -> Any:
+        if bypass or self.bypass:
+            with self._lock:
+                self._count("bypassed")
+            return fetch()
+        key = cache_key(engine, params)
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            pending = self._inflight.get(key)
+            leader = pending is None
+            if leader:
+                pending = self._inflight[key] = Future()
+            else:
+                self._count("shared")
+        if not leader:
+            return pending.result()
+        try:
+            value = fetch()
+            # Upstream errors (quota, bad key) are not worth remembering.
+            if not (isinstance(value, dict) and value.get("error")):
+                self.set(key, value)
+            pending.set_result(value)
+            return value
+        except BaseException as exc:
+            pending.set_exception(exc)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def purge_expired(self) -> None:
+        now = time.time()
+        with self._lock:
+            for key in [k for k, (expires_at, _) in self._memory.items() if expires_at <= now]:
+                del self._memory[key]
+            if self._db is not None:
+                self._db.execute("DELETE FROM tool_cache WHERE expires_at <= ?", (now,))
+                self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM tool_cache")
+                self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.metrics["memory_hits"] + self.metrics["disk_hits"]
+            lookups = hits + self.metrics["misses"]
+            return {**self.metrics, "entries": len(self._memory), "hit_rate": hits / lookups if lookups else 0.0}
+
+
+def build_tool_cache() -> ToolCache:
+    """Configured from TOOL_CACHE_* environment variables.
+
+    The SQLite tier lives at TOOL_CACHE_SQLITE_PATH, else tool_cache.sqlite in DATA_DIR;
+    without either (or with an empty path) the cache is in memory only.
+    """
+    data_dir = os.getenv("DATA_DIR")
+    return ToolCache(
+        max_entries=int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "1024")),
+        ttl_seconds=float(os.getenv("TOOL_CACHE_TTL_SECONDS", "86400")),
+        sqlite_path=os.getenv("TOOL_CACHE_SQLITE_PATH", os.path.join(data_dir, "tool_cache.sqlite") if data_dir else "") or None,
+        bypass=os.getenv("TOOL_CACHE_BYPASS", "").lower() in ("1", "true", "yes"),
+    )
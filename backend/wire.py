@@ -0,0 +1,119 @@
+"""Wire format for /chat event streams, shared by the backend and the Gradio frontend.
+
+Every event is a JSON object carrying ``v`` (protocol version) and ``event`` (type).
+Two framings are supported:
+
+* SSE (``text/event-stream``)::
+
+      event: step
+      data: {"v": 1, "event": "step", ...}
+
+* NDJSON (``application/x-ndjson``): one JSON object per line.
+
+orjson is used when installed, with the standard library as a fallback.
+"""
+from typing import Any, Dict, Iterable, Iterator, Optional, Union
+
+try:
+    import orjson
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=str)
+
+    def loads(data: Union[str, bytes]) -> Any:
+        return orjson.loads(data)
+
+except ImportError:  # pragma: no cover - exercised only without orjson
+    import json
+
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, default=str, separators=(",", ":")).encode()
+
+    def loads(data: Union[str, bytes]) -> Any:
+        return json.loads(data)
+
+
+PROTOCOL_VERSION = 1
+SSE_MEDIA_TYPE = "text/event-stream"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """Pick the framing for an Accept header; SSE unless NDJSON is asked for."""
+    if accept and NDJSON_MEDIA_TYPE in accept:
+        return NDJSON_MEDIA_TYPE
+    return SSE_MEDIA_TYPE
+
+
+def encode_event(event: str, payload: Optional[Dict[str, Any]] = None, media_type: str = SSE_MEDIA_TYPE,
+                 event_id: Optional[int] = None) -> bytes:
+    """``event_id`` (a job event's sequence number) becomes the SSE ``id:`` line, for Last-Event-ID resumes."""
+    body = dumps({**(payload or {}), "v": PROTOCOL_VERSION, "event": event})
+    if media_type == NDJSON_MEDIA_TYPE:
+        return body + b"\n"
+    head = b"" if event_id is None else b"id: " + str(event_id).encode() + b"\n"
+    return head + b"event: " + event.encode() + b"\ndata: " + body + b"\n\n"
+
+
+class EventDecoder:
+    """Incremental decoder for either framing; feed it one line at a time.
+
+    ``feed`` returns the decoded event once a complete one has been read, else None.
+    """
+
+    def __init__(self) -> None:
+        self._data: list = []
+
+    def feed(self, line: Union[str, bytes]) -> Optional[Dict[str, Any]]:
+        if isinstance(line, bytes):
+            line = line.decode()
+        line = line.rstrip("\r\n")
+        if not line:
+            return self._flush()
+        if line.startswith("{"):
+            return self._check(loads(line))
+        if line.startswith("data:"):
+            self._data.append(line[5:].lstrip(" "))
+        # "event:", "id:", "retry:" and ":" comment lines carry nothing we need.
+        return None
+
+    def close(self) -> Optional[Dict[str, Any]]:
+        return self._flush()
+
+    def _flush(self) -> Optional[Dict[str, Any]]:
+        if not self._data:
+            return None
+        data, self._data = "\n".join(self._data), []
+        return self._check(loads(data))
+
+    @staticmethod
+    def _check(event: Any) -> Dict[str, Any]:
+        if not isinstance(event, dict) or "event" not in event:
+            raise ProtocolError(f"Malformed event: {event!r}")
+        if event.get("v") != PROTOCOL_VERSION:
+            raise ProtocolError(f"Unsupported wire protocol version: {event.get('v')!r}")
+        return event
+
+
+def apply_diff(text: str, edits: Iterable[Dict[str, str]]) -> Optional[str]:
+    """A step event's ``diff`` edits applied in order to the text they were made against; None if one does not match."""
+    for edit in edits:
+        if text.count(edit["find"]) != 1:
+            return None
+        text = text.replace(edit["find"], edit["replace"], 1)
+    return text
+
+
+def decode_lines(lines: Iterable[Union[str, bytes]]) -> Iterator[Dict[str, Any]]:
+    decoder = EventDecoder()
+    for line in lines:
+        event = decoder.feed(line)
+        if event is not None:
+            yield event
+    event = decoder.close()
+    if event is not None:
+        yield event
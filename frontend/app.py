@@ -83,13 +83,16 @@
 import json
 import os
 import logging
+import time
+import uuid
 import gradio as gr
-import requests
-from typing import Dict, Any, List, Tuple
+import httpx
+from typing import Dict, Any, List, Optional
+from wire import EventDecoder, ProtocolError, SSE_MEDIA_TYPE, apply_diff
 
 # Configure logging
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
     format="%(asctime)s [%(levelname)s] %(message)s",
     handlers=[logging.StreamHandler()]
 )
@@ -97,56 +100,171 @@ logger = logging.getLogger(__name__)
 
 # Load BACKEND_URL
 API_URL = os.getenv("BACKEND_URL", "http://127.0.0.1:8000") + "/chat"
-logger.debug(f"Using API_URL: {API_URL}")
+logger.debug("Using API_URL: %s", API_URL)
 
-def submit_message(user_text: str, chat_history: List[Tuple[str, str]], client_state: Dict[str, Any]):
-    logger.debug(f"Submitting message: '{user_text[:50]}{'...' if len(user_text) > 50 else ''}'")
-    payload = {"user_input": user_text, "conversation_state": client_state or {}}
-    logger.debug(f"Sending request to {API_URL} with payload: {payload}")
+# Longest excerpt of a message or stream line written to the debug log.
+LOG_PAYLOAD_CHARS = int(os.getenv("LOG_PAYLOAD_CHARS", "200"))
+# Token events arriving faster than this are coalesced into one Chatbot update.
+UI_UPDATE_SECONDS = float(os.getenv("UI_UPDATE_SECONDS", "0.05"))
+# The document field each token-streaming node's step event carries its finished text in.
+DOCUMENT_FIELDS = {"Draft_node": "draft_text", "Edit_node": "final_response"}
+
+
+class Capped:
+    """Log argument that is only truncated and formatted if the record is emitted."""
+
+    def __init__(self, value: Any, limit: int = LOG_PAYLOAD_CHARS):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self) -> str:
+        text = str(self.value)
+        return text if len(text) <= self.limit else f"{text[:self.limit]}... ({len(text)} chars)"
+
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def backend_client() -> httpx.AsyncClient:
+    # One keep-alive pool for every chat turn; created on first use, inside Gradio's event loop.
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(float(os.getenv("BACKEND_TIMEOUT", "600")), connect=10.0),
+            limits=httpx.Limits(max_connections=int(os.getenv("BACKEND_MAX_CONNECTIONS", "64")),
+                                max_keepalive_connections=int(os.getenv("BACKEND_MAX_KEEPALIVE", "16"))),
+        )
+    return _client
+
+
+def reply_text(content: str) -> str:
+    # Coordinator replies are JSON; the user only needs their description.
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        return content
+    return str(data.get("description") or content) if isinstance(data, dict) else content
+
+
+def diff_base(documents: Dict[str, str], field: str) -> str:
+    # The text the backend diffed a revision of ``field`` against (see _diffed in backend/main.py).
+    if field == "final_response":
+        return documents.get("draft_text", "")
+    return documents.get("final_response") or documents.get("draft_text", "")
+
+
+def busy_message(retry_after: Any) -> Dict[str, str]:
+    return {"role": "assistant", "content": f"⚠️ The server is busy, please try again in {retry_after} seconds."}
+
+
+async def submit_message(user_text: str, chat_history: List[Dict[str, str]], client_state: Dict[str, Any]):
+    logger.debug("Submitting message: %s", Capped(user_text, 50))
+    # The backend keeps the conversation; the client remembers its session id and the latest
+    # draft_text and final_response, which patched revisions are applied to.
+    client_state = dict(client_state or {})
+    client_state.setdefault("session_id", str(uuid.uuid4()))
+    documents = client_state["documents"] = dict(client_state.get("documents") or {})
+    payload = {"session_id": client_state["session_id"], "user_input": user_text}
+    logger.debug("Sending request to %s with payload: %s", API_URL, Capped(payload))
+
+    # Show the user's turn right away and fill the assistant reply in as tokens arrive.
+    chat_history = list(chat_history or []) + [
+        {"role": "user", "content": user_text},
+        {"role": "assistant", "content": ""},
+    ]
+    yield "", chat_history, client_state
 
     try:
-        with requests.post(API_URL, json=payload, stream=True) as r:
-            logger.debug(f"Got response with status {r.status_code}")
-            response_text = ""
+        async with backend_client().stream("POST", API_URL, json=payload, headers={"Accept": SSE_MEDIA_TYPE}) as r:
+            logger.debug("Got response with status %d", r.status_code)
+            if r.status_code == 429:
+                await r.aread()  # finish the body so the connection goes back to the pool
+                chat_history[-1] = busy_message(r.headers.get("Retry-After", "a few"))
+                yield "", chat_history, client_state
+                return
+            decoder = EventDecoder()
+            streaming_node = None
+            streamed_text = ""
             line_count = 0
-            for line in r.iter_lines(decode_unicode=True):
+            last_update = 0.0
+            finished = False
+            async for line in r.aiter_lines():
                 line_count += 1
-                if not line:
-                    logger.debug(f"Empty line {line_count}")
-                    continue
-                logger.debug(f"Processing line {line_count}: {line[:100]}{'...' if len(line) > 100 else ''}")
+                logger.debug("Processing line %d: %s", line_count, Capped(line))
                 try:
-                    event = eval(line)  # Note: eval is risky; consider json.loads if possible
-                    logger.debug(f"Parsed event: {event.get('event', 'unknown')}")
-                except Exception as e:
-                    logger.error(f"Failed to parse line: {e}")
+                    event = decoder.feed(line)
+                except (ProtocolError, ValueError) as e:
+                    logger.error("Failed to parse line: %s", e)
+                    continue
+                if event is None:
                     continue
-                if event.get("event") == "step":
-                    logger.debug("Received step event")
-                    # Optionally handle incremental updates
-                    pass
-                elif event.get("event") == "final":
+                kind = event.get("event")
+                logger.debug("Parsed event: %s", kind)
+                if kind == "token":
+                    # The Editor rewrites the Drafter's text, so each node starts a fresh reply.
+                    if event.get("node") != streaming_node:
+                        streaming_node = event.get("node")
+                        streamed_text = ""
+                    streamed_text += event.get("content", "")
+                    chat_history[-1] = {"role": "assistant", "content": streamed_text}
+                    now = time.monotonic()
+                    if now - last_update >= UI_UPDATE_SECONDS:
+                        last_update = now
+                        yield "", chat_history, client_state
+                elif kind == "queued":
+                    chat_history[-1] = {"role": "assistant", "content": f"⏳ Queued (position {event.get('position')})"}
+                    yield "", chat_history, client_state
+                elif kind == "rejected":
+                    logger.warning("Request left the queue: %s", event.get("reason"))
+                    chat_history[-1] = busy_message(round(event.get("retry_after", 5)))
+                    yield "", chat_history, client_state
+                    finished = True
+                elif kind == "step":
+                    logger.debug("Received step event from %s", event.get("node", "unknown"))
+                    # A patched revision arrives as edits to the document it revises, as it stood
+                    # before this step and possibly from an earlier turn: patch tokens are never streamed.
+                    diff = event.get("diff")
+                    revised = apply_diff(diff_base(documents, diff["field"]), diff["edits"]) if diff else None
+                    if diff and revised is None:
+                        logger.warning("Could not apply the %s patch from %s", diff["field"], event.get("node"))
+                    changes = event.get("changes") or {}
+                    documents.update({k: v for k, v in changes.items() if k in DOCUMENT_FIELDS.values()})
+                    if revised is not None:
+                        documents[diff["field"]] = revised
+                    if revised is None and event.get("node") == streaming_node:
+                        # The node's finished text supersedes its tokens, e.g. those of an attempt cut short and retried.
+                        revised = changes.get(DOCUMENT_FIELDS.get(streaming_node)) or None
+                    if revised is not None and revised != streamed_text:
+                        streamed_text = revised
+                        chat_history[-1] = {"role": "assistant", "content": streamed_text}
+                        yield "", chat_history, client_state
+                elif kind == "budget":
+                    if event.get("exhausted"):
+                        logger.warning("Request stopped by its %s budget", event["exhausted"])
+                elif kind == "final":
                     logger.debug("Received final event!")
-                    final_state = event
-                    final_state.pop("event", None)
-                    client_state = final_state
+                    documents.update({k: event[k] for k in DOCUMENT_FIELDS.values() if k in event})
                     response_text = ""
-                    messages = final_state.get("messages", [])
-                    logger.debug(f"Processing {len(messages)} messages from final state")
+                    messages = event.get("messages", [])
+                    logger.debug("Processing %d messages from final state", len(messages))
                     if messages:
                         last = messages[-1]
                         if last.get("type") == "ai":
-                            response_text = last.get("data", {}).get("content", "")
-                            logger.debug(f"Extracted AI response: '{response_text[:100]}{'...' if len(response_text) > 100 else ''}'")
-                    chat_history = chat_history + [(user_text, response_text)]
+                            response_text = reply_text(last.get("data", {}).get("content", ""))
+                            logger.debug("Extracted AI response: %s", Capped(response_text, 100))
+                    chat_history[-1] = {"role": "assistant", "content": response_text or streamed_text}
                     logger.debug("Message processing completed successfully!")
-                    return "", chat_history, client_state
+                    yield "", chat_history, client_state
+                    # Keep reading to the end of the stream so the connection can be reused.
+                    finished = True
+            if finished:
+                return
             logger.warning("Stream ended without final event")
-    except requests.RequestException as e:
-        logger.error(f"Request failed: {e}")
-    
+    except httpx.HTTPError as e:
+        logger.error("Request failed: %s", e)
+
     logger.debug("Returning with no changes")
-    return "", chat_history, client_state
+    yield "", chat_history[:-2], client_state
 
 logger.info("Creating UI components...")
 with gr.Blocks(title="Agent Chat") as demo:
@@ -161,6 +279,12 @@ with gr.Blocks(title="Agent Chat") as demo:
     submit_btn.click(submit_message, inputs=[txt, chatbot, state], outputs=[txt, chatbot, state])
     logger.info("UI components created successfully!")
 
+# Turns stream from an async handler, so concurrent chats wait on the backend, not on worker threads.
+demo.queue(
+    default_concurrency_limit=int(os.getenv("GRADIO_CONCURRENCY", "32")),
+    max_size=int(os.getenv("GRADIO_MAX_QUEUE", "128")) or None,
+)
+
 if __name__ == "__main__":
     logger.info("Starting Gradio app...")
-    demo.launch(server_name="0.0.0.0", server_port=7860)
\ No newline at end of file
+    demo.launch(server_name="0.0.0.0", server_port=7860, max_threads=int(os.getenv("GRADIO_MAX_THREADS", "40")))